@@ -4,14 +4,16 @@ import json
 from typing import Any
 from rest_framework import serializers
 
+from common.serializers import SparseFieldsMixin
 from .models import (
     Brand, Category, Product, Variant,
     ProductImage, VariantAttribute, AttributeType, ProductCategory
 )
-from apps.inventory.models import Stock
+from apps.inventory import ledger
+from apps.inventory.models import Stock, StockMovement
 
 
-class BrandSerializer(serializers.ModelSerializer):
+class BrandSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     logo = serializers.SerializerMethodField()
 
     class Meta:
@@ -42,7 +44,7 @@ class CategorySerializer(serializers.ModelSerializer):
 
 # ── Inventory ──────────────────────────────────────────────────────────────
 
-class StockSerializer(serializers.ModelSerializer):
+class StockSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     available = serializers.IntegerField(read_only=True)
     is_out_of_stock = serializers.BooleanField(read_only=True)
     is_low_stock = serializers.BooleanField(read_only=True)
@@ -54,7 +56,7 @@ class StockSerializer(serializers.ModelSerializer):
 
 # ── Variants ───────────────────────────────────────────────────────────────
 
-class VariantAttributeSerializer(serializers.ModelSerializer):
+class VariantAttributeSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     attribute_name = serializers.CharField(source="attribute_type.name", read_only=True)
 
     class Meta:
@@ -78,6 +80,7 @@ class VariantWriteSerializer(serializers.ModelSerializer):
         quantity = validated_data.pop("quantity", 0)
         variant = super().create(validated_data)
         Stock.objects.create(variant=variant, quantity=quantity)
+        ledger.record(variant.id, StockMovement.Kind.ADJUST, quantity_delta=quantity)
         return variant
 
     def update(self, instance: Variant, validated_data: dict[str, Any]) -> Variant:
@@ -85,12 +88,14 @@ class VariantWriteSerializer(serializers.ModelSerializer):
         variant = super().update(instance, validated_data)
         if quantity is not None:
             stock, _ = Stock.objects.get_or_create(variant=variant)
+            previous = stock.quantity
             stock.quantity = quantity
             stock.save(update_fields=["quantity"])
+            ledger.record(variant.id, StockMovement.Kind.ADJUST, quantity_delta=quantity - previous)
         return variant
 
 
-class VariantReadSerializer(serializers.ModelSerializer):
+class VariantReadSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     stock = StockSerializer(read_only=True)
     attribute_values = VariantAttributeSerializer(many=True, read_only=True)
     effective_price = serializers.DecimalField(max_digits=12, decimal_places=2, read_only=True)
@@ -114,13 +119,13 @@ class VariantReadSerializer(serializers.ModelSerializer):
 
 # ── Products ───────────────────────────────────────────────────────────────
 
-class ProductImageSerializer(serializers.ModelSerializer):
+class ProductImageSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     class Meta:
         model = ProductImage
         fields = ["id", "image", "alt_text", "order"]
 
 
-class ProductListSerializer(serializers.ModelSerializer):
+class ProductListSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     brand_name = serializers.CharField(source="brand.name", read_only=True)
     base_price = serializers.DecimalField(max_digits=12, decimal_places=2, read_only=True)
     variant_count = serializers.IntegerField(source="variants.count", read_only=True)
@@ -162,7 +167,7 @@ class ProductListSerializer(serializers.ModelSerializer):
         "is_active", "is_featured", "has_discount", "variant_colors", "variant_images",
     ]
 
-class ProductDetailSerializer(serializers.ModelSerializer):
+class ProductDetailSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     """Serializer completo para el detalle del producto."""
     brand = BrandSerializer(read_only=True)
     variants = VariantReadSerializer(many=True, read_only=True)
@@ -243,10 +248,12 @@ class ProductWriteSerializer(serializers.ModelSerializer):
                 product=product, category_id=cat_id, order=idx
             )
 
-        for variant_data in variants_data:
-            quantity = variant_data.pop("quantity", 0)
-            variant = Variant.objects.create(product=product, **variant_data)
-            Stock.objects.create(variant=variant, quantity=quantity)
+        with ledger.movement_batch():
+            for variant_data in variants_data:
+                quantity = variant_data.pop("quantity", 0)
+                variant = Variant.objects.create(product=product, **variant_data)
+                Stock.objects.create(variant=variant, quantity=quantity)
+                ledger.record(variant.id, StockMovement.Kind.ADJUST, quantity_delta=quantity)
 
         return product
 
@@ -1,3 +1,44 @@
-from django.test import TestCase
+from decimal import Decimal
 
-# Create your tests here.
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APITestCase
+
+from apps.catalog.models import Brand, Product, Variant
+from apps.inventory.models import Stock
+
+
+# ══════════════════════════════════════════════════════════════════════════════
+# Respuestas parciales (?fields= / ?expand=)
+# ══════════════════════════════════════════════════════════════════════════════
+
+class SparseFieldsTest(APITestCase):
+
+    def setUp(self):
+        brand = Brand.objects.create(name="Marca", slug="marca")
+        self.product = Product.objects.create(name="Labial", slug="labial", brand=brand, description="desc")
+        self.variant = Variant.objects.create(
+            product=self.product, sku="RED", name="Rojo", price=Decimal("10000"),
+        )
+        Stock.objects.create(variant=self.variant, quantity=5)
+
+    def test_full_detail_without_params(self):
+        res = self.client.get("/api/catalog/products/labial/")
+        self.assertIn("gallery", res.data)
+        self.assertEqual(res.data["variants"][0]["stock"]["quantity"], 5)
+
+    def test_fields_prunes_nested_serializers(self):
+        res = self.client.get("/api/catalog/products/labial/?fields=name,variants.sku")
+        self.assertEqual(res.data, {"name": "Labial", "variants": [{"sku": "RED"}]})
+
+    def test_narrow_request_skips_prefetches(self):
+        with CaptureQueriesContext(connection) as full:
+            self.client.get("/api/catalog/products/labial/")
+        with CaptureQueriesContext(connection) as narrow:
+            self.client.get("/api/catalog/products/labial/?fields=name")
+        self.assertEqual(len(narrow), 1)
+        self.assertLess(len(narrow), len(full))
+
+    def test_variant_fields(self):
+        res = self.client.get(f"/api/catalog/variants/{self.variant.pk}/?fields=sku,stock.available")
+        self.assertEqual(res.data, {"sku": "RED", "stock": {"available": 5}})
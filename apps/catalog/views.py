@@ -15,6 +15,7 @@ from .serializers import (
 )
 from .filters import ProductFilter
 from apps.inventory.models import Stock
+from common.views import SparseQuerysetMixin
 
 
 class BrandViewSet(viewsets.ModelViewSet):
@@ -40,7 +41,7 @@ class CategoryViewSet(viewsets.ModelViewSet):
         return [AllowAny()]
 
 
-class ProductViewSet(viewsets.ModelViewSet):
+class ProductViewSet(SparseQuerysetMixin, viewsets.ModelViewSet):
     """
     CRUD de Productos con soporte de variantes embebidas en creación.
 
@@ -52,19 +53,24 @@ class ProductViewSet(viewsets.ModelViewSet):
 
     POST /api/products/{slug}/add_variant/   → Agregar variante suelta
     GET  /api/products/{slug}/check_stock/   → Verificar stock de variantes
+
+    Lecturas aceptan ?fields= y ?expand= (common/serializers.py); las
+    relaciones solo se cargan si la respuesta las incluye.
     """
 
-    queryset = (
-        Product.objects.filter(is_active=True)
-        .select_related("brand")
-        .prefetch_related(
-            "variants__stock",
-            "variants__attribute_values__attribute_type",
-            "gallery",
-            "categories",
-        )
-        .distinct()  # ← agregar esta línea
-)
+    queryset = Product.objects.filter(is_active=True).distinct()
+    field_select_related = {
+        "brand": ["brand"],
+        "brand_name": ["brand"],
+    }
+    field_prefetch = {
+        "variants": ["variants"],
+        "variant_count": ["variants"],
+        "variants.stock": ["variants__stock"],
+        "variants.attribute_values": ["variants__attribute_values__attribute_type"],
+        "gallery": ["gallery"],
+        "categories": ["categories"],
+    }
     lookup_field = "slug"
     filter_backends = [DjangoFilterBackend, SearchFilter, OrderingFilter]
     filterset_class = ProductFilter
@@ -134,6 +140,7 @@ class ProductViewSet(viewsets.ModelViewSet):
 
 
 class VariantViewSet(
+    SparseQuerysetMixin,
     mixins.RetrieveModelMixin,
     mixins.UpdateModelMixin,
     mixins.DestroyModelMixin,
@@ -143,7 +150,9 @@ class VariantViewSet(
     Endpoint para gestionar variantes individuales.
     La creación se hace desde /products/{slug}/add-variant/
     """
-    queryset = Variant.objects.select_related("stock", "product")
+    queryset = Variant.objects.select_related("product")
+    field_select_related = {"stock": ["stock"]}
+    field_prefetch = {"attribute_values": ["attribute_values__attribute_type"]}
 
     def get_serializer_class(self):
         if self.action in ["update", "partial_update"]:
@@ -0,0 +1,141 @@
+"""
+Ajuste masivo de stock (conteos físicos).
+
+Cada fila trae un SKU y la cantidad contada (`quantity`) o una corrección
+relativa (`delta`). Todo se resuelve con un puñado de consultas: un SELECT
+de variantes por SKU, un SELECT ... FOR UPDATE de las filas a ajustar,
+bulk_create de las que falten, bulk_update de las que cambian y un solo
+INSERT de movimientos en el ledger.
+"""
+from __future__ import annotations
+
+import csv
+import io
+
+from django.core.exceptions import ValidationError
+from django.db import transaction
+from django.utils import timezone
+
+from apps.catalog.models import Variant
+
+from .allocation import sync_stock_totals
+from .ledger import movement_batch, record
+from .models import Stock, StockLocation, StockMovement
+
+BATCH_SIZE = 1000
+HOT_VARIANT_ERROR = "Variante en modo hot: desactívalo antes de ajustar."
+
+
+def parse_csv(content: str | bytes) -> list[dict]:
+    """Convierte un CSV con encabezado sku,quantity,delta en filas para el serializer."""
+    if isinstance(content, bytes):
+        content = content.decode("utf-8-sig")
+    reader = csv.DictReader(io.StringIO(content))
+    rows = []
+    for row in reader:
+        item = {
+            key.strip().lower(): value.strip()
+            for key, value in row.items()
+            if key and value is not None and value.strip() != ""
+        }
+        if item:
+            rows.append(item)
+    return rows
+
+
+def _target_rows(variant_ids: list, warehouse) -> tuple[dict, int]:
+    """Filas a ajustar por variante (Stock o StockLocation), creando las que falten."""
+    if warehouse is None:
+        model, filters = Stock, {}
+    else:
+        model, filters = StockLocation, {"warehouse": warehouse}
+
+    rows = {
+        row.variant_id: row
+        for row in model.objects.select_for_update()
+        .filter(variant_id__in=variant_ids, **filters)
+        .order_by("pk")
+    }
+    missing = [
+        model(variant_id=variant_id, quantity=0, **filters)
+        for variant_id in variant_ids if variant_id not in rows
+    ]
+    for row in model.objects.bulk_create(missing, batch_size=BATCH_SIZE):
+        rows[row.variant_id] = row
+    return rows, len(missing)
+
+
+@transaction.atomic
+def bulk_adjust(items: list[dict], warehouse=None, reference: str = "") -> dict:
+    """
+    Aplica los ajustes en una sola transacción y retorna el reporte de cambios.
+
+    Sin `warehouse` se ajusta Stock directamente (solo variantes sin
+    ubicaciones); con `warehouse` se ajusta su StockLocation y Stock se
+    recalcula como agregado. Si alguna fila es inválida no se aplica nada
+    y se lanza ValidationError con los errores por SKU.
+    """
+    now = timezone.now()
+    skus = [item["sku"] for item in items]
+    variants = dict(Variant.objects.filter(sku__in=skus).values_list("sku", "pk"))
+    not_found = [sku for sku in skus if sku not in variants]
+    items = [item for item in items if item["sku"] in variants]
+    variant_ids = [variants[item["sku"]] for item in items]
+
+    errors = {}
+    hot = set(
+        Stock.objects.filter(variant_id__in=variant_ids, is_hot=True).values_list("variant_id", flat=True)
+    )
+    located = set()
+    if warehouse is None:
+        located = set(
+            StockLocation.objects.filter(variant_id__in=variant_ids).values_list("variant_id", flat=True)
+        )
+    for item in items:
+        variant_id = variants[item["sku"]]
+        if variant_id in hot:
+            errors[item["sku"]] = HOT_VARIANT_ERROR
+        elif variant_id in located:
+            errors[item["sku"]] = "La variante tiene stock por bodega: indica 'warehouse'."
+    if errors:
+        raise ValidationError(errors)
+
+    rows, created = _target_rows(variant_ids, warehouse)
+
+    changes, changed = [], []
+    for item in items:
+        row = rows[variants[item["sku"]]]
+        before = row.quantity
+        after = item["quantity"] if item.get("quantity") is not None else before + item["delta"]
+        if after < 0:
+            errors[item["sku"]] = f"El ajuste deja el stock en {after}."
+            continue
+        if after == before:
+            continue
+        row.quantity = after
+        row.updated_at = now
+        changed.append(row)
+        changes.append({"sku": item["sku"], "before": before, "after": after})
+    if errors:
+        raise ValidationError(errors)
+
+    model = Stock if warehouse is None else StockLocation
+    model.objects.bulk_update(changed, ["quantity", "updated_at"], batch_size=BATCH_SIZE)
+
+    with movement_batch():
+        if warehouse is None:
+            for change in changes:
+                record(
+                    variants[change["sku"]], StockMovement.Kind.ADJUST,
+                    change["after"] - change["before"], reference=reference,
+                )
+        else:
+            sync_stock_totals([row.variant_id for row in changed], reference=reference)
+
+    return {
+        "updated": len(changes),
+        "unchanged": len(items) - len(changes),
+        "created": created,
+        "not_found": not_found,
+        "changes": changes,
+    }
@@ -1,17 +1,30 @@
 from django.contrib import admin
-from apps.inventory.models import Stock
+from apps.inventory.models import Stock, StockLocation, Warehouse
 from django.utils.html import format_html
 
 @admin.register(Stock)
 class StockAdmin(admin.ModelAdmin):
     list_display = [
         "variant_sku", "product_name", "quantity",
-        "reserved", "available_display", "stock_status"
+        "reserved", "available_display", "stock_status", "is_hot"
     ]
-    list_filter = ["variant__product__brand"]
+    list_filter = ["variant__product__brand", "is_hot"]
     search_fields = ["variant__sku", "variant__product__name"]
     readonly_fields = ["reserved"]
     ordering = ["quantity"]
+    actions = ["enable_hot_mode", "disable_hot_mode", "repair_reserved"]
+
+    def save_model(self, request, obj, form, change):
+        from apps.inventory import ledger
+        from apps.inventory.models import StockMovement
+        previous = form.initial.get("quantity", 0) if change else 0
+        super().save_model(request, obj, form, change)
+        ledger.record(
+            obj.variant_id,
+            StockMovement.Kind.ADJUST,
+            quantity_delta=obj.quantity - previous,
+            reference=f"admin:{request.user.pk}",
+        )
 
     def variant_sku(self, obj):
         return obj.variant.sku
@@ -40,4 +53,47 @@ class StockAdmin(admin.ModelAdmin):
             '<span style="color:#22c55e">{}</span>',
             '● OK'
         )
-    stock_status.short_description = "Estado"
\ No newline at end of file
+    stock_status.short_description = "Estado"
+
+    @admin.action(description="Activar modo hot (reservas en Redis)")
+    def enable_hot_mode(self, request, queryset):
+        from apps.inventory import hot_stock
+        for stock in queryset.filter(is_hot=False).select_related("variant"):
+            hot_stock.enable(stock)
+
+    @admin.action(description="Desactivar modo hot (conciliar y volver a la BD)")
+    def disable_hot_mode(self, request, queryset):
+        from apps.inventory import hot_stock
+        for stock in queryset.filter(is_hot=True).select_related("variant"):
+            hot_stock.disable(stock)
+
+    @admin.action(description="Recalcular reservado desde las reservas vivas")
+    def repair_reserved(self, request, queryset):
+        from apps.inventory.reservations import recompute_reserved
+        count = recompute_reserved(queryset.values_list("variant_id", flat=True))
+        self.message_user(request, f"{count} variantes corregidas.")
+
+
+@admin.register(Warehouse)
+class WarehouseAdmin(admin.ModelAdmin):
+    list_display = [
+        "name", "code", "city", "department",
+        "local_shipping_cost", "national_shipping_cost", "priority", "is_active"
+    ]
+    list_filter = ["is_active", "department"]
+    search_fields = ["name", "code", "city"]
+
+
+@admin.register(StockLocation)
+class StockLocationAdmin(admin.ModelAdmin):
+    list_display = ["variant", "warehouse", "quantity", "reserved"]
+    list_filter = ["warehouse"]
+    search_fields = ["variant__sku", "variant__product__name"]
+    readonly_fields = ["reserved"]
+    raw_id_fields = ["variant"]
+
+    def save_model(self, request, obj, form, change):
+        from apps.inventory.allocation import sync_stock_totals
+        super().save_model(request, obj, form, change)
+        # Stock guarda el agregado de todas las bodegas
+        sync_stock_totals([obj.variant_id])
\ No newline at end of file
@@ -0,0 +1,234 @@
+"""
+Asignación de pedidos a bodegas.
+
+Para cada pedido se elige el conjunto de bodegas que puede despacharlo
+completo al menor costo (ver Warehouse.shipping_cost_to) y se reservan las
+unidades en cada StockLocation. Las variantes sin ubicaciones (una sola
+bodega implícita) y las variantes hot no se asignan: siguen operando solo
+sobre Stock.
+
+Stock sigue siendo el agregado por variante; estas funciones solo mueven el
+desglose por bodega.
+"""
+from __future__ import annotations
+
+import itertools
+from collections import defaultdict
+from dataclasses import dataclass
+from decimal import Decimal
+
+from django.core.exceptions import ValidationError
+from django.db import transaction
+from django.db.models import F, Sum
+from django.utils import timezone
+
+from .models import Stock, StockAllocation, StockLocation
+
+# Con más bodegas que esto se usa una heurística greedy en vez de
+# enumerar todos los subconjuntos.
+MAX_EXACT_WAREHOUSES = 10
+
+
+@dataclass
+class AllocationPlan:
+    cost: Decimal
+    assignments: list[tuple[StockLocation, int]]
+
+
+def _assign(lines: dict, warehouses: list, by_variant: dict) -> list[tuple[StockLocation, int]] | None:
+    """Reparte cada línea entre las bodegas dadas (en orden). None si no alcanza."""
+    assignments = []
+    for variant_id, qty in lines.items():
+        remaining = qty
+        for warehouse in warehouses:
+            location = by_variant[variant_id].get(warehouse.pk)
+            if location is None or not location.available:
+                continue
+            take = min(remaining, location.available)
+            assignments.append((location, take))
+            remaining -= take
+            if not remaining:
+                break
+        if remaining:
+            return None
+    return assignments
+
+
+def plan_allocation(lines: dict, department: str, locations: list[StockLocation]) -> AllocationPlan | None:
+    """
+    lines: {variant_id: cantidad}. Retorna el plan de menor costo o None si
+    ninguna combinación de bodegas cubre el pedido.
+    """
+    by_variant = defaultdict(dict)
+    warehouses = {}
+    for location in locations:
+        by_variant[location.variant_id][location.warehouse_id] = location
+        warehouses[location.warehouse_id] = location.warehouse
+
+    def sort_key(w):
+        return (w.shipping_cost_to(department), w.priority, w.name)
+
+    candidates = sorted(warehouses.values(), key=sort_key)
+
+    if len(candidates) > MAX_EXACT_WAREHOUSES:
+        assignments = _assign(lines, candidates, by_variant)
+        if assignments is None:
+            return None
+        used = {loc.warehouse_id for loc, _ in assignments}
+        cost = sum((warehouses[w].shipping_cost_to(department) for w in used), Decimal("0"))
+        return AllocationPlan(cost=cost, assignments=assignments)
+
+    best = None
+    for size in range(1, len(candidates) + 1):
+        for subset in itertools.combinations(candidates, size):
+            cost = sum((w.shipping_cost_to(department) for w in subset), Decimal("0"))
+            if best is not None and cost >= best.cost:
+                continue
+            assignments = _assign(lines, list(subset), by_variant)
+            if assignments is not None:
+                best = AllocationPlan(cost=cost, assignments=assignments)
+        if best is not None and best.cost == 0:
+            break
+    return best
+
+
+@transaction.atomic
+def allocate(order, lines: dict, department: str) -> list[StockAllocation]:
+    """Asigna y reserva en bodega las líneas del pedido que tienen ubicaciones."""
+    hot = set(
+        Stock.objects.filter(variant_id__in=lines, is_hot=True).values_list("variant_id", flat=True)
+    )
+    lines = {v: q for v, q in lines.items() if v not in hot}
+    locations = list(
+        StockLocation.objects.select_for_update()
+        .filter(variant_id__in=lines, warehouse__is_active=True)
+        .select_related("warehouse")
+        .order_by("pk")
+    )
+    located = {loc.variant_id for loc in locations}
+    lines = {v: q for v, q in lines.items() if v in located}
+    if not lines:
+        return []
+
+    plan = plan_allocation(lines, department, locations)
+    if plan is None:
+        raise ValidationError("No hay una bodega con stock suficiente para despachar el pedido.")
+
+    now = timezone.now()
+    touched = {}
+    allocations = []
+    for location, qty in plan.assignments:
+        location.reserved += qty
+        location.updated_at = now
+        touched[location.pk] = location
+        allocations.append(StockAllocation(
+            order=order, location=location, variant_id=location.variant_id, quantity=qty,
+        ))
+    StockLocation.objects.bulk_update(touched.values(), ["reserved", "updated_at"])
+    return StockAllocation.objects.bulk_create(allocations)
+
+
+def _settle(order_ids, new_status: str) -> int:
+    allocations = list(
+        StockAllocation.objects.select_for_update()
+        .filter(order_id__in=order_ids, status=StockAllocation.Status.RESERVED)
+    )
+    if not allocations:
+        return 0
+
+    by_location = defaultdict(int)
+    for allocation in allocations:
+        by_location[allocation.location_id] += allocation.quantity
+
+    now = timezone.now()
+    locations = list(
+        StockLocation.objects.select_for_update().filter(pk__in=by_location).order_by("pk")
+    )
+    for location in locations:
+        qty = by_location[location.pk]
+        location.reserved = max(0, location.reserved - qty)
+        if new_status == StockAllocation.Status.CONFIRMED:
+            location.quantity = max(0, location.quantity - qty)
+        location.updated_at = now
+    StockLocation.objects.bulk_update(locations, ["quantity", "reserved", "updated_at"])
+    StockAllocation.objects.filter(pk__in=[a.pk for a in allocations]).update(status=new_status)
+    return len(allocations)
+
+
+@transaction.atomic
+def release_allocations(order_ids) -> int:
+    """Libera en bodega las reservas de pedidos cancelados o expirados."""
+    return _settle(order_ids, StockAllocation.Status.RELEASED)
+
+
+@transaction.atomic
+def confirm_allocations(order_ids) -> int:
+    """Descuenta de cada bodega las unidades de pedidos pagados."""
+    return _settle(order_ids, StockAllocation.Status.CONFIRMED)
+
+
+@transaction.atomic
+def restore_allocations(order_id, lines: dict) -> None:
+    """Devuelve unidades reembolsadas a la bodega desde la que salieron."""
+    allocations = (
+        StockAllocation.objects
+        .filter(order_id=order_id, variant_id__in=lines, status=StockAllocation.Status.CONFIRMED)
+        .order_by("created_at")
+    )
+    restored = defaultdict(int)
+    by_location = defaultdict(int)
+    for allocation in allocations:
+        remaining = lines[allocation.variant_id] - restored[allocation.variant_id]
+        if remaining <= 0:
+            continue
+        qty = min(remaining, allocation.quantity)
+        restored[allocation.variant_id] += qty
+        by_location[allocation.location_id] += qty
+    if not by_location:
+        return
+
+    now = timezone.now()
+    locations = list(
+        StockLocation.objects.select_for_update().filter(pk__in=by_location).order_by("pk")
+    )
+    for location in locations:
+        location.quantity += by_location[location.pk]
+        location.updated_at = now
+    StockLocation.objects.bulk_update(locations, ["quantity", "updated_at"])
+
+
+@transaction.atomic
+def sync_stock_totals(variant_ids, reference: str = "") -> int:
+    """
+    Recalcula Stock.quantity como la suma de las ubicaciones de cada variante.
+    Bloquea las filas de Stock (en orden de pk) antes de leerlas: el delta se
+    calcula sobre la fila bloqueada y se escribe relativo, así que una
+    reserva o venta concurrente no se pisa.
+    """
+    from .ledger import movement_batch, record
+    from .models import StockMovement
+
+    stocks = {
+        stock.variant_id: stock
+        for stock in Stock.objects.select_for_update()
+        .filter(variant_id__in=variant_ids)
+        .order_by("pk")
+    }
+    totals = (
+        StockLocation.objects
+        .filter(variant_id__in=variant_ids)
+        .values("variant_id")
+        .annotate(total=Sum("quantity"))
+    )
+    now = timezone.now()
+    changed = 0
+    with movement_batch():
+        for row in totals:
+            stock = stocks.get(row["variant_id"])
+            if stock is None or stock.quantity == row["total"]:
+                continue
+            delta = row["total"] - stock.quantity
+            Stock.objects.filter(pk=stock.pk).update(quantity=F("quantity") + delta, updated_at=now)
+            record(stock.variant_id, StockMovement.Kind.ADJUST, delta, reference=reference)
+            changed += 1
+    return changed
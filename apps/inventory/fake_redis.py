@@ -0,0 +1,113 @@
+from __future__ import annotations
+
+import threading
+from typing import Callable
+
+
+class FakeRedis:
+    """
+    Redis en memoria para tests y desarrollo sin servidor.
+
+    Implementa solo el subconjunto de comandos que usa inventario.
+    Los scripts Lua no se interpretan: cada módulo registra con `emulate()`
+    una función Python equivalente, que se ejecuta bajo un lock para
+    conservar la atomicidad del script original.
+    """
+
+    _emulations: dict[str, Callable] = {}
+
+    @classmethod
+    def emulate(cls, script: str):
+        """Registra la implementación Python de un script Lua."""
+        def decorator(fn: Callable) -> Callable:
+            cls._emulations[script] = fn
+            return fn
+        return decorator
+
+    def __init__(self):
+        self._data: dict[str, str] = {}
+        self._lock = threading.RLock()
+        self.published: list[tuple[str, str]] = []
+
+    # ─── Strings ───────────────────────────────────────────────────────────
+
+    def get(self, key: str) -> str | None:
+        return self._data.get(key)
+
+    def set(self, key: str, value, nx: bool = False) -> bool | None:
+        with self._lock:
+            if nx and key in self._data:
+                return None
+            self._data[key] = str(value)
+            return True
+
+    def getset(self, key: str, value) -> str | None:
+        with self._lock:
+            old = self._data.get(key)
+            self._data[key] = str(value)
+            return old
+
+    def incrby(self, key: str, amount: int = 1) -> int:
+        with self._lock:
+            value = int(self._data.get(key, 0)) + int(amount)
+            self._data[key] = str(value)
+            return value
+
+    def decrby(self, key: str, amount: int = 1) -> int:
+        return self.incrby(key, -int(amount))
+
+    def exists(self, *keys: str) -> int:
+        return sum(1 for k in keys if k in self._data)
+
+    def delete(self, *keys: str) -> int:
+        with self._lock:
+            return sum(1 for k in keys if self._data.pop(k, None) is not None)
+
+    # ─── Hashes ────────────────────────────────────────────────────────────
+
+    def hset(self, key: str, field: str, value) -> int:
+        with self._lock:
+            fields = self._data.setdefault(key, {})
+            created = field not in fields
+            fields[field] = str(value)
+            return int(created)
+
+    def hdel(self, key: str, *fields: str) -> int:
+        with self._lock:
+            stored = self._data.get(key, {})
+            removed = sum(1 for f in fields if stored.pop(f, None) is not None)
+            if key in self._data and not stored:
+                del self._data[key]
+            return removed
+
+    def hgetall(self, key: str) -> dict[str, str]:
+        return dict(self._data.get(key, {}))
+
+    # ─── Pub/Sub ───────────────────────────────────────────────────────────
+
+    def publish(self, channel: str, message) -> int:
+        """Guarda el mensaje en `published`; no hay suscriptores en memoria."""
+        with self._lock:
+            self.published.append((channel, str(message)))
+        return 0
+
+    # ─── Scripts ───────────────────────────────────────────────────────────
+
+    def register_script(self, script: str) -> "_FakeScript":
+        try:
+            fn = self._emulations[script]
+        except KeyError:
+            raise NotImplementedError("Script Lua sin emulación registrada en FakeRedis.")
+        return _FakeScript(self, fn)
+
+
+class _FakeScript:
+
+    def __init__(self, client: FakeRedis, fn: Callable):
+        self.client = client
+        self.fn = fn
+
+    def __call__(self, keys=None, args=None, client=None):
+        target = client or self.client
+        with target._lock:
+            return self.fn(target, list(keys or []), list(args or []))
@@ -0,0 +1,146 @@
+"""
+Pronóstico de demanda por variante con NumPy.
+
+Las ventas diarias de todas las variantes se cargan en una matriz
+(variantes × días) y cada métrica se calcula de una vez sobre la matriz:
+
+  moving_average_7/28  → promedio de los últimos 7/28 días
+  daily_demand         → suavizado exponencial simple (SES), como producto
+                         de la matriz por el vector de pesos α(1-α)^k
+  days_of_cover        → disponible / daily_demand
+  reorder_quantity     → demanda en (lead time + periodo de revisión)
+                         + stock de seguridad (z·σ·√lead time) - disponible
+"""
+from __future__ import annotations
+
+from datetime import timedelta
+
+import numpy as np
+from django.conf import settings
+from django.db.models import Sum
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+from .models import DemandForecast, Stock
+
+HISTORY_DAYS = 90
+SMOOTHING_ALPHA = 0.2
+
+
+def load_sales_matrix(variant_ids: list, days: int = HISTORY_DAYS, today=None) -> np.ndarray:
+    """
+    Unidades vendidas por variante y día: fila i = variant_ids[i], columna
+    j = día (today - days + j). Los días sin ventas quedan en cero.
+    """
+    from apps.orders.models import Order, OrderItem
+
+    today = today or timezone.localdate()
+    start = today - timedelta(days=days)
+    matrix = np.zeros((len(variant_ids), days), dtype=np.float64)
+    if not variant_ids:
+        return matrix
+
+    row_of = {variant_id: i for i, variant_id in enumerate(variant_ids)}
+    sales = (
+        OrderItem.objects
+        .filter(
+            order__status__in=Order.SOLD_STATUSES,
+            order__created_at__date__gte=start,
+            order__created_at__date__lt=today,
+        )
+        .annotate(day=TruncDate("order__created_at"))
+        .values("variant_id", "day")
+        .annotate(units=Sum("quantity"))
+        .values_list("variant_id", "day", "units")
+    )
+    rows, cols, units = [], [], []
+    for variant_id, day, qty in sales:
+        row = row_of.get(variant_id)
+        if row is None:
+            continue
+        rows.append(row)
+        cols.append((day - start).days)
+        units.append(qty)
+    np.add.at(matrix, (np.array(rows, dtype=int), np.array(cols, dtype=int)), units)
+    return matrix
+
+
+def exponential_smoothing(matrix: np.ndarray, alpha: float = SMOOTHING_ALPHA) -> np.ndarray:
+    """
+    Nivel SES al final de la serie para cada fila, sin bucle por día:
+    nivel = Σ α(1-α)^k · x[t-k] + (1-α)^n · x[0] (el primer día es el nivel inicial).
+    """
+    days = matrix.shape[1]
+    if days == 0:
+        return np.zeros(matrix.shape[0])
+    weights = alpha * (1 - alpha) ** np.arange(days - 1, -1, -1, dtype=np.float64)
+    return matrix @ weights + (1 - alpha) ** days * matrix[:, 0]
+
+
+def compute(matrix: np.ndarray, available: np.ndarray) -> dict[str, np.ndarray]:
+    """Métricas de pronóstico por fila; `available` es el disponible por variante."""
+    lead_time = settings.INVENTORY_LEAD_TIME_DAYS
+    review = settings.INVENTORY_REVIEW_DAYS
+    z = settings.INVENTORY_SERVICE_LEVEL_Z
+
+    moving_average_7 = matrix[:, -7:].mean(axis=1)
+    moving_average_28 = matrix[:, -28:].mean(axis=1)
+    daily_demand = exponential_smoothing(matrix)
+    demand_std = matrix[:, -28:].std(axis=1)
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        days_of_cover = np.where(daily_demand > 0, available / daily_demand, np.nan)
+
+    safety_stock = z * demand_std * np.sqrt(lead_time)
+    target = daily_demand * (lead_time + review) + safety_stock
+    reorder_quantity = np.maximum(0, np.ceil(target - available)).astype(np.int64)
+
+    return {
+        "moving_average_7": moving_average_7,
+        "moving_average_28": moving_average_28,
+        "daily_demand": daily_demand,
+        "demand_std": demand_std,
+        "days_of_cover": days_of_cover,
+        "reorder_quantity": reorder_quantity,
+    }
+
+
+def refresh_forecasts(today=None) -> int:
+    """Recalcula y guarda (upsert) el pronóstico de todas las variantes con stock."""
+    stocks = list(Stock.objects.values_list("variant_id", "quantity", "reserved"))
+    if not stocks:
+        return 0
+    variant_ids = [variant_id for variant_id, _, _ in stocks]
+    available = np.array(
+        [max(0, quantity - reserved) for _, quantity, reserved in stocks], dtype=np.float64
+    )
+
+    metrics = compute(load_sales_matrix(variant_ids, today=today), available)
+
+    now = timezone.now()
+    forecasts = [
+        DemandForecast(
+            variant_id=variant_id,
+            moving_average_7=float(metrics["moving_average_7"][i]),
+            moving_average_28=float(metrics["moving_average_28"][i]),
+            daily_demand=float(metrics["daily_demand"][i]),
+            demand_std=float(metrics["demand_std"][i]),
+            days_of_cover=(
+                None if np.isnan(metrics["days_of_cover"][i]) else float(metrics["days_of_cover"][i])
+            ),
+            reorder_quantity=int(metrics["reorder_quantity"][i]),
+            computed_at=now,
+        )
+        for i, variant_id in enumerate(variant_ids)
+    ]
+    DemandForecast.objects.bulk_create(
+        forecasts,
+        batch_size=1000,
+        update_conflicts=True,
+        unique_fields=["variant"],
+        update_fields=[
+            "moving_average_7", "moving_average_28", "daily_demand",
+            "demand_std", "days_of_cover", "reorder_quantity", "computed_at",
+        ],
+    )
+    return len(forecasts)
@@ -0,0 +1,452 @@
+"""
+Contadores de stock en Redis para variantes "hot" (lanzamientos, flash sales).
+
+Para las variantes con Stock.is_hot=True el disponible vive en Redis y las
+reservas se hacen atómicamente con scripts Lua, sin bloquear la fila de
+Stock en PostgreSQL. Los cambios se acumulan como deltas y la tarea
+`inventory.reconcile_hot_stock` los aplica periódicamente a la base de datos.
+
+Claves por variante:
+  inventory:hot:{variant_id}:available   → unidades disponibles (autoritativo)
+  inventory:hot:{variant_id}:d_quantity  → delta pendiente de Stock.quantity
+  inventory:hot:{variant_id}:d_reserved  → delta pendiente de Stock.reserved
+
+Las reservas hechas dentro de una transacción quedan además en el hash
+inventory:hot:pending hasta que la transacción confirma (ver
+reservation_guard y release_abandoned).
+"""
+from __future__ import annotations
+
+import logging
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.db import transaction
+from django.db.models import F, Value
+from django.db.models.functions import Greatest
+from django.utils import timezone
+
+from .fake_redis import FakeRedis
+from .realtime import notify_hot
+
+logger = logging.getLogger(__name__)
+
+
+# ─── Scripts Lua ───────────────────────────────────────────────────────────
+
+# KEYS: available, d_reserved, pending | ARGV: qty, token, entrada pendiente
+# Retorna {1, disponible_restante}, {0, disponible_actual} o nil si no hay contador.
+# Con token, la reserva queda en el hash de pendientes en el mismo paso.
+RESERVE_SCRIPT = """
+local available = tonumber(redis.call('GET', KEYS[1]))
+if available == nil then return nil end
+local qty = tonumber(ARGV[1])
+if available < qty then return {0, available} end
+redis.call('DECRBY', KEYS[1], qty)
+redis.call('INCRBY', KEYS[2], qty)
+if ARGV[2] ~= '' then redis.call('HSET', KEYS[3], ARGV[2], ARGV[3]) end
+return {1, available - qty}
+"""
+
+# KEYS: available, d_quantity, d_reserved | ARGV: Δavailable, Δquantity, Δreserved
+# Retorna el nuevo disponible o nil si no hay contador.
+APPLY_SCRIPT = """
+if redis.call('EXISTS', KEYS[1]) == 0 then return nil end
+redis.call('INCRBY', KEYS[2], ARGV[2])
+redis.call('INCRBY', KEYS[3], ARGV[3])
+return redis.call('INCRBY', KEYS[1], ARGV[1])
+"""
+
+# KEYS: d_quantity, d_reserved → retorna {Δquantity, Δreserved} y los deja en 0
+DRAIN_SCRIPT = """
+local dq = tonumber(redis.call('GETSET', KEYS[1], 0)) or 0
+local dr = tonumber(redis.call('GETSET', KEYS[2], 0)) or 0
+return {dq, dr}
+"""
+
+# KEYS: available, d_quantity, d_reserved → borra el contador solo si no
+# quedan deltas pendientes. Retorna 1 si lo borró, 0 si no.
+CLEAR_SETTLED_SCRIPT = """
+if (tonumber(redis.call('GET', KEYS[2])) or 0) ~= 0 then return 0 end
+if (tonumber(redis.call('GET', KEYS[3])) or 0) ~= 0 then return 0 end
+redis.call('DEL', KEYS[1], KEYS[2], KEYS[3])
+return 1
+"""
+
+
+@FakeRedis.emulate(RESERVE_SCRIPT)
+def _reserve_py(client, keys, args):
+    available = client.get(keys[0])
+    if available is None:
+        return None
+    available, qty = int(available), int(args[0])
+    if available < qty:
+        return [0, available]
+    client.decrby(keys[0], qty)
+    client.incrby(keys[1], qty)
+    if args[1]:
+        client.hset(keys[2], args[1], args[2])
+    return [1, available - qty]
+
+
+@FakeRedis.emulate(APPLY_SCRIPT)
+def _apply_py(client, keys, args):
+    if not client.exists(keys[0]):
+        return None
+    client.incrby(keys[1], int(args[1]))
+    client.incrby(keys[2], int(args[2]))
+    return client.incrby(keys[0], int(args[0]))
+
+
+@FakeRedis.emulate(DRAIN_SCRIPT)
+def _drain_py(client, keys, args):
+    return [int(client.getset(keys[0], 0) or 0), int(client.getset(keys[1], 0) or 0)]
+
+
+@FakeRedis.emulate(CLEAR_SETTLED_SCRIPT)
+def _clear_settled_py(client, keys, args):
+    if int(client.get(keys[1]) or 0) or int(client.get(keys[2]) or 0):
+        return 0
+    client.delete(*keys)
+    return 1
+
+
+# ─── Contador ──────────────────────────────────────────────────────────────
+
+class HotStockCounter:
+    """Operaciones de stock sobre los contadores Redis de una variante hot."""
+
+    def __init__(self, client):
+        self.client = client
+        self._reserve = client.register_script(RESERVE_SCRIPT)
+        self._apply = client.register_script(APPLY_SCRIPT)
+        self._drain = client.register_script(DRAIN_SCRIPT)
+        self._clear_settled = client.register_script(CLEAR_SETTLED_SCRIPT)
+
+    @staticmethod
+    def _keys(variant_id) -> tuple[str, str, str]:
+        prefix = f"inventory:hot:{variant_id}"
+        return f"{prefix}:available", f"{prefix}:d_quantity", f"{prefix}:d_reserved"
+
+    def seed(self, stock) -> None:
+        """Inicializa el contador desde la base de datos si no existe."""
+        available_key, _, _ = self._keys(stock.variant_id)
+        self.client.set(available_key, max(0, stock.quantity - stock.reserved), nx=True)
+
+    def available(self, stock) -> int:
+        available_key, _, _ = self._keys(stock.variant_id)
+        value = self.client.get(available_key)
+        if value is None:
+            self.seed(stock)
+            value = self.client.get(available_key)
+        return int(value)
+
+    def _seed_if_hot(self, stock) -> bool:
+        """
+        Recrea el contador desde la fila actual de Stock. False si la variante
+        ya no es hot (disable() corrió mientras tanto): no se resucita el
+        contador y el llamador opera sobre la base de datos. El bloqueo
+        espera a un disable() en curso.
+        """
+        from .models import Stock
+        with transaction.atomic():
+            row = (
+                Stock.objects.select_for_update().filter(pk=stock.pk, is_hot=True)
+                .values_list("quantity", "reserved").first()
+            )
+            if row is None:
+                return False
+            available_key, _, _ = self._keys(stock.variant_id)
+            self.client.set(available_key, max(0, row[0] - row[1]), nx=True)
+        return True
+
+    def reserve(self, stock, qty: int) -> int:
+        available_key, _, reserved_key = self._keys(stock.variant_id)
+        token, entry = "", ""
+        if transaction.get_connection().in_atomic_block:
+            token = uuid.uuid4().hex
+            entry = f"{stock.variant_id}:{qty}:{int(time.time())}"
+        keys = [available_key, reserved_key, PENDING_KEY]
+        args = [qty, token, entry]
+        result = self._reserve(keys=keys, args=args)
+        if result is None:
+            if not self._seed_if_hot(stock):
+                return _reserve_in_db(stock, qty)
+            result = self._reserve(keys=keys, args=args)
+        ok, available = int(result[0]), int(result[1])
+        if not ok:
+            raise ValidationError(
+                f"Stock insuficiente para '{stock.variant.sku}'. "
+                f"Disponible: {available}, solicitado: {qty}."
+            )
+        _track_reservation(self, stock, qty, token)
+        notify_hot(stock.variant_id, available)
+        return available
+
+    def _apply_deltas(self, stock, kind: str, d_available: int, d_quantity: int, d_reserved: int) -> int:
+        keys = list(self._keys(stock.variant_id))
+        args = [d_available, d_quantity, d_reserved]
+        result = self._apply(keys=keys, args=args)
+        if result is None:
+            if not self._seed_if_hot(stock):
+                return _apply_to_db(stock.pk, stock.variant_id, d_quantity, d_reserved, kind)
+            result = self._apply(keys=keys, args=args)
+        if d_available:
+            notify_hot(stock.variant_id, int(result))
+        return int(result)
+
+    def release(self, stock, qty: int) -> int:
+        from .models import StockMovement
+        return self._apply_deltas(stock, StockMovement.Kind.RELEASE, qty, 0, -qty)
+
+    def confirm_sale(self, stock, qty: int) -> int:
+        from .models import StockMovement
+        return self._apply_deltas(stock, StockMovement.Kind.CONFIRM, 0, -qty, -qty)
+
+    def restore(self, stock, qty: int) -> int:
+        from .models import StockMovement
+        return self._apply_deltas(stock, StockMovement.Kind.RESTORE, qty, qty, 0)
+
+    def settle_pending(self, token: str) -> bool:
+        """Quita una reserva del hash de pendientes; False si ya no estaba."""
+        return bool(self.client.hdel(PENDING_KEY, token))
+
+    def pending(self) -> dict[str, str]:
+        return self.client.hgetall(PENDING_KEY)
+
+    def drain(self, variant_id) -> tuple[int, int]:
+        """Retorna y pone en cero los deltas pendientes (Δquantity, Δreserved)."""
+        _, quantity_key, reserved_key = self._keys(variant_id)
+        d_quantity, d_reserved = self._drain(keys=[quantity_key, reserved_key])
+        return int(d_quantity), int(d_reserved)
+
+    def requeue(self, variant_id, d_quantity: int, d_reserved: int) -> None:
+        """Devuelve deltas drenados que no se pudieron aplicar."""
+        _, quantity_key, reserved_key = self._keys(variant_id)
+        self.client.incrby(quantity_key, d_quantity)
+        self.client.incrby(reserved_key, d_reserved)
+
+    def clear_if_settled(self, variant_id) -> bool:
+        """Borra el contador si no tiene deltas pendientes; False si los tiene."""
+        return bool(self._clear_settled(keys=list(self._keys(variant_id))))
+
+    def clear(self, variant_id) -> None:
+        self.client.delete(*self._keys(variant_id))
+
+
+_client = None
+_counter: HotStockCounter | None = None
+
+
+def get_client():
+    global _client
+    if _client is None:
+        import redis
+        _client = redis.Redis.from_url(settings.INVENTORY_REDIS_URL, decode_responses=True)
+    return _client
+
+
+def set_client(client) -> None:
+    """Reemplaza el cliente Redis (ej: FakeRedis en tests)."""
+    global _client, _counter
+    _client = client
+    _counter = None
+
+
+def get_counter() -> HotStockCounter:
+    global _counter
+    if _counter is None:
+        _counter = HotStockCounter(get_client())
+    return _counter
+
+
+# ─── Compensación de reservas ──────────────────────────────────────────────
+# Las reservas en Redis no participan de la transacción de la base de datos.
+# Si el checkout falla después de reservar, hay que devolverlas a mano:
+#   - reservation_guard() las libera en cuanto el bloque lanza una excepción.
+#   - Una reserva hecha dentro de una transacción queda en PENDING_KEY y
+#     on_commit la quita. Si la transacción se revierte después del bloque
+#     (set_rollback, una falla posterior o el COMMIT mismo), la entrada queda
+#     y release_abandoned() la libera pasado PENDING_TIMEOUT.
+# Quitar la entrada del hash es lo que da derecho a liberar, así que una
+# reserva no se compensa dos veces.
+
+PENDING_KEY = "inventory:hot:pending"
+# Más que cualquier transacción de checkout
+PENDING_TIMEOUT = 15 * 60
+
+_local = threading.local()
+
+
+def _track_reservation(counter: HotStockCounter, stock, qty: int, token: str) -> None:
+    if token:
+        transaction.on_commit(lambda: counter.settle_pending(token))
+    tracked = getattr(_local, "reservations", None)
+    if tracked is not None:
+        tracked.append((stock, qty, token))
+
+
+@contextmanager
+def reservation_guard():
+    """Si el bloque lanza una excepción, libera las reservas hot hechas dentro."""
+    outer = getattr(_local, "reservations", None)
+    if outer is not None:
+        yield
+        return
+    _local.reservations = tracked = []
+    try:
+        yield
+    except BaseException:
+        counter = get_counter()
+        for stock, qty, token in tracked:
+            try:
+                if not token or counter.settle_pending(token):
+                    counter.release(stock, qty)
+            except Exception as e:
+                logger.error("No se pudo compensar reserva hot de %s: %s", stock.variant_id, e)
+        raise
+    finally:
+        _local.reservations = None
+
+
+def release_abandoned(now: float | None = None) -> int:
+    """
+    Libera las reservas pendientes de transacciones que nunca confirmaron.
+    Retorna el número de reservas liberadas.
+    """
+    from .models import Stock
+
+    counter = get_counter()
+    cutoff = (now or time.time()) - PENDING_TIMEOUT
+    stale = {}
+    for token, entry in counter.pending().items():
+        variant_id, qty, reserved_at = entry.rsplit(":", 2)
+        if int(reserved_at) < cutoff:
+            stale[token] = (variant_id, int(qty))
+    if not stale:
+        return 0
+
+    stocks = {
+        str(stock.variant_id): stock
+        for stock in Stock.objects.filter(variant_id__in={v for v, _ in stale.values()})
+    }
+    count = 0
+    for token, (variant_id, qty) in stale.items():
+        stock = stocks.get(variant_id)
+        if stock is None or not counter.settle_pending(token):
+            continue
+        counter.release(stock, qty)
+        count += 1
+    logger.warning("release_abandoned: %d reservas hot de transacciones revertidas.", count)
+    return count
+
+
+# ─── Conciliación ──────────────────────────────────────────────────────────
+
+@transaction.atomic
+def _apply_to_db(stock_id, variant_id, d_quantity: int, d_reserved: int, kind: str = "") -> int:
+    """Aplica los deltas a la fila de Stock; retorna el nuevo disponible."""
+    from .ledger import record
+    from .models import Stock, StockMovement
+    stocks = Stock.objects.filter(pk=stock_id)
+    stocks.update(
+        quantity=Greatest(F("quantity") + d_quantity, Value(0)),
+        reserved=Greatest(F("reserved") + d_reserved, Value(0)),
+        updated_at=timezone.now(),
+    )
+    record(variant_id, kind or StockMovement.Kind.RECONCILE, d_quantity, d_reserved)
+    quantity, reserved = stocks.values_list("quantity", "reserved").get()
+    return max(0, quantity - reserved)
+
+
+def _reserve_in_db(stock, qty: int) -> int:
+    """Reserva sobre la fila de una variante que dejó de ser hot."""
+    from .models import Stock
+    stock = Stock.objects.select_related("variant").get(pk=stock.pk)
+    stock.reserve(qty)
+    return stock.available - qty
+
+
+def reconcile(stocks=None) -> int:
+    """
+    Aplica a Stock los deltas acumulados en Redis.
+    Retorna el número de variantes actualizadas.
+    """
+    from .models import Stock
+
+    counter = get_counter()
+    if stocks is None:
+        stocks = Stock.objects.filter(is_hot=True)
+
+    count = 0
+    for stock_id, variant_id in stocks.values_list("pk", "variant_id"):
+        d_quantity, d_reserved = counter.drain(variant_id)
+        if not (d_quantity or d_reserved):
+            continue
+        try:
+            _apply_to_db(stock_id, variant_id, d_quantity, d_reserved)
+        except Exception as e:
+            counter.requeue(variant_id, d_quantity, d_reserved)
+            logger.error("Error conciliando stock hot de %s: %s", variant_id, e)
+            continue
+        count += 1
+    return count
+
+
+@transaction.atomic
+def enable(stock) -> None:
+    """
+    Activa el modo hot para una variante. El contador se siembra desde la
+    fila bloqueada, en la misma transacción que marca is_hot: ninguna
+    reserva en la base de datos puede caer entre la lectura y el cambio.
+    """
+    from .models import Stock
+
+    locked = Stock.objects.select_for_update().get(pk=stock.pk)
+    if locked.is_hot:
+        stock.is_hot = True
+        return
+    counter = get_counter()
+    counter.clear(locked.variant_id)  # Un contador viejo no sirve de semilla
+    counter.seed(locked)
+    locked.is_hot = stock.is_hot = True
+    locked.save(update_fields=["is_hot", "updated_at"])
+
+
+@transaction.atomic
+def disable(stock) -> None:
+    """
+    Concilia los deltas pendientes y vuelve la variante al modo normal.
+
+    Con la fila de Stock bloqueada drena y aplica los deltas a la base de
+    datos, y borra el contador solo cuando ya no le quedan deltas (script
+    atómico): una reserva que cae entre el drenaje y el borrado se aplica en
+    la vuelta siguiente. Si la base falla, los deltas vuelven al contador,
+    que sigue existiendo. Una reserva posterior ya no encuentra contador, ve
+    la fila con is_hot=False (tras el COMMIT) y reserva en la base de datos.
+    """
+    from .models import Stock
+
+    stock = Stock.objects.select_for_update().get(pk=stock.pk)
+    stock.is_hot = False
+    stock.save(update_fields=["is_hot", "updated_at"])
+
+    counter = get_counter()
+    drained_quantity = drained_reserved = 0
+    try:
+        while True:
+            d_quantity, d_reserved = counter.drain(stock.variant_id)
+            drained_quantity += d_quantity
+            drained_reserved += d_reserved
+            if d_quantity or d_reserved:
+                _apply_to_db(stock.pk, stock.variant_id, d_quantity, d_reserved)
+            if counter.clear_if_settled(stock.variant_id):
+                break
+    except Exception:
+        # La transacción se revierte entera: también lo ya aplicado
+        counter.requeue(stock.variant_id, drained_quantity, drained_reserved)
+        raise
@@ -0,0 +1,147 @@
+"""
+Ledger de movimientos de inventario.
+
+Los movimientos se registran con `record()`. Dentro de un bloque
+`movement_batch()` se acumulan en memoria y se escriben con un solo
+bulk_create al salir, para que un pedido de N líneas no haga N INSERTs.
+
+Cada movimiento también dispara el push de disponibilidad (ver realtime.py).
+"""
+from __future__ import annotations
+
+import threading
+from contextlib import contextmanager
+from datetime import datetime
+
+from django.db import transaction
+from django.db.models import Max, Sum
+from django.utils import timezone
+
+from . import realtime
+from .models import Stock, StockMovement, StockSnapshot
+
+_local = threading.local()
+
+
+@contextmanager
+def movement_batch():
+    """Agrupa los movimientos registrados en el bloque en un solo INSERT."""
+    if getattr(_local, "buffer", None) is not None:
+        yield  # Ya hay un batch abierto: se escribe al cerrar el externo
+        return
+    _local.buffer = buffer = []
+    try:
+        yield
+        if buffer:
+            StockMovement.objects.bulk_create(buffer)
+            realtime.notify(m.variant_id for m in buffer)
+    finally:
+        _local.buffer = None
+
+
+def record(
+    variant_id,
+    kind: str,
+    quantity_delta: int = 0,
+    reserved_delta: int = 0,
+    reference: str = "",
+) -> None:
+    if not (quantity_delta or reserved_delta):
+        return
+    movement = StockMovement(
+        variant_id=variant_id,
+        kind=kind,
+        quantity_delta=quantity_delta,
+        reserved_delta=reserved_delta,
+        reference=reference[:100],
+    )
+    buffer = getattr(_local, "buffer", None)
+    if buffer is None:
+        movement.save()
+        realtime.notify([variant_id])
+    else:
+        buffer.append(movement)
+
+
+# ─── Snapshots ─────────────────────────────────────────────────────────────
+
+SNAPSHOT_CHUNK_SIZE = 500
+
+
+def take_snapshots(day=None) -> int:
+    """
+    Guarda la foto de quantity/reserved de todas las variantes.
+    Idempotente por día: si ya existe la foto de una variante, no se reescribe.
+
+    Las filas de Stock se leen por tramos con SELECT ... FOR UPDATE. Bajo el
+    bloqueo, toda transacción que tocó la fila ya confirmó junto con sus
+    movimientos, y las que vengan después insertan movimientos con id mayor.
+    Por eso last_movement_id es el último movimiento de la variante leído
+    bajo el bloqueo y no Max(id) global: los ids se asignan al INSERT, no al
+    COMMIT, y un movimiento que confirma tarde con un id menor quedaría fuera
+    de la foto y del replay.
+    """
+    day = day or timezone.localdate()
+    stock_ids = list(Stock.objects.order_by("pk").values_list("pk", flat=True))
+
+    count = 0
+    for start in range(0, len(stock_ids), SNAPSHOT_CHUNK_SIZE):
+        with transaction.atomic():
+            rows = list(
+                Stock.objects.select_for_update()
+                .filter(pk__in=stock_ids[start:start + SNAPSHOT_CHUNK_SIZE])
+                .order_by("pk")
+                .values_list("variant_id", "quantity", "reserved")
+            )
+            last_movement_ids = dict(
+                StockMovement.objects.filter(variant_id__in=[variant_id for variant_id, _, _ in rows])
+                .order_by()
+                .values("variant_id")
+                .annotate(last_id=Max("id"))
+                .values_list("variant_id", "last_id")
+            )
+            now = timezone.now()
+            StockSnapshot.objects.bulk_create([
+                StockSnapshot(
+                    variant_id=variant_id,
+                    day=day,
+                    taken_at=now,
+                    quantity=quantity,
+                    reserved=reserved,
+                    last_movement_id=last_movement_ids.get(variant_id, 0),
+                )
+                for variant_id, quantity, reserved in rows
+            ], ignore_conflicts=True)
+        count += len(rows)
+    return count
+
+
+def stock_at(variant_id, at: datetime) -> dict:
+    """
+    Reconstruye quantity/reserved de una variante en el instante `at`:
+    el snapshot más reciente anterior + los movimientos entre ambos.
+    """
+    snapshot = (
+        StockSnapshot.objects
+        .filter(variant_id=variant_id, taken_at__lte=at)
+        .order_by("-taken_at")
+        .first()
+    )
+    quantity = snapshot.quantity if snapshot else 0
+    reserved = snapshot.reserved if snapshot else 0
+    last_movement_id = snapshot.last_movement_id if snapshot else 0
+
+    deltas = StockMovement.objects.filter(
+        variant_id=variant_id,
+        id__gt=last_movement_id,
+        created_at__lte=at,
+    ).aggregate(quantity=Sum("quantity_delta"), reserved=Sum("reserved_delta"))
+
+    quantity += deltas["quantity"] or 0
+    reserved += deltas["reserved"] or 0
+    return {
+        "quantity": quantity,
+        "reserved": reserved,
+        "available": max(0, quantity - reserved),
+        "snapshot_day": snapshot.day if snapshot else None,
+    }
@@ -0,0 +1,30 @@
+# Generated by Django 6.0.2 on 2026-10-19 00:06
+
+import django.db.models.expressions
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("catalog", "0002_alter_product_cover_image"),
+        ("inventory", "0001_initial"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="stock",
+            index=models.Index(
+                condition=models.Q(
+                    (
+                        "quantity__lte",
+                        django.db.models.expressions.CombinedExpression(
+                            models.F("reserved"), "+", models.F("low_stock_threshold")
+                        ),
+                    )
+                ),
+                fields=["quantity"],
+                name="inventory_stock_low_idx",
+            ),
+        ),
+    ]
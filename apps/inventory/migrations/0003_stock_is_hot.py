@@ -0,0 +1,21 @@
+# Generated by Django 6.0.2 on 2026-10-19 00:08
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("inventory", "0002_stock_low_stock_index"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="stock",
+            name="is_hot",
+            field=models.BooleanField(
+                default=False,
+                help_text="Modo flash sale: las reservas se hacen en Redis y se concilian periódicamente.",
+            ),
+        ),
+    ]
@@ -0,0 +1,127 @@
+# Generated by Django 6.0.2 on 2026-10-19 00:10
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+
+def initial_snapshot(apps, schema_editor):
+    """Foto inicial: el historial del ledger parte del stock actual."""
+    Stock = apps.get_model("inventory", "Stock")
+    StockSnapshot = apps.get_model("inventory", "StockSnapshot")
+    now = django.utils.timezone.now()
+    day = django.utils.timezone.localdate(now)
+    StockSnapshot.objects.bulk_create(
+        [
+            StockSnapshot(
+                variant_id=variant_id,
+                day=day,
+                taken_at=now,
+                quantity=quantity,
+                reserved=reserved,
+            )
+            for variant_id, quantity, reserved in Stock.objects.values_list(
+                "variant_id", "quantity", "reserved"
+            )
+        ],
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("catalog", "0002_alter_product_cover_image"),
+        ("inventory", "0003_stock_is_hot"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="StockMovement",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "kind",
+                    models.CharField(
+                        choices=[
+                            ("RESERVE", "Reserva"),
+                            ("RELEASE", "Liberación de reserva"),
+                            ("CONFIRM", "Venta confirmada"),
+                            ("RESTORE", "Devolución"),
+                            ("ADJUST", "Ajuste manual"),
+                            ("RECONCILE", "Conciliación hot"),
+                        ],
+                        max_length=10,
+                    ),
+                ),
+                ("quantity_delta", models.IntegerField(default=0)),
+                ("reserved_delta", models.IntegerField(default=0)),
+                (
+                    "reference",
+                    models.CharField(
+                        blank=True,
+                        help_text="Referencia del origen (ej: wompi_reference del pedido).",
+                        max_length=100,
+                    ),
+                ),
+                ("created_at", models.DateTimeField(default=django.utils.timezone.now)),
+                (
+                    "variant",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="stock_movements",
+                        to="catalog.variant",
+                    ),
+                ),
+            ],
+            options={
+                "db_table": "inventory_stock_movements",
+                "indexes": [
+                    models.Index(
+                        fields=["variant", "created_at"],
+                        name="inventory_mov_variant_idx",
+                    )
+                ],
+            },
+        ),
+        migrations.CreateModel(
+            name="StockSnapshot",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("day", models.DateField()),
+                ("taken_at", models.DateTimeField(default=django.utils.timezone.now)),
+                ("quantity", models.IntegerField()),
+                ("reserved", models.IntegerField()),
+                ("last_movement_id", models.BigIntegerField(default=0)),
+                (
+                    "variant",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="stock_snapshots",
+                        to="catalog.variant",
+                    ),
+                ),
+            ],
+            options={
+                "db_table": "inventory_stock_snapshots",
+                "unique_together": {("variant", "day")},
+            },
+        ),
+        migrations.RunPython(initial_snapshot, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,172 @@
+# Generated by Django 6.0.2 on 2026-10-19 00:12
+
+import django.core.validators
+import django.db.models.deletion
+import django.utils.timezone
+import uuid
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("catalog", "0002_alter_product_cover_image"),
+        ("inventory", "0004_stock_movement_ledger"),
+        ("orders", "0003_order_guest_email_order_guest_name_alter_order_user"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="Warehouse",
+            fields=[
+                (
+                    "id",
+                    models.UUIDField(
+                        default=uuid.uuid4,
+                        editable=False,
+                        primary_key=True,
+                        serialize=False,
+                    ),
+                ),
+                ("created_at", models.DateTimeField(auto_now_add=True)),
+                ("updated_at", models.DateTimeField(auto_now=True)),
+                ("name", models.CharField(max_length=100)),
+                ("code", models.SlugField(max_length=30, unique=True)),
+                ("city", models.CharField(max_length=100)),
+                ("department", models.CharField(db_index=True, max_length=100)),
+                (
+                    "local_shipping_cost",
+                    models.DecimalField(
+                        decimal_places=2,
+                        default=0,
+                        max_digits=10,
+                        validators=[django.core.validators.MinValueValidator(0)],
+                    ),
+                ),
+                (
+                    "national_shipping_cost",
+                    models.DecimalField(
+                        decimal_places=2,
+                        default=0,
+                        max_digits=10,
+                        validators=[django.core.validators.MinValueValidator(0)],
+                    ),
+                ),
+                (
+                    "priority",
+                    models.PositiveSmallIntegerField(
+                        default=0,
+                        help_text="Desempate entre bodegas de igual costo (menor = primero).",
+                    ),
+                ),
+                ("is_active", models.BooleanField(default=True)),
+            ],
+            options={
+                "db_table": "inventory_warehouses",
+                "ordering": ["priority", "name"],
+            },
+        ),
+        migrations.CreateModel(
+            name="StockLocation",
+            fields=[
+                (
+                    "id",
+                    models.UUIDField(
+                        default=uuid.uuid4,
+                        editable=False,
+                        primary_key=True,
+                        serialize=False,
+                    ),
+                ),
+                ("created_at", models.DateTimeField(auto_now_add=True)),
+                ("updated_at", models.DateTimeField(auto_now=True)),
+                ("quantity", models.PositiveIntegerField(default=0)),
+                ("reserved", models.PositiveIntegerField(default=0)),
+                (
+                    "variant",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="stock_locations",
+                        to="catalog.variant",
+                    ),
+                ),
+                (
+                    "warehouse",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.PROTECT,
+                        related_name="locations",
+                        to="inventory.warehouse",
+                    ),
+                ),
+            ],
+            options={
+                "db_table": "inventory_stock_locations",
+                "unique_together": {("warehouse", "variant")},
+            },
+        ),
+        migrations.CreateModel(
+            name="StockAllocation",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "quantity",
+                    models.PositiveIntegerField(
+                        validators=[django.core.validators.MinValueValidator(1)]
+                    ),
+                ),
+                (
+                    "status",
+                    models.CharField(
+                        choices=[
+                            ("RESERVED", "Reservado"),
+                            ("CONFIRMED", "Confirmado"),
+                            ("RELEASED", "Liberado"),
+                        ],
+                        default="RESERVED",
+                        max_length=10,
+                    ),
+                ),
+                ("created_at", models.DateTimeField(default=django.utils.timezone.now)),
+                (
+                    "order",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="stock_allocations",
+                        to="orders.order",
+                    ),
+                ),
+                (
+                    "variant",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="+",
+                        to="catalog.variant",
+                    ),
+                ),
+                (
+                    "location",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.PROTECT,
+                        related_name="allocations",
+                        to="inventory.stocklocation",
+                    ),
+                ),
+            ],
+            options={
+                "db_table": "inventory_stock_allocations",
+                "indexes": [
+                    models.Index(
+                        fields=["order", "status"], name="inventory_alloc_order_idx"
+                    )
+                ],
+            },
+        ),
+    ]
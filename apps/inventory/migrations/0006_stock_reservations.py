@@ -0,0 +1,109 @@
+# Generated by Django 6.0.2 on 2026-10-19 00:20
+
+from datetime import timedelta
+
+import django.core.validators
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+
+def backfill_pending(apps, schema_editor):
+    """Reservas de los pedidos que están esperando pago al migrar."""
+    OrderItem = apps.get_model("orders", "OrderItem")
+    StockReservation = apps.get_model("inventory", "StockReservation")
+    lines = {}
+    for order_id, created_at, variant_id, quantity in OrderItem.objects.filter(
+        order__status="PENDING_PAYMENT"
+    ).values_list("order_id", "order__created_at", "variant_id", "quantity"):
+        key = (order_id, variant_id)
+        expires_at = created_at + timedelta(minutes=2)
+        total = lines.get(key, (0, expires_at))[0] + quantity
+        lines[key] = (total, expires_at)
+    StockReservation.objects.bulk_create(
+        [
+            StockReservation(
+                order_id=order_id,
+                variant_id=variant_id,
+                quantity=quantity,
+                expires_at=expires_at,
+            )
+            for (order_id, variant_id), (quantity, expires_at) in lines.items()
+        ],
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("catalog", "0002_alter_product_cover_image"),
+        ("inventory", "0005_warehouses"),
+        ("orders", "0003_order_guest_email_order_guest_name_alter_order_user"),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name="stockmovement",
+            name="kind",
+            field=models.CharField(
+                choices=[
+                    ("RESERVE", "Reserva"),
+                    ("RELEASE", "Liberación de reserva"),
+                    ("CONFIRM", "Venta confirmada"),
+                    ("RESTORE", "Devolución"),
+                    ("ADJUST", "Ajuste manual"),
+                    ("RECONCILE", "Conciliación hot"),
+                    ("REPAIR", "Corrección de reservado"),
+                ],
+                max_length=10,
+            ),
+        ),
+        migrations.CreateModel(
+            name="StockReservation",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "quantity",
+                    models.PositiveIntegerField(
+                        validators=[django.core.validators.MinValueValidator(1)]
+                    ),
+                ),
+                ("expires_at", models.DateTimeField()),
+                ("created_at", models.DateTimeField(default=django.utils.timezone.now)),
+                (
+                    "order",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="stock_reservations",
+                        to="orders.order",
+                    ),
+                ),
+                (
+                    "variant",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="+",
+                        to="catalog.variant",
+                    ),
+                ),
+            ],
+            options={
+                "db_table": "inventory_stock_reservations",
+                "indexes": [
+                    models.Index(
+                        fields=["expires_at"], name="inventory_resv_expires_idx"
+                    )
+                ],
+            },
+        ),
+        migrations.RunPython(backfill_pending, migrations.RunPython.noop),
+    ]
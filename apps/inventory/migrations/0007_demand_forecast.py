@@ -0,0 +1,53 @@
+# Generated by Django 6.0.2 on 2026-10-19 00:22
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("catalog", "0002_alter_product_cover_image"),
+        ("inventory", "0006_stock_reservations"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="DemandForecast",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("moving_average_7", models.FloatField(default=0)),
+                ("moving_average_28", models.FloatField(default=0)),
+                (
+                    "daily_demand",
+                    models.FloatField(
+                        default=0,
+                        help_text="Suavizado exponencial simple de las ventas diarias.",
+                    ),
+                ),
+                ("demand_std", models.FloatField(default=0)),
+                ("days_of_cover", models.FloatField(blank=True, null=True)),
+                ("reorder_quantity", models.PositiveIntegerField(default=0)),
+                ("computed_at", models.DateTimeField()),
+                (
+                    "variant",
+                    models.OneToOneField(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="demand_forecast",
+                        to="catalog.variant",
+                    ),
+                ),
+            ],
+            options={
+                "db_table": "inventory_demand_forecasts",
+            },
+        ),
+    ]
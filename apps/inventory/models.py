@@ -1,20 +1,73 @@
 from __future__ import annotations
 
+from datetime import timedelta
+
 from django.db import models
 from django.db import transaction
+from django.db.models import F, Q, Sum, OuterRef, Subquery, FloatField, Value
+from django.db.models.functions import Cast, Coalesce, NullIf
 from django.core.exceptions import ValidationError
+from django.utils import timezone
+
+from django.core.validators import MinValueValidator
 
 from common.models import TimeStampedModel
 from apps.catalog.models import Variant
 
 
+# Stock bajo o agotado: available <= low_stock_threshold.
+# Se expresa como quantity <= reserved + low_stock_threshold para que coincida
+# literalmente con el predicado del índice parcial (y no haya restas negativas).
+LOW_STOCK_CONDITION = Q(quantity__lte=F("reserved") + F("low_stock_threshold"))
+
+
+class StockQuerySet(models.QuerySet):
+
+    def low_stock(self) -> "StockQuerySet":
+        """Variantes con stock bajo o agotadas, filtrado en SQL."""
+        return self.filter(LOW_STOCK_CONDITION)
+
+    def with_days_of_cover(self, days: int = 30) -> "StockQuerySet":
+        """
+        Anota `days_of_cover`: días que alcanza el stock disponible al ritmo
+        de venta de los últimos `days` días. Null si la variante no tuvo ventas.
+        """
+        from apps.orders.models import Order, OrderItem
+
+        since = timezone.now() - timedelta(days=days)
+        units_sold = (
+            OrderItem.objects
+            .filter(
+                variant=OuterRef("variant"),
+                order__status__in=Order.SOLD_STATUSES,
+                order__created_at__gte=since,
+            )
+            .values("variant")
+            .annotate(units=Sum("quantity"))
+            .values("units")
+        )
+        return self.annotate(
+            days_of_cover=(
+                Cast(F("quantity") - F("reserved"), FloatField()) * Value(float(days))
+                / NullIf(Coalesce(Subquery(units_sold), 0), 0)
+            )
+        )
+
+
 class Stock(TimeStampedModel):
     """
     Stock disponible por variante.
     Separado del catálogo para poder escalar a múltiples bodegas.
 
+    Con bodegas (StockLocation), quantity es el agregado de todas las
+    ubicaciones: el catálogo sigue leyendo una sola fila por variante.
+
     Lógica de bloqueo:
       available = quantity - reserved
+
+    Variantes hot (is_hot=True): reserve/release/confirm/restore operan sobre
+    contadores en Redis (ver hot_stock.py) y quantity/reserved se actualizan
+    al conciliar, por lo que pueden ir unos segundos atrasados.
     """
     variant = models.OneToOneField(
         Variant, on_delete=models.CASCADE, related_name="stock"
@@ -28,9 +81,24 @@ class Stock(TimeStampedModel):
         default=5,
         help_text="Alerta cuando el stock disponible baje de este número.",
     )
+    is_hot = models.BooleanField(
+        default=False,
+        help_text="Modo flash sale: las reservas se hacen en Redis y se concilian periódicamente.",
+    )
+
+    objects = StockQuerySet.as_manager()
 
     class Meta:
         db_table = "inventory_stock"
+        indexes = [
+            # Índice parcial: solo contiene las filas en stock bajo/agotado,
+            # así el dashboard no recorre todo el catálogo.
+            models.Index(
+                fields=["quantity"],
+                condition=LOW_STOCK_CONDITION,
+                name="inventory_stock_low_idx",
+            ),
+        ]
 
     @property
     def available(self) -> int:
@@ -48,8 +116,12 @@ class Stock(TimeStampedModel):
         return self.available >= requested_qty
 
     @transaction.atomic
-    def reserve(self, qty: int) -> None:
+    def reserve(self, qty: int, reference: str = "") -> None:
         """Bloquea stock durante el proceso de checkout."""
+        if self.is_hot:
+            from .hot_stock import get_counter
+            get_counter().reserve(self, qty)
+            return
         stock = Stock.objects.select_for_update().get(pk=self.pk)
         if not stock.check_availability(qty):
             raise ValidationError(
@@ -58,28 +130,263 @@ class Stock(TimeStampedModel):
             )
         stock.reserved += qty
         stock.save(update_fields=["reserved", "updated_at"])
+        stock._record(StockMovement.Kind.RESERVE, reserved_delta=qty, reference=reference)
 
     @transaction.atomic
-    def release_reservation(self, qty: int) -> None:
+    def release_reservation(self, qty: int, reference: str = "") -> None:
         """Libera reserva (carrito abandonado, pago fallido)."""
+        if self.is_hot:
+            from .hot_stock import get_counter
+            get_counter().release(self, qty)
+            return
         stock = Stock.objects.select_for_update().get(pk=self.pk)
+        previous = stock.reserved
         stock.reserved = max(0, stock.reserved - qty)
         stock.save(update_fields=["reserved", "updated_at"])
+        stock._record(
+            StockMovement.Kind.RELEASE,
+            reserved_delta=stock.reserved - previous,
+            reference=reference,
+        )
 
     @transaction.atomic
-    def confirm_sale(self, qty: int) -> None:
+    def confirm_sale(self, qty: int, reference: str = "") -> None:
         """Descuenta stock real tras pago exitoso."""
+        if self.is_hot:
+            from .hot_stock import get_counter
+            get_counter().confirm_sale(self, qty)
+            return
         stock = Stock.objects.select_for_update().get(pk=self.pk)
+        previous_quantity, previous_reserved = stock.quantity, stock.reserved
         stock.quantity = max(0, stock.quantity - qty)
         stock.reserved = max(0, stock.reserved - qty)
         stock.save(update_fields=["quantity", "reserved", "updated_at"])
+        stock._record(
+            StockMovement.Kind.CONFIRM,
+            quantity_delta=stock.quantity - previous_quantity,
+            reserved_delta=stock.reserved - previous_reserved,
+            reference=reference,
+        )
 
     @transaction.atomic
-    def restore(self, qty: int) -> None:
+    def restore(self, qty: int, reference: str = "") -> None:
         """Devuelve stock tras reembolso/devolución."""
+        if self.is_hot:
+            from .hot_stock import get_counter
+            get_counter().restore(self, qty)
+            return
         stock = Stock.objects.select_for_update().get(pk=self.pk)
         stock.quantity += qty
         stock.save(update_fields=["quantity", "updated_at"])
+        stock._record(StockMovement.Kind.RESTORE, quantity_delta=qty, reference=reference)
+
+    def _record(self, kind: str, quantity_delta: int = 0, reserved_delta: int = 0, reference: str = "") -> None:
+        from .ledger import record
+        record(self.variant_id, kind, quantity_delta, reserved_delta, reference)
+
+    def __str__(self) -> str:
+        return f"{self.variant.sku} | qty={self.quantity} | reserved={self.reserved}"
+
+
+class StockMovement(models.Model):
+    """
+    Ledger append-only de movimientos de inventario.
+
+    Cada cambio de quantity/reserved deja una fila con sus deltas. Junto con
+    StockSnapshot permite reconstruir el stock de una variante en cualquier
+    fecha y explicar de dónde salió un descuadre.
+    """
+
+    class Kind(models.TextChoices):
+        RESERVE = "RESERVE", "Reserva"
+        RELEASE = "RELEASE", "Liberación de reserva"
+        CONFIRM = "CONFIRM", "Venta confirmada"
+        RESTORE = "RESTORE", "Devolución"
+        ADJUST = "ADJUST", "Ajuste manual"
+        RECONCILE = "RECONCILE", "Conciliación hot"
+        REPAIR = "REPAIR", "Corrección de reservado"
+
+    variant = models.ForeignKey(
+        Variant, on_delete=models.CASCADE, related_name="stock_movements"
+    )
+    kind = models.CharField(max_length=10, choices=Kind.choices)
+    quantity_delta = models.IntegerField(default=0)
+    reserved_delta = models.IntegerField(default=0)
+    reference = models.CharField(
+        max_length=100,
+        blank=True,
+        help_text="Referencia del origen (ej: wompi_reference del pedido).",
+    )
+    created_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        db_table = "inventory_stock_movements"
+        indexes = [
+            models.Index(fields=["variant", "created_at"], name="inventory_mov_variant_idx"),
+        ]
+
+    def __str__(self) -> str:
+        return f"{self.kind} {self.variant_id} q{self.quantity_delta:+d} r{self.reserved_delta:+d}"
+
+
+class StockSnapshot(models.Model):
+    """
+    Foto diaria de quantity/reserved por variante.
+
+    last_movement_id es el último movimiento de la variante incluido en la
+    foto: el stock en una fecha = snapshot previo + movimientos posteriores.
+    """
+    variant = models.ForeignKey(
+        Variant, on_delete=models.CASCADE, related_name="stock_snapshots"
+    )
+    day = models.DateField()
+    taken_at = models.DateTimeField(default=timezone.now)
+    quantity = models.IntegerField()
+    reserved = models.IntegerField()
+    last_movement_id = models.BigIntegerField(default=0)
+
+    class Meta:
+        db_table = "inventory_stock_snapshots"
+        unique_together = ("variant", "day")
+
+    def __str__(self) -> str:
+        return f"{self.variant_id} @ {self.day} | qty={self.quantity} | reserved={self.reserved}"
+
+
+class Warehouse(TimeStampedModel):
+    """
+    Bodega desde la que se despachan pedidos.
+
+    El costo de despacho es por envío: local_shipping_cost si el destino está
+    en el mismo departamento de la bodega, national_shipping_cost si no.
+    """
+    name = models.CharField(max_length=100)
+    code = models.SlugField(max_length=30, unique=True)
+    city = models.CharField(max_length=100)
+    department = models.CharField(max_length=100, db_index=True)
+    local_shipping_cost = models.DecimalField(
+        max_digits=10, decimal_places=2, default=0, validators=[MinValueValidator(0)]
+    )
+    national_shipping_cost = models.DecimalField(
+        max_digits=10, decimal_places=2, default=0, validators=[MinValueValidator(0)]
+    )
+    priority = models.PositiveSmallIntegerField(
+        default=0, help_text="Desempate entre bodegas de igual costo (menor = primero)."
+    )
+    is_active = models.BooleanField(default=True)
+
+    class Meta:
+        db_table = "inventory_warehouses"
+        ordering = ["priority", "name"]
+
+    def __str__(self) -> str:
+        return f"{self.name} ({self.department})"
+
+    def shipping_cost_to(self, department: str):
+        if self.department.strip().lower() == department.strip().lower():
+            return self.local_shipping_cost
+        return self.national_shipping_cost
+
+
+class StockLocation(TimeStampedModel):
+    """Stock de una variante en una bodega."""
+    warehouse = models.ForeignKey(
+        Warehouse, on_delete=models.PROTECT, related_name="locations"
+    )
+    variant = models.ForeignKey(
+        Variant, on_delete=models.CASCADE, related_name="stock_locations"
+    )
+    quantity = models.PositiveIntegerField(default=0)
+    reserved = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        db_table = "inventory_stock_locations"
+        unique_together = ("warehouse", "variant")
+
+    @property
+    def available(self) -> int:
+        return max(0, self.quantity - self.reserved)
+
+    def __str__(self) -> str:
+        return f"{self.variant_id} @ {self.warehouse.code} | qty={self.quantity} | reserved={self.reserved}"
+
+
+class StockAllocation(models.Model):
+    """Unidades de un pedido asignadas a una bodega en el checkout."""
+
+    class Status(models.TextChoices):
+        RESERVED = "RESERVED", "Reservado"
+        CONFIRMED = "CONFIRMED", "Confirmado"
+        RELEASED = "RELEASED", "Liberado"
+
+    order = models.ForeignKey(
+        "orders.Order", on_delete=models.CASCADE, related_name="stock_allocations"
+    )
+    location = models.ForeignKey(
+        StockLocation, on_delete=models.PROTECT, related_name="allocations"
+    )
+    variant = models.ForeignKey(Variant, on_delete=models.CASCADE, related_name="+")
+    quantity = models.PositiveIntegerField(validators=[MinValueValidator(1)])
+    status = models.CharField(
+        max_length=10, choices=Status.choices, default=Status.RESERVED
+    )
+    created_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        db_table = "inventory_stock_allocations"
+        indexes = [
+            models.Index(fields=["order", "status"], name="inventory_alloc_order_idx"),
+        ]
+
+
+class StockReservation(models.Model):
+    """
+    Unidades retenidas por un pedido pendiente de pago.
+
+    Stock.reserved es la suma de las reservas vivas de cada variante: se
+    puede recalcular exactamente desde esta tabla (ver reservations.py).
+    Las filas se borran al pagar, cancelar o vencer el pedido.
+    """
+    variant = models.ForeignKey(Variant, on_delete=models.CASCADE, related_name="+")
+    order = models.ForeignKey(
+        "orders.Order", on_delete=models.CASCADE, related_name="stock_reservations"
+    )
+    quantity = models.PositiveIntegerField(validators=[MinValueValidator(1)])
+    expires_at = models.DateTimeField()
+    created_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        db_table = "inventory_stock_reservations"
+        indexes = [
+            models.Index(fields=["expires_at"], name="inventory_resv_expires_idx"),
+        ]
+
+    def __str__(self) -> str:
+        return f"{self.variant_id} x{self.quantity} → {self.order_id} (vence {self.expires_at:%H:%M:%S})"
+
+
+class DemandForecast(models.Model):
+    """
+    Pronóstico de demanda por variante, recalculado cada noche (forecast.py).
+
+    Las demandas son unidades por día. days_of_cover es null si la variante
+    no tiene demanda pronosticada.
+    """
+    variant = models.OneToOneField(
+        Variant, on_delete=models.CASCADE, related_name="demand_forecast"
+    )
+    moving_average_7 = models.FloatField(default=0)
+    moving_average_28 = models.FloatField(default=0)
+    daily_demand = models.FloatField(
+        default=0, help_text="Suavizado exponencial simple de las ventas diarias."
+    )
+    demand_std = models.FloatField(default=0)
+    days_of_cover = models.FloatField(null=True, blank=True)
+    reorder_quantity = models.PositiveIntegerField(default=0)
+    computed_at = models.DateTimeField()
+
+    class Meta:
+        db_table = "inventory_demand_forecasts"
 
     def __str__(self) -> str:
-        return f"{self.variant.sku} | qty={self.quantity} | reserved={self.reserved}"
\ No newline at end of file
+        return f"{self.variant_id} | {self.daily_demand:.2f}/día | pedir {self.reorder_quantity}"
@@ -0,0 +1,155 @@
+"""
+Push de disponibilidad en tiempo real (Server-Sent Events).
+
+Cada cambio de Stock publica la nueva disponibilidad de la variante en el
+canal Redis `inventory:availability` (al hacer commit de la transacción).
+En cada proceso ASGI un único `Broadcaster` escucha ese canal y reparte los
+mensajes a las conexiones SSE abiertas, así miles de clientes comparten una
+sola suscripción a Redis y ninguno ocupa un worker mientras espera.
+"""
+from __future__ import annotations
+
+import asyncio
+import json
+import logging
+from collections import defaultdict
+
+from django.db import transaction
+
+logger = logging.getLogger(__name__)
+
+CHANNEL = "inventory:availability"
+
+# Mensajes en cola por conexión; si un cliente lento se atrasa más que esto
+# se descartan los nuevos (el siguiente cambio trae el valor vigente).
+QUEUE_SIZE = 100
+
+
+# ─── Publicación ───────────────────────────────────────────────────────────
+
+def current_availability(variant_ids) -> dict[str, dict]:
+    """Disponibilidad actual por variante, en el formato de check-stock."""
+    from .hot_stock import get_counter
+    from .models import Stock
+
+    result = {}
+    for stock in Stock.objects.filter(variant_id__in=variant_ids).only(
+        "variant_id", "quantity", "reserved", "is_hot"
+    ):
+        available = get_counter().available(stock) if stock.is_hot else stock.available
+        result[str(stock.variant_id)] = {
+            "variant_id": str(stock.variant_id),
+            "available": available,
+            "is_out_of_stock": available <= 0,
+        }
+    return result
+
+
+def publish(payloads) -> None:
+    """Publica en Redis. Los errores se registran: el push es best-effort."""
+    from .hot_stock import get_client
+
+    try:
+        client = get_client()
+        for payload in payloads:
+            client.publish(CHANNEL, json.dumps(payload))
+    except Exception as e:
+        logger.warning("No se pudo publicar disponibilidad: %s", e)
+
+
+def notify(variant_ids) -> None:
+    """Publica la disponibilidad de las variantes cuando la transacción confirme."""
+    variant_ids = set(variant_ids)
+    if not variant_ids:
+        return
+    transaction.on_commit(lambda: publish(current_availability(variant_ids).values()))
+
+
+def notify_hot(variant_id, available: int) -> None:
+    """Los contadores hot cambian fuera de la transacción: se publica de inmediato."""
+    publish([{
+        "variant_id": str(variant_id),
+        "available": available,
+        "is_out_of_stock": available <= 0,
+    }])
+
+
+# ─── Suscripción (proceso ASGI) ────────────────────────────────────────────
+
+class Broadcaster:
+    """
+    Reparte los mensajes del canal Redis entre las conexiones SSE del proceso.
+
+    `client_factory` crea un cliente redis.asyncio; si es None el broadcaster
+    solo reparte lo que se le entregue con `dispatch()` (tests).
+    """
+
+    def __init__(self, client_factory=None):
+        self.client_factory = client_factory
+        self._subscribers: dict[str, set[asyncio.Queue]] = defaultdict(set)
+        self._task: asyncio.Task | None = None
+        self._loop = None
+
+    def subscribe(self, variant_ids) -> asyncio.Queue:
+        queue = asyncio.Queue(maxsize=QUEUE_SIZE)
+        for variant_id in variant_ids:
+            self._subscribers[variant_id].add(queue)
+        self._ensure_listening()
+        return queue
+
+    def unsubscribe(self, variant_ids, queue: asyncio.Queue) -> None:
+        for variant_id in variant_ids:
+            queues = self._subscribers.get(variant_id)
+            if queues is None:
+                continue
+            queues.discard(queue)
+            if not queues:
+                del self._subscribers[variant_id]
+
+    def dispatch(self, raw) -> None:
+        try:
+            payload = json.loads(raw)
+        except (TypeError, ValueError):
+            return
+        for queue in self._subscribers.get(payload.get("variant_id"), ()):
+            try:
+                queue.put_nowait(payload)
+            except asyncio.QueueFull:
+                pass
+
+    def _ensure_listening(self) -> None:
+        if self.client_factory is None:
+            return
+        loop = asyncio.get_running_loop()
+        # Con WSGI (runserver) cada request tiene su propio loop: se reinicia el listener
+        if self._task is None or self._task.done() or self._loop is not loop:
+            self._loop = loop
+            self._task = loop.create_task(self._listen())
+
+    async def _listen(self) -> None:
+        delay = 1
+        while True:
+            try:
+                client = self.client_factory()
+                async with client.pubsub() as pubsub:
+                    await pubsub.subscribe(CHANNEL)
+                    delay = 1
+                    async for message in pubsub.listen():
+                        if message.get("type") == "message":
+                            self.dispatch(message["data"])
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning("Suscripción a %s caída (%s); reintento en %ss", CHANNEL, e, delay)
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, 30)
+
+
+def _redis_client():
+    import redis.asyncio
+    from django.conf import settings
+
+    return redis.asyncio.Redis.from_url(settings.INVENTORY_REDIS_URL, decode_responses=True)
+
+
+broadcaster = Broadcaster(_redis_client)
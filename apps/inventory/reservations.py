@@ -0,0 +1,286 @@
+"""
+Reservas explícitas de stock (StockReservation).
+
+Cada pedido pendiente deja una fila por variante con su vencimiento. Liberar
+es borrar filas y descontar de Stock.reserved el agregado por variante, en
+bloque; y Stock.reserved se puede reconstruir en cualquier momento como la
+suma de las reservas vivas.
+"""
+from __future__ import annotations
+
+from collections import defaultdict
+
+from django.core.exceptions import ValidationError
+from django.db import transaction
+from django.db.models import Sum
+from django.utils import timezone
+
+from .ledger import movement_batch, record
+from .models import Stock, StockMovement, StockReservation
+
+
+def create_reservations(order, lines: dict, expires_at) -> list[StockReservation]:
+    """lines: {variant_id: cantidad}. Se escriben con un solo INSERT."""
+    return StockReservation.objects.bulk_create([
+        StockReservation(order=order, variant_id=variant_id, quantity=qty, expires_at=expires_at)
+        for variant_id, qty in lines.items()
+    ])
+
+
+@transaction.atomic
+def reserve_units(lines: dict, reference: str = "") -> None:
+    """
+    Reserva las líneas de un checkout. lines: {variant_id: cantidad}.
+    Bloquea las filas de Stock en orden de pk (dos carritos con los mismos
+    SKU no se bloquean mutuamente), valida todas las líneas y las aplica
+    con un bulk_update y un INSERT de movimientos. Equivale a llamar
+    Stock.reserve por línea; lanza ValidationError si alguna no alcanza.
+    Las variantes hot se reservan en Redis (dentro de reservation_guard).
+    """
+    from .hot_stock import get_counter
+
+    stocks = list(
+        Stock.objects.select_for_update()
+        .filter(variant_id__in=list(lines))
+        .select_related("variant")
+        .order_by("pk")
+    )
+    for stock in stocks:
+        qty = lines[stock.variant_id]
+        if not stock.is_hot and not stock.check_availability(qty):
+            raise ValidationError(
+                f"Stock insuficiente para '{stock.variant.sku}'. "
+                f"Disponible: {stock.available}, solicitado: {qty}."
+            )
+
+    now = timezone.now()
+    changed = []
+    with movement_batch():
+        for stock in stocks:
+            qty = lines[stock.variant_id]
+            if stock.is_hot:
+                get_counter().reserve(stock, qty)
+                continue
+            stock.reserved += qty
+            stock.updated_at = now
+            changed.append(stock)
+            record(stock.variant_id, StockMovement.Kind.RESERVE, reserved_delta=qty, reference=reference)
+        Stock.objects.bulk_update(changed, ["reserved", "updated_at"])
+
+
+@transaction.atomic
+def release_reservations(order_ids) -> int:
+    """
+    Borra las reservas de los pedidos y devuelve las unidades al disponible.
+    Retorna el número de reservas liberadas.
+    """
+    from .hot_stock import get_counter
+
+    rows = list(
+        StockReservation.objects.filter(order_id__in=order_ids)
+        .values_list("pk", "variant_id", "quantity", "order__wompi_reference")
+    )
+    if not rows:
+        return 0
+
+    stocks = {
+        stock.variant_id: stock
+        for stock in Stock.objects.select_for_update()
+        .filter(variant_id__in={variant_id for _, variant_id, _, _ in rows})
+        .order_by("pk")
+    }
+    now = timezone.now()
+    changed = {}
+    hot = defaultdict(int)
+    with movement_batch():
+        for _, variant_id, qty, reference in rows:
+            stock = stocks.get(variant_id)
+            if stock is None:
+                continue
+            if stock.is_hot:
+                hot[variant_id] += qty
+                continue
+            released = min(qty, stock.reserved)
+            if not released:
+                continue
+            stock.reserved -= released
+            stock.updated_at = now
+            changed[stock.pk] = stock
+            record(variant_id, StockMovement.Kind.RELEASE, reserved_delta=-released, reference=reference)
+        Stock.objects.bulk_update(changed.values(), ["reserved", "updated_at"])
+    StockReservation.objects.filter(pk__in=[pk for pk, _, _, _ in rows]).delete()
+
+    def release_hot():
+        for variant_id, qty in hot.items():
+            get_counter().release(stocks[variant_id], qty)
+
+    if hot:
+        # Los contadores Redis no participan de la transacción
+        transaction.on_commit(release_hot)
+    return len(rows)
+
+
+@transaction.atomic
+def settle_order_items(order_ids, confirm: bool) -> int:
+    """
+    Confirma la venta (confirm=True) o libera la reserva de todos los ítems
+    de los pedidos, agregando por variante: un SELECT ... FOR UPDATE, un
+    bulk_update y un INSERT de movimientos. Equivale a llamar
+    Stock.confirm_sale / release_reservation por ítem.
+    Retorna el número de ítems procesados.
+    """
+    from apps.orders.models import OrderItem
+
+    from .hot_stock import get_counter
+
+    rows = list(
+        OrderItem.objects.filter(order_id__in=order_ids)
+        .values_list("variant_id", "quantity", "order__wompi_reference")
+    )
+    stocks = {
+        stock.variant_id: stock
+        for stock in Stock.objects.select_for_update()
+        .filter(variant_id__in={variant_id for variant_id, _, _ in rows})
+        .order_by("pk")
+    }
+    kind = StockMovement.Kind.CONFIRM if confirm else StockMovement.Kind.RELEASE
+    now = timezone.now()
+    changed = {}
+    hot = defaultdict(int)
+    with movement_batch():
+        for variant_id, qty, reference in rows:
+            stock = stocks.get(variant_id)
+            if stock is None:
+                continue
+            if stock.is_hot:
+                hot[variant_id] += qty
+                continue
+            previous_quantity, previous_reserved = stock.quantity, stock.reserved
+            if confirm:
+                stock.quantity = max(0, stock.quantity - qty)
+            stock.reserved = max(0, stock.reserved - qty)
+            stock.updated_at = now
+            changed[stock.pk] = stock
+            record(
+                variant_id, kind,
+                quantity_delta=stock.quantity - previous_quantity,
+                reserved_delta=stock.reserved - previous_reserved,
+                reference=reference,
+            )
+        Stock.objects.bulk_update(changed.values(), ["quantity", "reserved", "updated_at"])
+
+    def settle_hot():
+        counter = get_counter()
+        for variant_id, qty in hot.items():
+            if confirm:
+                counter.confirm_sale(stocks[variant_id], qty)
+            else:
+                counter.release(stocks[variant_id], qty)
+
+    if hot:
+        # Los contadores Redis no participan de la transacción
+        transaction.on_commit(settle_hot)
+    return len(rows)
+
+
+@transaction.atomic
+def restore_units(lines: dict, reference: str = "") -> int:
+    """
+    Devuelve unidades al stock (reembolsos). lines: {variant_id: cantidad}.
+    Un SELECT ... FOR UPDATE, un bulk_update y un INSERT de movimientos;
+    equivale a llamar Stock.restore por línea. Retorna variantes restauradas.
+    """
+    from .hot_stock import get_counter
+
+    stocks = {
+        stock.variant_id: stock
+        for stock in Stock.objects.select_for_update()
+        .filter(variant_id__in=list(lines))
+        .order_by("pk")
+    }
+    now = timezone.now()
+    changed = []
+    hot = {}
+    with movement_batch():
+        for variant_id, qty in lines.items():
+            stock = stocks.get(variant_id)
+            if stock is None or not qty:
+                continue
+            if stock.is_hot:
+                hot[variant_id] = qty
+                continue
+            stock.quantity += qty
+            stock.updated_at = now
+            changed.append(stock)
+            record(variant_id, StockMovement.Kind.RESTORE, quantity_delta=qty, reference=reference)
+        Stock.objects.bulk_update(changed, ["quantity", "updated_at"])
+
+    def restore_hot():
+        counter = get_counter()
+        for variant_id, qty in hot.items():
+            counter.restore(stocks[variant_id], qty)
+
+    if hot:
+        # Los contadores Redis no participan de la transacción
+        transaction.on_commit(restore_hot)
+    return len(changed) + len(hot)
+
+
+def consume_reservations(order_ids) -> int:
+    """Borra las reservas de pedidos pagados (Stock ya descontado por confirm_sale)."""
+    deleted, _ = StockReservation.objects.filter(order_id__in=order_ids).delete()
+    return deleted
+
+
+RECOMPUTE_CHUNK_SIZE = 500
+
+
+def recompute_reserved(variant_ids=None) -> int:
+    """
+    Corrige Stock.reserved para que sea igual a la suma de reservas vivas.
+    Las variantes hot se excluyen (su reservado vive en Redis).
+    Retorna el número de variantes corregidas.
+
+    Recorre las filas por tramos en orden de pk, cada uno en su propia
+    transacción (como ledger.take_snapshots): un checkout solo espera al
+    tramo que tiene bloqueado, no a la corrida completa.
+    """
+    stocks = Stock.objects.filter(is_hot=False)
+    if variant_ids is not None:
+        stocks = stocks.filter(variant_id__in=variant_ids)
+    stock_ids = list(stocks.order_by("pk").values_list("pk", flat=True))
+
+    changed = 0
+    for start in range(0, len(stock_ids), RECOMPUTE_CHUNK_SIZE):
+        changed += _recompute_chunk(stock_ids[start:start + RECOMPUTE_CHUNK_SIZE])
+    return changed
+
+
+@transaction.atomic
+def _recompute_chunk(stock_ids) -> int:
+    stocks = list(
+        Stock.objects.select_for_update()
+        .filter(pk__in=stock_ids, is_hot=False)  # Pudo pasar a hot desde el listado
+        .order_by("pk")
+    )
+    # Se suma después de bloquear: un checkout en curso ya confirmó o espera
+    live = dict(
+        StockReservation.objects
+        .filter(variant_id__in=[s.variant_id for s in stocks])
+        .values("variant_id")
+        .annotate(total=Sum("quantity"))
+        .values_list("variant_id", "total")
+    )
+    now = timezone.now()
+    changed = []
+    with movement_batch():
+        for stock in stocks:
+            expected = live.get(stock.variant_id, 0)
+            if stock.reserved == expected:
+                continue
+            record(stock.variant_id, StockMovement.Kind.REPAIR, reserved_delta=expected - stock.reserved)
+            stock.reserved = expected
+            stock.updated_at = now
+            changed.append(stock)
+        Stock.objects.bulk_update(changed, ["reserved", "updated_at"])
+    return len(changed)
@@ -1,8 +1,19 @@
 from rest_framework import serializers
-from .models import Stock
+from .models import DemandForecast, Stock, StockMovement, Warehouse
+
+
+class DemandForecastSerializer(serializers.ModelSerializer):
+
+    class Meta:
+        model = DemandForecast
+        fields = [
+            "moving_average_7", "moving_average_28", "daily_demand",
+            "demand_std", "days_of_cover", "reorder_quantity", "computed_at",
+        ]
 
 
 class StockSerializer(serializers.ModelSerializer):
+    forecast = DemandForecastSerializer(source="variant.demand_forecast", read_only=True)
     variant_sku = serializers.CharField(source="variant.sku", read_only=True)
     product_name = serializers.CharField(source="variant.product.name", read_only=True)
     available = serializers.IntegerField(read_only=True)
@@ -15,5 +26,46 @@ class StockSerializer(serializers.ModelSerializer):
             "id", "variant", "variant_sku", "product_name",
             "quantity", "reserved", "available",
             "is_out_of_stock", "is_low_stock", "low_stock_threshold",
+            "forecast",
+        ]
+        read_only_fields = ["reserved"]
+
+
+class StockMovementSerializer(serializers.ModelSerializer):
+    kind_display = serializers.CharField(source="get_kind_display", read_only=True)
+
+    class Meta:
+        model = StockMovement
+        fields = [
+            "id", "kind", "kind_display", "quantity_delta",
+            "reserved_delta", "reference", "created_at",
         ]
-        read_only_fields = ["reserved"]
\ No newline at end of file
+
+
+class BulkAdjustItemSerializer(serializers.Serializer):
+    sku = serializers.CharField(max_length=100)
+    quantity = serializers.IntegerField(min_value=0, required=False, allow_null=True)
+    delta = serializers.IntegerField(required=False, allow_null=True)
+
+    def validate(self, attrs):
+        if (attrs.get("quantity") is None) == (attrs.get("delta") is None):
+            raise serializers.ValidationError("Indica 'quantity' o 'delta' (solo uno).")
+        return attrs
+
+
+class BulkAdjustSerializer(serializers.Serializer):
+    items = BulkAdjustItemSerializer(many=True, allow_empty=False, max_length=10000)
+    warehouse = serializers.SlugRelatedField(
+        slug_field="code", queryset=Warehouse.objects.filter(is_active=True),
+        required=False, allow_null=True,
+    )
+
+    def validate_items(self, items):
+        seen, duplicated = set(), set()
+        for item in items:
+            (duplicated if item["sku"] in seen else seen).add(item["sku"])
+        if duplicated:
+            raise serializers.ValidationError(
+                f"SKUs repetidos: {', '.join(sorted(duplicated))}."
+            )
+        return items
@@ -0,0 +1,49 @@
+from __future__ import annotations
+
+import logging
+
+from celery import shared_task
+
+logger = logging.getLogger(__name__)
+
+
+@shared_task(name="inventory.reconcile_hot_stock")
+def reconcile_hot_stock():
+    """
+    Libera las reservas hot de transacciones revertidas y aplica a Stock los
+    deltas de las variantes hot acumulados en Redis.
+    """
+    from apps.inventory.hot_stock import reconcile, release_abandoned
+    release_abandoned()
+    count = reconcile()
+    logger.info("reconcile_hot_stock: %d variantes conciliadas.", count)
+    return f"{count} variantes conciliadas"
+
+
+
+@shared_task(name="inventory.snapshot_stock")
+def snapshot_stock():
+    """Foto diaria de quantity/reserved para las consultas históricas."""
+    from apps.inventory.ledger import take_snapshots
+    count = take_snapshots()
+    logger.info("snapshot_stock: %d variantes.", count)
+    return f"{count} snapshots"
+
+
+@shared_task(name="inventory.forecast_demand")
+def forecast_demand():
+    """Pronóstico nocturno de demanda, cobertura y reabastecimiento por variante."""
+    from apps.inventory.forecast import refresh_forecasts
+    count = refresh_forecasts()
+    logger.info("forecast_demand: %d variantes.", count)
+    return f"{count} pronósticos"
+
+
+@shared_task(name="inventory.repair_reserved")
+def repair_reserved():
+    """Recalcula Stock.reserved desde las reservas vivas (corrige descuadres)."""
+    from apps.inventory.reservations import recompute_reserved
+    count = recompute_reserved()
+    if count:
+        logger.warning("repair_reserved: %d variantes con reservado descuadrado.", count)
+    return f"{count} variantes corregidas"
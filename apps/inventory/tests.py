@@ -1,3 +1,636 @@
+from __future__ import annotations
+
+import json
+import random
+import time
+from datetime import timedelta
+from decimal import Decimal
+from unittest import mock
+
+import numpy as np
+
+from django.contrib.auth import get_user_model
+from django.core.exceptions import ValidationError
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import connection, transaction
+from django.db.models import F
 from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.test import APITestCase
+from rest_framework import status
+
+from apps.catalog.models import Brand, Product, Variant
+from apps.inventory import forecast, hot_stock, ledger, realtime
+from apps.inventory.allocation import (
+    allocate, confirm_allocations, release_allocations, sync_stock_totals,
+)
+from apps.inventory.fake_redis import FakeRedis
+from apps.inventory.models import (
+    DemandForecast, Stock, StockAllocation, StockLocation, StockMovement, StockSnapshot, Warehouse,
+)
+from apps.orders.models import Order, OrderItem
+
+
+User = get_user_model()
+
+
+# ══════════════════════════════════════════════════════════════════════════════
+# Helpers
+# ══════════════════════════════════════════════════════════════════════════════
+
+def make_admin(**kwargs):
+    defaults = dict(username="admin", email="admin@test.com", password="pass1234", is_staff=True)
+    defaults.update(kwargs)
+    return User.objects.create_superuser(**defaults)
+
+
+def make_stock(sku="SKU-001", qty=10, reserved=0, threshold=5, product=None):
+    if product is None:
+        brand, _ = Brand.objects.get_or_create(name="TestBrand", slug="testbrand")
+        product = Product.objects.create(
+            name=f"Labial {sku}", slug=f"labial-{sku.lower()}",
+            brand=brand, description="desc"
+        )
+    variant = Variant.objects.create(
+        product=product, sku=sku,
+        name="Tono Test", price=Decimal("50000")
+    )
+    return Stock.objects.create(
+        variant=variant, quantity=qty, reserved=reserved, low_stock_threshold=threshold
+    )
+
+
+# ══════════════════════════════════════════════════════════════════════════════
+# Low stock
+# ══════════════════════════════════════════════════════════════════════════════
+
+class LowStockQuerySetTest(TestCase):
+
+    def test_low_stock_matches_properties(self):
+        stocks = [
+            make_stock("OK", qty=20),
+            make_stock("LOW", qty=4),
+            make_stock("RESERVED", qty=10, reserved=6),
+            make_stock("OUT", qty=0),
+            make_stock("OVER", qty=2, reserved=5),
+        ]
+        expected = {s.variant.sku for s in stocks if s.is_low_stock or s.is_out_of_stock}
+        result = set(Stock.objects.low_stock().values_list("variant__sku", flat=True))
+        self.assertEqual(result, expected)
+        self.assertEqual(result, {"LOW", "RESERVED", "OUT", "OVER"})
+
+
+class LowStockAPITest(APITestCase):
+
+    def setUp(self):
+        self.client.force_authenticate(user=make_admin())
+        make_stock("OK", qty=20)
+        make_stock("LOW", qty=4)
+        make_stock("OUT", qty=0)
+
+    def test_low_stock_is_paginated(self):
+        res = self.client.get("/api/inventory/stock/low-stock/")
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.data["count"], 2)
+        self.assertEqual(
+            {r["variant_sku"] for r in res.data["results"]}, {"LOW", "OUT"}
+        )
+
+    def test_low_stock_ordering_by_days_of_cover(self):
+        res = self.client.get("/api/inventory/stock/low-stock/?ordering=days_of_cover")
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.data["count"], 2)
+
+
+# ══════════════════════════════════════════════════════════════════════════════
+# Hot stock (Redis)
+# ══════════════════════════════════════════════════════════════════════════════
+
+class HotStockTest(TestCase):
+
+    def setUp(self):
+        hot_stock.set_client(FakeRedis())
+        self.addCleanup(hot_stock.set_client, None)
+        self.stock = make_stock("HOT", qty=10)
+        hot_stock.enable(self.stock)
+
+    def test_reserve_uses_redis_counter(self):
+        self.stock.reserve(3)
+        self.stock.refresh_from_db()
+        self.assertEqual(self.stock.reserved, 0)  # aún no conciliado
+        self.assertEqual(hot_stock.get_counter().available(self.stock), 7)
+
+    def test_reserve_insufficient_raises(self):
+        self.stock.reserve(8)
+        with self.assertRaises(ValidationError):
+            self.stock.reserve(3)
+
+    def test_reconcile_applies_deltas(self):
+        self.stock.reserve(4)
+        self.stock.release_reservation(1)
+        self.stock.confirm_sale(2)
+
+        self.assertEqual(hot_stock.reconcile(), 1)
+        self.stock.refresh_from_db()
+        self.assertEqual(self.stock.quantity, 8)
+        self.assertEqual(self.stock.reserved, 1)
+        self.assertEqual(self.stock.available, hot_stock.get_counter().available(self.stock))
+
+        # Los deltas quedan en cero: una segunda pasada no cambia nada
+        self.assertEqual(hot_stock.reconcile(), 0)
+
+    def test_reservation_guard_compensates_on_error(self):
+        with self.assertRaises(ValidationError):
+            with hot_stock.reservation_guard():
+                self.stock.reserve(6)
+                self.stock.reserve(6)
+        self.assertEqual(hot_stock.get_counter().available(self.stock), 10)
+
+    def test_rollback_after_guard_is_released_by_sweep(self):
+        # La transacción se revierte después de salir del bloque protegido
+        with self.assertRaises(RuntimeError):
+            with transaction.atomic():
+                with hot_stock.reservation_guard():
+                    self.stock.reserve(3)
+                raise RuntimeError("falla al confirmar")
+        counter = hot_stock.get_counter()
+        self.assertEqual(counter.available(self.stock), 7)
+
+        self.assertEqual(hot_stock.release_abandoned(), 0)  # Aún dentro del plazo
+        later = time.time() + hot_stock.PENDING_TIMEOUT + 1
+        self.assertEqual(hot_stock.release_abandoned(later), 1)
+        self.assertEqual(counter.available(self.stock), 10)
+        self.assertEqual(hot_stock.release_abandoned(later), 0)
+
+    def test_committed_reservation_is_not_swept(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            with hot_stock.reservation_guard():
+                self.stock.reserve(3)
+        self.assertEqual(hot_stock.get_counter().pending(), {})
+        self.assertEqual(hot_stock.release_abandoned(time.time() + hot_stock.PENDING_TIMEOUT + 1), 0)
+        self.assertEqual(hot_stock.get_counter().available(self.stock), 7)
+
+    def test_disable_reconciles_and_clears(self):
+        self.stock.reserve(2)
+        hot_stock.disable(self.stock)
+        self.stock.refresh_from_db()
+        self.assertFalse(self.stock.is_hot)
+        self.assertEqual(self.stock.reserved, 2)
+
+    def test_disable_failure_keeps_counter_and_deltas(self):
+        self.stock.reserve(2)
+        with mock.patch.object(hot_stock, "_apply_to_db", side_effect=RuntimeError("db")):
+            with self.assertRaises(RuntimeError):
+                hot_stock.disable(self.stock)
+
+        self.stock.refresh_from_db()
+        self.assertTrue(self.stock.is_hot)
+        self.assertEqual(hot_stock.get_counter().available(self.stock), 8)
+        self.assertEqual(hot_stock.reconcile(), 1)
+        self.stock.refresh_from_db()
+        self.assertEqual(self.stock.reserved, 2)
+
+    def test_enable_seeds_from_locked_row(self):
+        stale = make_stock("HOT-2", qty=10)
+        # Reserva en la base confirmada después de que el admin leyó la fila
+        Stock.objects.get(pk=stale.pk).reserve(4)
+        hot_stock.enable(stale)
+        self.assertTrue(Stock.objects.get(pk=stale.pk).is_hot)
+        self.assertEqual(hot_stock.get_counter().available(stale), 6)
+
+    def test_reservation_after_disable_falls_back_to_db(self):
+        # Reserva en vuelo con la instancia vieja (is_hot=True en memoria)
+        stale = Stock.objects.select_related("variant").get(pk=self.stock.pk)
+        self.stock.reserve(2)
+        hot_stock.disable(self.stock)
+        hot_stock.get_counter().reserve(stale, 3)
+
+        self.stock.refresh_from_db()
+        self.assertEqual(self.stock.reserved, 5)
+        self.assertEqual(hot_stock.get_client().exists(*hot_stock.HotStockCounter._keys(stale.variant_id)), 0)
+
+        stale.release_reservation(1)
+        self.stock.refresh_from_db()
+        self.assertEqual(self.stock.reserved, 4)
+
+
+
+# ══════════════════════════════════════════════════════════════════════════════
+# Ledger de movimientos
+# ══════════════════════════════════════════════════════════════════════════════
+
+class StockLedgerTest(TestCase):
+
+    def setUp(self):
+        self.stock = make_stock("LEDGER", qty=10)
+
+    def test_operations_record_movements(self):
+        self.stock.reserve(3, reference="ORD-1")
+        self.stock.confirm_sale(3, reference="ORD-1")
+        self.stock.restore(1)
+        kinds = list(
+            StockMovement.objects.filter(variant=self.stock.variant)
+            .order_by("id").values_list("kind", "quantity_delta", "reserved_delta")
+        )
+        self.assertEqual(kinds, [
+            (StockMovement.Kind.RESERVE, 0, 3),
+            (StockMovement.Kind.CONFIRM, -3, -3),
+            (StockMovement.Kind.RESTORE, 1, 0),
+        ])
+
+    def test_release_records_clamped_delta(self):
+        self.stock.reserve(2)
+        self.stock.release_reservation(5)
+        movement = StockMovement.objects.latest("id")
+        self.assertEqual(movement.reserved_delta, -2)
+
+    def test_movement_batch_writes_once(self):
+        other = make_stock("LEDGER-2", qty=10)
+        with self.assertNumQueries(1):
+            with ledger.movement_batch():
+                ledger.record(self.stock.variant_id, StockMovement.Kind.ADJUST, 5)
+                ledger.record(other.variant_id, StockMovement.Kind.ADJUST, -2)
+        self.assertEqual(StockMovement.objects.count(), 2)
+
+    def test_stock_at_uses_snapshot_plus_movements(self):
+        ledger.take_snapshots()
+        self.stock.reserve(4)
+        checkpoint = timezone.now()
+        self.stock.confirm_sale(4)
+
+        past = ledger.stock_at(self.stock.variant_id, checkpoint)
+        self.assertEqual((past["quantity"], past["reserved"]), (10, 4))
+
+        now = ledger.stock_at(self.stock.variant_id, timezone.now())
+        self.assertEqual((now["quantity"], now["reserved"]), (6, 0))
+
+    def test_late_committing_movement_is_replayed(self):
+        # Otra transacción obtuvo un id de movimiento y aún no confirma
+        in_flight = StockMovement.objects.create(
+            variant=self.stock.variant, kind=StockMovement.Kind.RESERVE, reserved_delta=2,
+        )
+        late_id = in_flight.id
+        in_flight.delete()
+        # Mientras tanto confirma un movimiento de otra variante, con id mayor
+        make_stock("LEDGER-2", qty=10).reserve(1)
+
+        ledger.take_snapshots()
+
+        # La transacción tardía confirma: su movimiento y el cambio en Stock
+        Stock.objects.filter(pk=self.stock.pk).update(reserved=F("reserved") + 2)
+        StockMovement.objects.create(
+            id=late_id, variant=self.stock.variant, kind=StockMovement.Kind.RESERVE, reserved_delta=2,
+        )
+
+        now = ledger.stock_at(self.stock.variant_id, timezone.now())
+        self.stock.refresh_from_db()
+        self.assertEqual((now["quantity"], now["reserved"]), (10, 2))
+        self.assertEqual((now["quantity"], now["reserved"]), (self.stock.quantity, self.stock.reserved))
+
+    def test_take_snapshots_is_idempotent_per_day(self):
+        ledger.take_snapshots()
+        ledger.take_snapshots()
+        self.assertEqual(StockSnapshot.objects.filter(variant=self.stock.variant).count(), 1)
+
+
+class StockHistoryAPITest(APITestCase):
+
+    def setUp(self):
+        self.client.force_authenticate(user=make_admin())
+        self.stock = make_stock("HIST", qty=10)
+
+    def test_patch_records_adjustment(self):
+        res = self.client.patch(
+            f"/api/inventory/stock/{self.stock.id}/", {"quantity": 25}, format="json"
+        )
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        res = self.client.get(f"/api/inventory/stock/{self.stock.id}/movements/")
+        self.assertEqual(res.data["results"][0]["kind"], StockMovement.Kind.ADJUST)
+        self.assertEqual(res.data["results"][0]["quantity_delta"], 15)
+
+    def test_patch_rejects_hot_variant(self):
+        hot_stock.set_client(FakeRedis())
+        self.addCleanup(hot_stock.set_client, None)
+        hot_stock.enable(self.stock)
+        res = self.client.patch(
+            f"/api/inventory/stock/{self.stock.id}/", {"quantity": 25}, format="json"
+        )
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        self.stock.refresh_from_db()
+        self.assertEqual(self.stock.quantity, 10)
+
+    def test_patch_ignores_reserved(self):
+        res = self.client.patch(
+            f"/api/inventory/stock/{self.stock.id}/", {"quantity": 12, "reserved": 5}, format="json"
+        )
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.data["reserved"], 0)
+        movement = StockMovement.objects.latest("id")
+        self.assertEqual((movement.quantity_delta, movement.reserved_delta), (2, 0))
+
+    def test_history_requires_valid_date(self):
+        res = self.client.get(f"/api/inventory/stock/{self.stock.id}/history/?at=ayer")
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_history_by_date(self):
+        ledger.take_snapshots()
+        day = timezone.localdate().isoformat()
+        res = self.client.get(f"/api/inventory/stock/{self.stock.id}/history/?at={day}")
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.data["quantity"], 10)
+
+
+
+# ══════════════════════════════════════════════════════════════════════════════
+# Bodegas
+# ══════════════════════════════════════════════════════════════════════════════
+
+def make_order():
+    return Order.objects.create(
+        shipping_name="Test", shipping_address="Calle 1", shipping_city="Pasto",
+        shipping_department="Nariño", shipping_phone="3001234567",
+    )
+
+
+class WarehouseAllocationTest(TestCase):
+
+    def setUp(self):
+        self.bogota = Warehouse.objects.create(
+            name="Bogotá", code="bog", city="Bogotá", department="Cundinamarca",
+            local_shipping_cost=Decimal("8000"), national_shipping_cost=Decimal("15000"),
+        )
+        self.pasto = Warehouse.objects.create(
+            name="Pasto", code="pso", city="Pasto", department="Nariño",
+            local_shipping_cost=Decimal("5000"), national_shipping_cost=Decimal("18000"),
+        )
+        self.a = make_stock("A", qty=0)
+        self.b = make_stock("B", qty=0)
+        self.locations = {
+            ("bog", "A"): StockLocation.objects.create(warehouse=self.bogota, variant=self.a.variant, quantity=10),
+            ("bog", "B"): StockLocation.objects.create(warehouse=self.bogota, variant=self.b.variant, quantity=10),
+            ("pso", "A"): StockLocation.objects.create(warehouse=self.pasto, variant=self.a.variant, quantity=3),
+        }
+        sync_stock_totals([self.a.variant_id, self.b.variant_id])
+
+    def test_sync_stock_totals_aggregates_locations(self):
+        self.a.refresh_from_db()
+        self.assertEqual(self.a.quantity, 13)
+
+    def test_prefers_local_warehouse(self):
+        allocations = allocate(make_order(), {self.a.variant_id: 2}, "Nariño")
+        self.assertEqual([(al.location.warehouse.code, al.quantity) for al in allocations], [("pso", 2)])
+
+    def test_single_warehouse_beats_split(self):
+        # Pasto no tiene B: enviar todo desde Bogotá (15000) es más barato que dividir (5000 + 15000)
+        allocations = allocate(
+            make_order(), {self.a.variant_id: 2, self.b.variant_id: 1}, "Nariño"
+        )
+        self.assertEqual({al.location.warehouse.code for al in allocations}, {"bog"})
+
+    def test_splits_when_no_single_warehouse_fits(self):
+        allocations = allocate(make_order(), {self.a.variant_id: 12}, "Nariño")
+        self.assertEqual(sum(al.quantity for al in allocations), 12)
+        self.assertEqual({al.location.warehouse.code for al in allocations}, {"bog", "pso"})
+
+    def test_confirm_and_release(self):
+        paid, cancelled = make_order(), make_order()
+        allocate(paid, {self.a.variant_id: 2}, "Nariño")
+        allocate(cancelled, {self.a.variant_id: 1}, "Nariño")
+
+        confirm_allocations([paid.pk])
+        release_allocations([cancelled.pk])
+
+        location = StockLocation.objects.get(pk=self.locations[("pso", "A")].pk)
+        self.assertEqual((location.quantity, location.reserved), (1, 0))
+        self.assertEqual(
+            set(StockAllocation.objects.values_list("status", flat=True)),
+            {StockAllocation.Status.CONFIRMED, StockAllocation.Status.RELEASED},
+        )
+
+    def test_variants_without_locations_are_skipped(self):
+        other = make_stock("SIN-BODEGA", qty=5)
+        self.assertEqual(allocate(make_order(), {other.variant_id: 1}, "Nariño"), [])
+
+
+
+# ══════════════════════════════════════════════════════════════════════════════
+# Stream de disponibilidad (SSE)
+# ══════════════════════════════════════════════════════════════════════════════
+
+class AvailabilityPublishTest(TestCase):
+
+    def setUp(self):
+        self.redis = FakeRedis()
+        hot_stock.set_client(self.redis)
+        self.addCleanup(hot_stock.set_client, None)
+        self.stock = make_stock("PUSH", qty=10)
+
+    def published(self):
+        return [json.loads(message) for _, message in self.redis.published]
+
+    def test_publishes_after_commit(self):
+        with self.captureOnCommitCallbacks(execute=False) as callbacks:
+            self.stock.reserve(3)
+        self.assertEqual(self.redis.published, [])
+
+        for callback in callbacks:
+            callback()
+        self.assertEqual(self.published(), [{
+            "variant_id": str(self.stock.variant_id), "available": 7, "is_out_of_stock": False,
+        }])
+
+    def test_batch_publishes_once_per_variant(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            with ledger.movement_batch():
+                self.stock.reserve(4)
+                self.stock.reserve(6)
+        self.assertEqual(len(self.published()), 1)
+        self.assertTrue(self.published()[0]["is_out_of_stock"])
+
+    def test_hot_reserve_publishes_immediately(self):
+        hot_stock.enable(self.stock)
+        self.stock.reserve(2)
+        self.assertEqual(self.published()[-1]["available"], 8)
+
+
+class AvailabilityStreamTest(TestCase):
+
+    def setUp(self):
+        self.stock = make_stock("STREAM", qty=10)
+        patcher = mock.patch.object(realtime, "broadcaster", realtime.Broadcaster())
+        self.broadcaster = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_requires_valid_variants(self):
+        res = self.client.get("/api/inventory/stream/?variants=no-es-uuid")
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+
+    async def test_sends_current_state_then_changes(self):
+        variant_id = str(self.stock.variant_id)
+        res = await self.async_client.get(f"/api/inventory/stream/?variants={variant_id}")
+        self.assertEqual(res["Content-Type"], "text/event-stream")
+        stream = aiter(res.streaming_content)
+
+        first = await anext(stream)
+        self.assertIn('"available": 10', first.decode())
+
+        self.broadcaster.dispatch(json.dumps(
+            {"variant_id": variant_id, "available": 0, "is_out_of_stock": True}
+        ))
+        second = await anext(stream)
+        self.assertIn('"is_out_of_stock": true', second.decode())
+
+
+
+# ══════════════════════════════════════════════════════════════════════════════
+# Ajuste masivo
+# ══════════════════════════════════════════════════════════════════════════════
+
+class BulkAdjustAPITest(APITestCase):
+
+    url = "/api/inventory/stock/bulk-adjust/"
+
+    def setUp(self):
+        self.client.force_authenticate(user=make_admin())
+        self.a = make_stock("BULK-A", qty=10)
+        self.b = make_stock("BULK-B", qty=5, product=self.a.variant.product)
+
+    def test_quantity_and_delta(self):
+        res = self.client.post(self.url, {"items": [
+            {"sku": "BULK-A", "quantity": 7},
+            {"sku": "BULK-B", "delta": 3},
+            {"sku": "NO-EXISTE", "quantity": 1},
+        ]}, format="json")
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.data["updated"], 2)
+        self.assertEqual(res.data["not_found"], ["NO-EXISTE"])
+        self.assertIn({"sku": "BULK-A", "before": 10, "after": 7}, res.data["changes"])
+
+        self.b.refresh_from_db()
+        self.assertEqual(self.b.quantity, 8)
+        self.assertEqual(
+            StockMovement.objects.filter(kind=StockMovement.Kind.ADJUST).count(), 2
+        )
+
+    def test_invalid_row_applies_nothing(self):
+        res = self.client.post(self.url, {"items": [
+            {"sku": "BULK-A", "quantity": 0},
+            {"sku": "BULK-B", "delta": -6},
+        ]}, format="json")
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn("BULK-B", res.data["errors"])
+        self.a.refresh_from_db()
+        self.assertEqual(self.a.quantity, 10)
+
+    def test_requires_exactly_one_of_quantity_or_delta(self):
+        res = self.client.post(self.url, {"items": [
+            {"sku": "BULK-A", "quantity": 1, "delta": 1},
+        ]}, format="json")
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_csv_upload(self):
+        upload = SimpleUploadedFile(
+            "conteo.csv", b"sku,quantity,delta\nBULK-A,3,\nBULK-B,,-1\n", content_type="text/csv"
+        )
+        res = self.client.post(self.url, {"file": upload}, format="multipart")
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.data["updated"], 2)
+
+    def test_query_count_does_not_grow_with_rows(self):
+        product = self.a.variant.product
+        for i in range(50):
+            make_stock(f"MANY-{i}", qty=1, product=product)
+        items = [{"sku": f"MANY-{i}", "quantity": 2} for i in range(50)]
+        with CaptureQueriesContext(connection) as queries:
+            res = self.client.post(self.url, {"items": items}, format="json")
+        self.assertEqual(res.data["updated"], 50)
+        self.assertLess(len(queries), 15)
+
+    def test_warehouse_adjusts_location_and_aggregate(self):
+        warehouse = Warehouse.objects.create(name="Cali", code="clo", city="Cali", department="Valle")
+        res = self.client.post(self.url, {
+            "warehouse": "clo", "items": [{"sku": "BULK-A", "quantity": 4}],
+        }, format="json")
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.data["created"], 1)
+        self.assertEqual(StockLocation.objects.get(warehouse=warehouse).quantity, 4)
+        self.a.refresh_from_db()
+        self.assertEqual(self.a.quantity, 4)
+
+        # Con ubicaciones, el ajuste directo sobre Stock se rechaza
+        res = self.client.post(self.url, {"items": [{"sku": "BULK-A", "quantity": 1}]}, format="json")
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+
+# ══════════════════════════════════════════════════════════════════════════════
+# Pronóstico de demanda
+# ══════════════════════════════════════════════════════════════════════════════
+
+def sell(stock, qty, days_ago):
+    order = make_order()
+    Order.objects.filter(pk=order.pk).update(
+        status=Order.Status.PAID, created_at=timezone.now() - timedelta(days=days_ago)
+    )
+    OrderItem.objects.create(
+        order=order, variant=stock.variant, product_name="Labial", variant_name="Tono",
+        sku=stock.variant.sku, unit_price=Decimal("50000"), quantity=qty,
+        subtotal=Decimal("50000") * qty,
+    )
+
+
+class DemandForecastTest(TestCase):
+
+    def test_exponential_smoothing_matches_recursive_definition(self):
+        rng = random.Random(7)
+        matrix = [[rng.randint(0, 9) for _ in range(30)] for _ in range(4)]
+        alpha = forecast.SMOOTHING_ALPHA
+        expected = []
+        for row in matrix:
+            level = row[0]
+            for x in row[1:]:
+                level = alpha * x + (1 - alpha) * level
+            expected.append(level)
+
+        result = forecast.exponential_smoothing(np.array(matrix, dtype=float))
+        for got, want in zip(result, expected):
+            self.assertAlmostEqual(got, want)
+
+    def test_refresh_forecasts_stores_metrics(self):
+        selling = make_stock("FC-A", qty=10)
+        idle = make_stock("FC-B", qty=10, product=selling.variant.product)
+        for days_ago in range(1, 8):
+            sell(selling, 2, days_ago)
+
+        self.assertEqual(forecast.refresh_forecasts(), 2)
+        self.assertEqual(forecast.refresh_forecasts(), 2)  # upsert idempotente
+
+        selling_fc = DemandForecast.objects.get(variant=selling.variant)
+        self.assertAlmostEqual(selling_fc.moving_average_7, 2.0)
+        self.assertGreater(selling_fc.reorder_quantity, 0)
+        self.assertIsNotNone(selling_fc.days_of_cover)
+
+        idle_fc = DemandForecast.objects.get(variant=idle.variant)
+        self.assertIsNone(idle_fc.days_of_cover)
+        self.assertEqual(idle_fc.reorder_quantity, 0)
+
+
+class DemandForecastAPITest(APITestCase):
+
+    def setUp(self):
+        self.client.force_authenticate(user=make_admin())
+        self.selling = make_stock("FC-API-A", qty=10)
+        make_stock("FC-API-B", qty=10, product=self.selling.variant.product)
+        for days_ago in range(1, 8):
+            sell(self.selling, 3, days_ago)
+        forecast.refresh_forecasts()
 
-# Create your tests here.
+    def test_filter_variants_to_reorder(self):
+        res = self.client.get(
+            "/api/inventory/stock/?variant__demand_forecast__reorder_quantity__gt=0"
+            "&ordering=-variant__demand_forecast__reorder_quantity"
+        )
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual([r["variant_sku"] for r in res.data["results"]], ["FC-API-A"])
+        self.assertGreater(res.data["results"][0]["forecast"]["reorder_quantity"], 0)
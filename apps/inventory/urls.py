@@ -1,11 +1,12 @@
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
 
-from .views import StockViewSet
+from .views import StockViewSet, availability_stream
 
 router = DefaultRouter()
 router.register("stock", StockViewSet, basename="stock")
 
 urlpatterns = [
+    path("stream/", availability_stream, name="inventory-stream"),
     path("", include(router.urls)),
 ]
\ No newline at end of file
@@ -1,10 +1,25 @@
+import asyncio
+import json
+import uuid
+
+from asgiref.sync import sync_to_async
+from django.http import JsonResponse, StreamingHttpResponse
 from rest_framework import viewsets, mixins
 from rest_framework.permissions import IsAdminUser
 from rest_framework.decorators import action
 from rest_framework.response import Response
+from rest_framework import status
+from rest_framework.exceptions import ValidationError as DRFValidationError
+from django.core.exceptions import ValidationError
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
 
-from .models import Stock
-from .serializers import StockSerializer
+from . import ledger, realtime
+from .adjustments import HOT_VARIANT_ERROR, bulk_adjust, parse_csv
+from .models import Stock, StockMovement
+from .serializers import BulkAdjustSerializer, StockSerializer, StockMovementSerializer
 
 
 class StockViewSet(
@@ -14,28 +29,199 @@ class StockViewSet(
     viewsets.GenericViewSet,
 ):
     """
-    GET  /api/inventory/stock/              → Lista todo el stock
+    GET  /api/inventory/stock/              → Lista todo el stock (con pronóstico de demanda)
+         ?ordering=-variant__demand_forecast__reorder_quantity
+         ?variant__demand_forecast__reorder_quantity__gt=0  → Variantes a reabastecer
     GET  /api/inventory/stock/{id}/         → Stock de una variante
     PATCH /api/inventory/stock/{id}/        → Ajustar stock manualmente
-    GET  /api/inventory/stock/low-stock/    → Variantes con stock bajo
+    GET  /api/inventory/stock/low-stock/    → Variantes con stock bajo (paginado)
+    GET  /api/inventory/stock/{id}/movements/           → Ledger de movimientos
+    GET  /api/inventory/stock/{id}/history/?at=FECHA    → Stock en una fecha pasada
+    POST /api/inventory/stock/bulk-adjust/  → Ajuste masivo (conteo físico, JSON o CSV)
     """
     queryset = Stock.objects.select_related(
-        "variant__product"
+        "variant__product", "variant__demand_forecast"
     ).order_by("quantity")
     serializer_class = StockSerializer
     permission_classes = [IsAdminUser]
+    filterset_fields = {
+        "is_hot": ["exact"],
+        "variant__demand_forecast__reorder_quantity": ["gt", "gte"],
+        "variant__demand_forecast__days_of_cover": ["lte"],
+    }
+    ordering_fields = [
+        "quantity", "reserved",
+        "variant__demand_forecast__daily_demand",
+        "variant__demand_forecast__days_of_cover",
+        "variant__demand_forecast__reorder_quantity",
+    ]
+
+    @transaction.atomic
+    def perform_update(self, serializer):
+        # Fila bloqueada: el delta del ledger sale del valor vigente (ver ledger.take_snapshots)
+        stock = Stock.objects.select_for_update().get(pk=serializer.instance.pk)
+        if stock.is_hot:
+            # El disponible vive en Redis: ajustar la fila dejaría el contador desfasado
+            raise DRFValidationError({"detail": HOT_VARIANT_ERROR})
+        previous = stock.quantity
+        serializer.instance = stock
+        stock = serializer.save()
+        ledger.record(
+            stock.variant_id,
+            StockMovement.Kind.ADJUST,
+            quantity_delta=stock.quantity - previous,
+            reference=f"admin:{self.request.user.pk}",
+        )
 
     @action(detail=False, methods=["get"], url_path="low-stock")
     def low_stock(self, request):
         """
         Retorna variantes cuyo stock disponible está por debajo
         del low_stock_threshold o agotadas.
+
+        El filtro se resuelve en SQL (índice parcial inventory_stock_low_idx).
+        ?ordering=days_of_cover → ordena por días de cobertura (ventas últimos 30 días).
         """
-        qs = self.get_queryset()
-        # Filtramos en Python usando las properties del modelo
-        low = [s for s in qs if s.is_low_stock or s.is_out_of_stock]
-        serializer = self.get_serializer(low, many=True)
+        qs = self.get_queryset().low_stock()
+        if request.query_params.get("ordering") == "days_of_cover":
+            qs = qs.with_days_of_cover().order_by(
+                F("days_of_cover").asc(nulls_last=True), "quantity"
+            )
+
+        page = self.paginate_queryset(qs)
+        if page is not None:
+            serializer = self.get_serializer(page, many=True)
+            return self.get_paginated_response(serializer.data)
+
+        serializer = self.get_serializer(qs, many=True)
         return Response({
-            "count": len(low),
+            "count": len(serializer.data),
             "results": serializer.data
-        })
\ No newline at end of file
+        })
+
+
+    @action(detail=False, methods=["post"], url_path="bulk-adjust")
+    def bulk_adjust(self, request):
+        """
+        Ajusta el stock de muchos SKUs en una sola transacción.
+
+        JSON: {"warehouse": "bog", "items": [{"sku": "X", "quantity": 10}, {"sku": "Y", "delta": -2}]}
+        CSV:  multipart con `file` (columnas sku,quantity,delta) y `warehouse` opcional.
+        Retorna el reporte de cambios (before/after por SKU) y los SKUs no encontrados.
+        """
+        upload = request.FILES.get("file")
+        if upload is not None:
+            data = {"items": parse_csv(upload.read())}
+            if request.data.get("warehouse"):
+                data["warehouse"] = request.data["warehouse"]
+        else:
+            data = request.data
+
+        serializer = BulkAdjustSerializer(data=data)
+        serializer.is_valid(raise_exception=True)
+        try:
+            report = bulk_adjust(
+                serializer.validated_data["items"],
+                warehouse=serializer.validated_data.get("warehouse"),
+                reference=f"bulk:{request.user.pk}",
+            )
+        except ValidationError as e:
+            return Response({"errors": e.message_dict}, status=status.HTTP_400_BAD_REQUEST)
+        return Response(report)
+
+    @action(detail=True, methods=["get"])
+    def movements(self, request, pk=None):
+        """Movimientos del ledger de esta variante, del más reciente al más antiguo."""
+        stock = self.get_object()
+        qs = StockMovement.objects.filter(variant_id=stock.variant_id).order_by("-id")
+        page = self.paginate_queryset(qs)
+        if page is not None:
+            serializer = StockMovementSerializer(page, many=True)
+            return self.get_paginated_response(serializer.data)
+        return Response(StockMovementSerializer(qs, many=True).data)
+
+    @action(detail=True, methods=["get"])
+    def history(self, request, pk=None):
+        """
+        GET /api/inventory/stock/{id}/history/?at=2026-05-01
+        Acepta fecha (fin de ese día, hora local) o datetime ISO.
+        """
+        stock = self.get_object()
+        raw = request.query_params.get("at", "")
+        try:
+            day = parse_date(raw)
+            at = (
+                timezone.datetime.combine(day, timezone.datetime.max.time())
+                if day else parse_datetime(raw)
+            )
+        except ValueError:
+            at = None
+        if at is None:
+            return Response(
+                {"detail": "Parámetro 'at' inválido. Usa YYYY-MM-DD o ISO 8601."},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        if timezone.is_naive(at):
+            at = timezone.make_aware(at)
+
+        data = ledger.stock_at(stock.variant_id, at)
+        return Response({
+            "variant_sku": stock.variant.sku,
+            "at": at.isoformat(),
+            **data,
+        })
+
+
+# ─── Stream de disponibilidad (SSE) ────────────────────────────────────────
+
+MAX_STREAM_VARIANTS = 50
+HEARTBEAT_SECONDS = 15
+
+
+def _sse(payload: dict) -> str:
+    return f"event: availability\ndata: {json.dumps(payload)}\n\n"
+
+
+async def availability_stream(request):
+    """
+    GET /api/inventory/stream/?variants=<uuid>,<uuid>,...
+
+    Server-Sent Events con la disponibilidad de las variantes pedidas.
+    Envía primero el estado actual y luego cada cambio, en el formato de
+    check-stock. Vista async: debe servirse con el entry point ASGI
+    (backTiendaMaquillaje/asgi.py) para que las conexiones inactivas no
+    ocupen un worker.
+    """
+    try:
+        variant_ids = list(dict.fromkeys(
+            str(uuid.UUID(v)) for v in request.GET.get("variants", "").split(",") if v.strip()
+        ))
+    except ValueError:
+        variant_ids = None
+    if not variant_ids or len(variant_ids) > MAX_STREAM_VARIANTS:
+        return JsonResponse(
+            {"detail": f"Parámetro 'variants' inválido: entre 1 y {MAX_STREAM_VARIANTS} UUIDs separados por coma."},
+            status=400,
+        )
+
+    async def events():
+        # Suscribirse antes de leer el estado actual para no perder cambios intermedios
+        queue = realtime.broadcaster.subscribe(variant_ids)
+        try:
+            current = await sync_to_async(realtime.current_availability)(variant_ids)
+            for payload in current.values():
+                yield _sse(payload)
+            while True:
+                try:
+                    payload = await asyncio.wait_for(queue.get(), timeout=HEARTBEAT_SECONDS)
+                except asyncio.TimeoutError:
+                    yield ": ping\n\n"
+                    continue
+                yield _sse(payload)
+        finally:
+            realtime.broadcaster.unsubscribe(variant_ids, queue)
+
+    response = StreamingHttpResponse(events(), content_type="text/event-stream")
+    response["Cache-Control"] = "no-cache"
+    response["X-Accel-Buffering"] = "no"  # nginx: no bufferizar el stream
+    return response
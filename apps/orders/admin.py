@@ -1,6 +1,9 @@
-from django.contrib import admin
+from django.contrib import admin, messages
 from django.utils.html import format_html
-from .models import Order, OrderItem, Refund, RefundItem
+from .models import ArchivedOrder, ArchivedOrderItem, CustomerStats, Order, OrderItem, OrderStatusEvent, Refund, RefundBatch, RefundItem
+from .refund_batches import start_batch, with_progress
+from .search import search_orders
+from .transitions import bulk_transition
 
 
 class OrderItemInline(admin.TabularInline):
@@ -17,6 +20,14 @@ class RefundInline(admin.TabularInline):
     can_delete = False
 
 
+class OrderStatusEventInline(admin.TabularInline):
+    model = OrderStatusEvent
+    extra = 0
+    readonly_fields = ["from_status", "to_status", "created_at"]
+    can_delete = False
+    ordering = ["created_at"]
+
+
 @admin.register(Order)
 class OrderAdmin(admin.ModelAdmin):
     list_display = [
@@ -24,13 +35,14 @@ class OrderAdmin(admin.ModelAdmin):
         "total", "shipping_city", "created_at"
     ]
     list_filter = ["status", "created_at", "shipping_city"]
-    search_fields = ["guest_email", "guest_name", "wompi_reference", "shipping_name"]
+    search_fields = ["wompi_reference"]  # La búsqueda real la hace search_orders()
+    search_help_text = "Email, referencia ORD-..., id de transacción o nombre del cliente."
     readonly_fields = [
         "subtotal", "discount_amount", "shipping_amount", "total",
         "wompi_transaction_id", "wompi_reference", "created_at", "updated_at"
     ]
     ordering = ["-created_at"]
-    inlines = [OrderItemInline, RefundInline]
+    inlines = [OrderItemInline, RefundInline, OrderStatusEventInline]
     actions = ["mark_as_paid", "mark_as_shipped", "mark_as_delivered"]
 
     fieldsets = (
@@ -59,6 +71,9 @@ class OrderAdmin(admin.ModelAdmin):
         }),
     )
 
+    def get_search_results(self, request, queryset, search_term):
+        return search_orders(queryset, search_term), False
+
     def status_badge(self, obj):
         colors = {
             "PENDING_PAYMENT": "#f59e0b",
@@ -78,27 +93,127 @@ class OrderAdmin(admin.ModelAdmin):
         )
     status_badge.short_description = "Estado"
 
+    def _transition(self, request, queryset, new_status):
+        result = bulk_transition([str(pk) for pk in queryset.values_list("pk", flat=True)], new_status)
+        self.message_user(request, f"{len(result.updated)} pedido(s) actualizados.")
+        if result.rejected:
+            self.message_user(
+                request,
+                f"{len(result.rejected)} pedido(s) omitidos por transición inválida.",
+                level=messages.WARNING,
+            )
+
     @admin.action(description="Marcar como Pagado")
     def mark_as_paid(self, request, queryset):
-        queryset.update(status=Order.Status.PAID)
+        self._transition(request, queryset, Order.Status.PAID)
 
     @admin.action(description="Marcar como Enviado")
     def mark_as_shipped(self, request, queryset):
-        queryset.update(status=Order.Status.SHIPPED)
+        self._transition(request, queryset, Order.Status.SHIPPED)
 
     @admin.action(description="Marcar como Entregado")
     def mark_as_delivered(self, request, queryset):
-        queryset.update(status=Order.Status.DELIVERED)
+        self._transition(request, queryset, Order.Status.DELIVERED)
 
 
 @admin.register(Refund)
 class RefundAdmin(admin.ModelAdmin):
-    list_display = ["id", "order", "status", "amount", "processed_at"]
+    list_display = ["id", "order", "status", "amount", "processed_at", "batch"]
     list_filter = ["status"]
-    readonly_fields = ["processed_at", "processed_by"]
+    readonly_fields = ["processed_at", "processed_by", "wompi_refund_id", "failure_reason", "batch"]
     actions = ["approve_refunds"]
 
     @admin.action(description="Aprobar reembolsos seleccionados")
     def approve_refunds(self, request, queryset):
-        for refund in queryset.filter(status=Refund.Status.PENDING):
-            refund.approve()
+        # Se procesan en segundo plano (orders.process_refund_batch)
+        batch, skipped = start_batch(queryset.values_list("pk", flat=True), request.user)
+        if batch is None:
+            self.message_user(request, "Ningún reembolso está en estado PENDING o FAILED.", messages.WARNING)
+            return
+        self.message_user(
+            request,
+            f"Lote {batch.pk}: {batch.total} reembolso(s) en proceso, {len(skipped)} omitido(s).",
+            messages.SUCCESS,
+        )
+
+
+class RefundBatchRefundInline(admin.TabularInline):
+    model = Refund
+    fk_name = "batch"
+    extra = 0
+    fields = ["order", "amount", "status", "wompi_refund_id", "failure_reason", "processed_at"]
+    readonly_fields = fields
+    can_delete = False
+
+    def has_add_permission(self, request, obj=None):
+        return False
+
+
+@admin.register(RefundBatch)
+class RefundBatchAdmin(admin.ModelAdmin):
+    list_display = ["id", "status", "total", "pending", "approved", "failed", "created_by", "created_at", "finished_at"]
+    list_filter = ["status"]
+    readonly_fields = ["status", "total", "created_by", "created_at", "started_at", "finished_at"]
+    inlines = [RefundBatchRefundInline]
+
+    def get_queryset(self, request):
+        return with_progress(super().get_queryset(request))
+
+    @admin.display(description="Pendientes")
+    def pending(self, obj):
+        return obj.pending
+
+    @admin.display(description="Aprobados")
+    def approved(self, obj):
+        return obj.approved
+
+    @admin.display(description="Fallidos")
+    def failed(self, obj):
+        return obj.failed
+
+    def has_add_permission(self, request):
+        return False
+
+
+@admin.register(CustomerStats)
+class CustomerStatsAdmin(admin.ModelAdmin):
+    list_display = [
+        "email", "orders_count", "total_spent", "refunded_amount",
+        "last_order_at", "segment", "recency_score", "frequency_score", "monetary_score",
+    ]
+    list_filter = ["segment"]
+    search_fields = ["email"]
+    ordering = ["-total_spent"]
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+
+class ArchivedOrderItemInline(admin.TabularInline):
+    model = ArchivedOrderItem
+    extra = 0
+    readonly_fields = ["product_name", "variant_name", "sku", "unit_price", "quantity", "subtotal", "refunded_quantity"]
+    fields = readonly_fields
+    can_delete = False
+
+
+@admin.register(ArchivedOrder)
+class ArchivedOrderAdmin(admin.ModelAdmin):
+    list_display = ["id", "status", "guest_email", "total", "created_at", "archived_at"]
+    list_filter = ["status"]
+    search_fields = ["wompi_reference"]
+    search_help_text = "Email, referencia ORD-..., id de transacción o nombre del cliente."
+    ordering = ["-created_at"]
+    inlines = [ArchivedOrderItemInline]
+
+    def get_search_results(self, request, queryset, search_term):
+        return search_orders(queryset, search_term), False
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
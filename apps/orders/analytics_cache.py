@@ -0,0 +1,81 @@
+"""
+Caché de los endpoints de analytics.
+
+La clave de cada respuesta combina el endpoint, los parámetros normalizados
+(presets ya resueltos a fechas concretas) y la versión de cada día que cubre.
+Cuando se refresca el slice de un día (rollups.refresh_slice) se incrementa
+la versión de ese día: solo se invalidan las respuestas que lo incluyen, así
+que "hoy" se recalcula tras cada cambio y los rangos históricos salen de caché.
+
+  analytics:day:{YYYY-MM-DD}  → versión de los hechos de ese día
+  analytics:facts             → versión global (endpoints sin rango de fechas)
+  analytics:status            → versión de los conteos por estado (stats)
+"""
+from __future__ import annotations
+
+import hashlib
+import json
+from datetime import date, timedelta
+
+from django.conf import settings
+from django.core.cache import cache
+
+PREFIX = "analytics"
+FACTS_VERSION = f"{PREFIX}:facts"
+STATUS_VERSION = f"{PREFIX}:status"
+
+
+def _day_key(day: date) -> str:
+    return f"{PREFIX}:day:{day.isoformat()}"
+
+
+def _bump(keys) -> None:
+    for key in keys:
+        cache.add(key, 0, timeout=None)
+        try:
+            cache.incr(key)
+        except ValueError:  # Expulsada entre add e incr
+            cache.set(key, 1, timeout=None)
+
+
+def bump_days(days) -> None:
+    """Invalida las respuestas que cubren alguno de los días."""
+    _bump([_day_key(day) for day in days] + [FACTS_VERSION])
+
+
+def bump_status() -> None:
+    """Invalida los conteos por estado."""
+    _bump([STATUS_VERSION])
+
+
+def _days_in(ranges) -> list[date]:
+    days = set()
+    for first, last in ranges:
+        day = first
+        while day <= last:
+            days.add(day)
+            day += timedelta(days=1)
+    return sorted(days)
+
+
+def cache_key(endpoint: str, params: dict, ranges=(), versions=()) -> str:
+    """
+    ranges: [(primer_día, último_día), ...] que cubre la respuesta.
+    versions: claves de versión globales de las que depende (FACTS_VERSION, STATUS_VERSION).
+    """
+    keys = [_day_key(day) for day in _days_in(ranges)] + list(versions)
+    current = cache.get_many(keys) if keys else {}
+    payload = json.dumps(
+        {"params": params, "versions": [current.get(k, 0) for k in keys]},
+        sort_keys=True, default=str,
+    )
+    digest = hashlib.sha1(payload.encode()).hexdigest()
+    return f"{PREFIX}:{endpoint}:{digest}"
+
+
+def get(key: str):
+    return cache.get(key)
+
+
+def store(key: str, data) -> None:
+    cache.set(key, data, timeout=getattr(settings, "ANALYTICS_CACHE_TIMEOUT", 60 * 60 * 24))
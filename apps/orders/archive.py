@@ -0,0 +1,129 @@
+"""
+Archivo de pedidos cerrados.
+
+archive_closed_orders() mueve por lotes los pedidos DELIVERED, CANCELLED y
+REFUNDED sin cambios en ORDER_ARCHIVE_AFTER_DAYS y sin reembolsos abiertos
+a las tablas Archived* (con sus ítems, reembolsos e historial de estados) y
+los borra de las tablas transaccionales. Cada lote es una transacción: un
+pedido está en orders_orders o en orders_archived_orders, nunca en ambas.
+
+Lo que necesita el histórico completo lee las dos tablas: tablas de hechos
+(rollups.py), caché columnar (pivot.py), agregados por cliente
+(customers.py), la serie por hora y el conteo filtrado de pedidos de
+analytics, compra verificada de reseñas y el historial del cliente en la API
+("mis pedidos" en /api/orders/, /api/orders/archived/ y el detalle).
+"""
+from __future__ import annotations
+
+import logging
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from . import analytics_cache
+from .models import (
+    ArchivedOrder, ArchivedOrderItem, ArchivedRefund, Order, OrderItem,
+    OrderStatusEvent, Refund, RefundItem,
+)
+
+logger = logging.getLogger(__name__)
+
+ARCHIVE_STATUSES = [Order.Status.DELIVERED, Order.Status.CANCELLED, Order.Status.REFUNDED]
+# Un reembolso en otro estado todavía se puede aprobar o procesar: su pedido no se archiva
+CLOSED_REFUND_STATUSES = [Refund.Status.APPROVED, Refund.Status.REJECTED]
+
+
+def sources(apps) -> list[tuple]:
+    """
+    [(pedidos, ítems, reembolsos)] a consultar para el histórico completo:
+    los modelos transaccionales y los de archivo. Las migraciones anteriores
+    a las tablas de archivo solo tienen los transaccionales.
+    """
+    names = [("Order", "OrderItem", "Refund"), ("ArchivedOrder", "ArchivedOrderItem", "ArchivedRefund")]
+    models = []
+    for group in names:
+        try:
+            models.append(tuple(apps.get_model("orders", name) for name in group))
+        except LookupError:
+            pass
+    return models
+
+
+def _copy(instance, model, **extra):
+    """Instancia de `model` con los campos homónimos de `instance`."""
+    values = {
+        field.attname: getattr(instance, field.attname)
+        for field in model._meta.concrete_fields
+        if field.attname not in extra and hasattr(instance, field.attname)
+    }
+    return model(**values, **extra)
+
+
+@transaction.atomic
+def archive_batch(cutoff, batch_size: int | None = None) -> int:
+    """Archiva hasta batch_size pedidos cerrados antes de `cutoff`. Retorna cuántos."""
+    batch_size = batch_size or settings.ORDER_ARCHIVE_BATCH_SIZE
+    open_refunds = Refund.objects.exclude(status__in=CLOSED_REFUND_STATUSES).values("order_id")
+    orders = list(
+        Order.objects.select_for_update(skip_locked=True)
+        .filter(status__in=ARCHIVE_STATUSES, updated_at__lt=cutoff)
+        .exclude(pk__in=open_refunds)
+        .order_by("updated_at")[:batch_size]
+    )
+    if not orders:
+        return 0
+    ids = [order.pk for order in orders]
+
+    history = {}
+    for order_id, from_status, to_status, at in (
+        OrderStatusEvent.objects.filter(order_id__in=ids)
+        .order_by("created_at", "id")
+        .values_list("order_id", "from_status", "to_status", "created_at")
+    ):
+        history.setdefault(order_id, []).append(
+            {"from": from_status, "to": to_status, "at": at.isoformat()}
+        )
+    refund_items = {}
+    for refund_id, order_item_id, quantity, reason in (
+        RefundItem.objects.filter(refund__order_id__in=ids)
+        .values_list("refund_id", "order_item_id", "quantity", "reason")
+    ):
+        refund_items.setdefault(refund_id, []).append(
+            {"order_item": str(order_item_id), "quantity": quantity, "reason": reason}
+        )
+
+    now = timezone.now()
+    ArchivedOrder.objects.bulk_create([
+        _copy(order, ArchivedOrder, status_history=history.get(order.pk, []), archived_at=now)
+        for order in orders
+    ])
+    ArchivedOrderItem.objects.bulk_create([
+        _copy(item, ArchivedOrderItem) for item in OrderItem.objects.filter(order_id__in=ids)
+    ])
+    ArchivedRefund.objects.bulk_create([
+        _copy(refund, ArchivedRefund, items=refund_items.get(refund.pk, []))
+        for refund in Refund.objects.filter(order_id__in=ids)
+    ])
+
+    # Reembolsos protegen a pedidos e ítems: se borran primero
+    RefundItem.objects.filter(refund__order_id__in=ids).delete()
+    Refund.objects.filter(order_id__in=ids).delete()
+    Order.objects.filter(pk__in=ids).delete()  # Ítems, eventos, reservas y asignaciones en cascada
+    transaction.on_commit(analytics_cache.bump_status)
+    return len(ids)
+
+
+def archive_closed_orders(now=None) -> int:
+    """Archiva todos los pedidos cerrados más viejos que ORDER_ARCHIVE_AFTER_DAYS."""
+    cutoff = (now or timezone.now()) - timedelta(days=settings.ORDER_ARCHIVE_AFTER_DAYS)
+    total = 0
+    while True:
+        archived = archive_batch(cutoff)
+        total += archived
+        if archived < settings.ORDER_ARCHIVE_BATCH_SIZE:
+            break
+    if total:
+        logger.info("archive_closed_orders: %d pedidos archivados.", total)
+    return total
@@ -0,0 +1,258 @@
+"""
+Agregados por cliente y segmentación RFM.
+
+CustomerStats tiene una fila por email normalizado (el del usuario o, en
+pedidos de invitado, guest_email). refresh_customers() recalcula solo los
+clientes de los pedidos que cambiaron, así que es idempotente como los
+slices de rollups.py. Se encola al confirmar la transacción cuando un pedido
+entra o sale de COUNTED_STATUSES y cuando se aprueba un reembolso.
+
+score_customers() corre de noche: carga recencia, frecuencia y monto de
+todos los clientes en arreglos NumPy, asigna quintiles (1-5) y el segmento
+con operaciones vectorizadas y guarda el resultado en lotes.
+"""
+from __future__ import annotations
+
+import numpy as np
+from django.apps import apps as django_apps
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, Max, Min, Q, Sum, Value
+from django.db.models.functions import Coalesce, Lower, NullIf, Trim
+from django.utils import timezone
+
+# Pedidos que llegaron a pagarse (los reembolsados siguen contando como compra)
+COUNTED_STATUSES = ["PAID", "PREPARING", "SHIPPED", "DELIVERED", "PARTIALLY_REFUNDED", "REFUNDED"]
+
+SCORE_BATCH_SIZE = 2000
+
+
+def normalize_email(email: str | None) -> str:
+    return (email or "").strip().lower()
+
+
+def customer_email(prefix: str = ""):
+    """Expresión con el email normalizado del cliente de un pedido (o de `prefix`pedido)."""
+    return Lower(Trim(Coalesce(
+        NullIf(f"{prefix}user__email", Value("")),
+        NullIf(f"{prefix}guest_email", Value("")),
+    )))
+
+
+def _narrow(queryset, emails, user_ids, prefix: str = ""):
+    """
+    Acota los pedidos (o `prefix`pedidos) de `emails` con columnas indexadas:
+    user_id y lower(trim(guest_email)). customer_email() se evalúa después,
+    solo sobre ese conjunto, en vez de sobre toda la tabla.
+    """
+    return queryset.annotate(guest_email_norm=Lower(Trim(f"{prefix}guest_email"))).filter(
+        Q(**{f"{prefix}user_id__in": user_ids}) | Q(guest_email_norm__in=emails)
+    )
+
+
+def has_purchased(email: str, product_id, statuses) -> bool:
+    """Si el email (usuario o invitado) compró el producto, en pedidos activos o archivados."""
+    from .archive import sources
+
+    return any(
+        Order.objects.filter(status__in=statuses, items__variant__product_id=product_id)
+        .filter(Q(user__email=email) | Q(guest_email=email))
+        .exists()
+        for Order, _, _ in sources(django_apps)
+    )
+
+
+# ─── Agregados ─────────────────────────────────────────────────────────────
+
+def schedule_refresh_customers(orders) -> None:
+    """Encola (al confirmar la transacción) el recálculo de los clientes de `orders`."""
+    from .tasks import refresh_customer_stats
+
+    order_ids = sorted({str(order.pk) for order in orders})
+    if order_ids:
+        transaction.on_commit(lambda: refresh_customer_stats.delay(order_ids), robust=True)
+
+
+def emails_for_orders(order_ids, apps=django_apps) -> set[str]:
+    Order = apps.get_model("orders", "Order")
+    return set(
+        Order.objects.filter(pk__in=order_ids)
+        .annotate(customer_email=customer_email())
+        .exclude(customer_email=None)
+        .values_list("customer_email", flat=True)
+    )
+
+
+@transaction.atomic
+def refresh_customers(emails, apps=django_apps) -> int:
+    """Recalcula (o borra, si ya no tienen compras) los clientes de `emails`."""
+    from .archive import sources
+
+    CustomerStats = apps.get_model("orders", "CustomerStats")
+    User = apps.get_model(settings.AUTH_USER_MODEL)
+
+    emails = {normalize_email(email) for email in emails} - {""}
+    if not emails:
+        return 0
+    users = dict(
+        User.objects.annotate(normalized=Lower(Trim("email")))
+        .filter(normalized__in=emails)
+        .values_list("normalized", "pk")
+    )
+    user_ids = list(users.values())
+
+    # Pedidos transaccionales y archivados: cada pedido está en una sola tabla
+    totals, refunds = {}, {}
+    for Order, _, Refund in sources(apps):
+        for row in (
+            _narrow(Order.objects, emails, user_ids)
+            .annotate(customer_email=customer_email())
+            .filter(customer_email__in=emails, status__in=COUNTED_STATUSES)
+            .values("customer_email")
+            .annotate(
+                orders_count=Count("id"),
+                total_spent=Sum("total"),
+                first_order_at=Min("created_at"),
+                last_order_at=Max("created_at"),
+            )
+        ):
+            merged = totals.setdefault(row["customer_email"], row)
+            if merged is not row:
+                merged["orders_count"] += row["orders_count"]
+                merged["total_spent"] += row["total_spent"]
+                merged["first_order_at"] = min(merged["first_order_at"], row["first_order_at"])
+                merged["last_order_at"] = max(merged["last_order_at"], row["last_order_at"])
+        for row in (
+            _narrow(Refund.objects, emails, user_ids, prefix="order__")
+            .annotate(customer_email=customer_email("order__"))
+            .filter(customer_email__in=emails, status="APPROVED")
+            .values("customer_email")
+            .annotate(refunds_count=Count("id"), refunded_amount=Sum("amount"))
+        ):
+            merged = refunds.setdefault(row["customer_email"], row)
+            if merged is not row:
+                merged["refunds_count"] += row["refunds_count"]
+                merged["refunded_amount"] += row["refunded_amount"]
+
+    CustomerStats.objects.filter(email__in=emails - totals.keys()).delete()
+    now = timezone.now()
+    CustomerStats.objects.bulk_create(
+        [
+            CustomerStats(
+                email=email,
+                user_id=users.get(email),
+                orders_count=row["orders_count"],
+                total_spent=row["total_spent"] or 0,
+                refunds_count=refunds.get(email, {}).get("refunds_count", 0),
+                refunded_amount=refunds.get(email, {}).get("refunded_amount") or 0,
+                first_order_at=row["first_order_at"],
+                last_order_at=row["last_order_at"],
+                updated_at=now,
+            )
+            for email, row in totals.items()
+        ],
+        update_conflicts=True,
+        unique_fields=["email"],
+        update_fields=[
+            "user", "orders_count", "total_spent", "refunds_count", "refunded_amount",
+            "first_order_at", "last_order_at", "updated_at",
+        ],
+    )
+    return len(totals)
+
+
+def rebuild(apps=django_apps, batch_size: int = 1000) -> int:
+    """Recalcula todos los clientes y borra los que ya no tienen compras."""
+    from .archive import sources
+
+    CustomerStats = apps.get_model("orders", "CustomerStats")
+
+    emails = set()
+    for Order, _, _ in sources(apps):
+        emails.update(
+            Order.objects.filter(status__in=COUNTED_STATUSES)
+            .annotate(customer_email=customer_email())
+            .exclude(customer_email=None)
+            .values_list("customer_email", flat=True)
+            .distinct()
+        )
+    CustomerStats.objects.exclude(email__in=emails).delete()
+    ordered = sorted(emails)
+    for i in range(0, len(ordered), batch_size):
+        refresh_customers(ordered[i:i + batch_size], apps=apps)
+    return len(ordered)
+
+
+# ─── RFM ───────────────────────────────────────────────────────────────────
+
+def quintile_scores(values: np.ndarray) -> np.ndarray:
+    """Puntaje 1-5 según el quintil de cada valor; los empates reciben el mismo puntaje."""
+    if not len(values):
+        return np.empty(0, dtype=np.int16)
+    ordered = np.sort(values)
+    below = np.searchsorted(ordered, values, side="left")
+    up_to = np.searchsorted(ordered, values, side="right")
+    percentile = (below + up_to) / (2 * len(values))
+    return np.clip(np.ceil(percentile * 5), 1, 5).astype(np.int16)
+
+
+def segments(recency: np.ndarray, frequency: np.ndarray, monetary: np.ndarray, orders: np.ndarray) -> np.ndarray:
+    """Segmento de cada cliente a partir de sus puntajes (la primera regla que cumple)."""
+    from .models import CustomerStats
+
+    Segment = CustomerStats.Segment
+    rules = [
+        ((recency >= 4) & (frequency >= 4) & (monetary >= 4), Segment.CHAMPIONS),
+        ((recency >= 3) & (frequency >= 4), Segment.LOYAL),
+        ((recency >= 4) & (orders == 1), Segment.NEW),
+        ((recency <= 2) & (frequency >= 3), Segment.AT_RISK),
+        (recency == 1, Segment.LAPSED),
+        (recency >= 3, Segment.PROMISING),
+    ]
+    return np.select(
+        [condition for condition, _ in rules],
+        [str(segment) for _, segment in rules],
+        default=str(Segment.REGULAR),
+    )
+
+
+def score_customers(now=None) -> int:
+    """Recalcula puntajes RFM y segmento de todos los clientes."""
+    from .models import CustomerStats
+
+    now = now or timezone.now()
+    rows = list(CustomerStats.objects.values_list(
+        "pk", "orders_count", "total_spent", "refunded_amount", "last_order_at",
+    ))
+    if not rows:
+        return 0
+
+    pks = [row[0] for row in rows]
+    orders = np.array([row[1] for row in rows], dtype=np.int64)
+    net_spent = np.array([float(row[2] - row[3]) for row in rows], dtype=np.float64)
+    days_since = np.array(
+        [(now - row[4]).total_seconds() / 86400 for row in rows], dtype=np.float64
+    )
+
+    recency = quintile_scores(-days_since)  # Más reciente → puntaje más alto
+    frequency = quintile_scores(orders)
+    monetary = quintile_scores(net_spent)
+    segment = segments(recency, frequency, monetary, orders)
+
+    for start in range(0, len(pks), SCORE_BATCH_SIZE):
+        batch = range(start, min(start + SCORE_BATCH_SIZE, len(pks)))
+        CustomerStats.objects.bulk_update(
+            [
+                CustomerStats(
+                    pk=pks[i],
+                    recency_score=int(recency[i]),
+                    frequency_score=int(frequency[i]),
+                    monetary_score=int(monetary[i]),
+                    segment=str(segment[i]),
+                    scored_at=now,
+                )
+                for i in batch
+            ],
+            ["recency_score", "frequency_score", "monetary_score", "segment", "scored_at"],
+        )
+    return len(pks)
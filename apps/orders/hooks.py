@@ -0,0 +1,39 @@
+"""
+Reacciones a los cambios de estado de un pedido.
+
+Order.save() llama a order_status_changed() cada vez que el estado guardado
+difiere del que tenía al cargarse. Las actualizaciones masivas con
+QuerySet.update() no pasan por aquí: quien las haga debe llamar a
+orders_status_changed() con los pedidos actualizados.
+"""
+from __future__ import annotations
+
+
+def order_status_changed(order, previous: str | None, new: str) -> None:
+    orders_status_changed([(order, previous)], new)
+
+
+def orders_status_changed(changes, new: str) -> None:
+    """changes: [(pedido, estado anterior)] que pasaron a `new`."""
+    from django.db import transaction
+
+    from . import analytics_cache
+    from .customers import COUNTED_STATUSES, schedule_refresh_customers
+    from .latency import record_transitions
+    from .models import Order
+    from .rollups import schedule_refresh_slices
+
+    record_transitions(changes, new)
+    transaction.on_commit(analytics_cache.bump_status)
+
+    # Las tablas de hechos solo cuentan pedidos DELIVERED
+    schedule_refresh_slices([
+        order for order, previous in changes
+        if Order.Status.DELIVERED in (previous, new)
+    ])
+
+    # Los agregados por cliente cambian al entrar o salir de COUNTED_STATUSES
+    schedule_refresh_customers([
+        order for order, previous in changes
+        if (previous in COUNTED_STATUSES) != (new in COUNTED_STATUSES)
+    ])
@@ -0,0 +1,136 @@
+"""
+Historial de estados y latencias de despacho.
+
+record_transitions() escribe un OrderStatusEvent por pedido y, si la
+transición cierra una etapa (PAID→SHIPPED, SHIPPED→DELIVERED,
+PAID→DELIVERED), suma la latencia al histograma FulfillmentLatencyBucket de
+su semana y departamento. Los percentiles se calculan del histograma, sin
+recorrer los eventos.
+"""
+from __future__ import annotations
+
+import bisect
+from collections import Counter, defaultdict
+from datetime import date, timedelta
+
+from django.db import IntegrityError, transaction
+from django.db.models import F, Max
+from django.utils import timezone
+
+from .models import FulfillmentLatencyBucket, Order, OrderStatusEvent
+
+# Límite superior (en horas) de cada bucket; el último bucket es "más de 14 días"
+BUCKET_EDGES = [0.5, 1, 2, 4, 8, 12, 16, 24, 36, 48, 72, 96, 120, 168, 240, 336]
+
+Stage = FulfillmentLatencyBucket.Stage
+
+# Estado que cierra la etapa → [(estado que la abre, etapa)]
+STAGE_STARTS = {
+    Order.Status.SHIPPED: [(Order.Status.PAID, Stage.PAID_TO_SHIPPED)],
+    Order.Status.DELIVERED: [
+        (Order.Status.SHIPPED, Stage.SHIPPED_TO_DELIVERED),
+        (Order.Status.PAID, Stage.PAID_TO_DELIVERED),
+    ],
+}
+
+
+def week_of(at) -> date:
+    day = timezone.localdate(at)
+    return day - timedelta(days=day.weekday())
+
+
+def bucket_for(hours: float) -> int:
+    return bisect.bisect_left(BUCKET_EDGES, hours)
+
+
+def record_transitions(changes, new: str, at=None) -> None:
+    """changes: [(pedido, estado anterior)] que pasaron a `new`."""
+    at = at or timezone.now()
+    OrderStatusEvent.objects.bulk_create([
+        OrderStatusEvent(order_id=order.pk, from_status=previous or "", to_status=new, created_at=at)
+        for order, previous in changes
+    ])
+
+    stages = STAGE_STARTS.get(new)
+    if not stages:
+        return
+    started = {
+        (row["order_id"], row["to_status"]): row["at"]
+        for row in OrderStatusEvent.objects
+        .filter(order_id__in=[order.pk for order, _ in changes], to_status__in=[s for s, _ in stages])
+        .values("order_id", "to_status")
+        .annotate(at=Max("created_at"))
+    }
+    week = week_of(at)
+    counts = Counter()
+    for order, _ in changes:
+        for start_status, stage in stages:
+            start = started.get((order.pk, start_status))
+            if start is None:  # Pedido anterior al historial
+                continue
+            hours = (at - start).total_seconds() / 3600
+            counts[(week, order.shipping_department, stage, bucket_for(hours))] += 1
+    _increment(counts)
+
+
+def _increment(counts: Counter) -> None:
+    for (week, department, stage, bucket), n in counts.items():
+        key = {"week": week, "department": department, "stage": stage, "bucket": bucket}
+        rows = FulfillmentLatencyBucket.objects.filter(**key)
+        if rows.update(count=F("count") + n):
+            continue
+        try:
+            with transaction.atomic():
+                FulfillmentLatencyBucket.objects.create(**key, count=n)
+        except IntegrityError:  # Otro proceso la creó primero
+            rows.update(count=F("count") + n)
+
+
+# ─── Percentiles ───────────────────────────────────────────────────────────
+
+def percentile(histogram: list[int], q: float) -> float | None:
+    """Percentil q (0-1) en horas, interpolando dentro del bucket."""
+    total = sum(histogram)
+    if not total:
+        return None
+    target = q * total
+    cumulative = 0
+    for i, count in enumerate(histogram):
+        if count and cumulative + count >= target:
+            lower = BUCKET_EDGES[i - 1] if i else 0
+            upper = BUCKET_EDGES[i] if i < len(BUCKET_EDGES) else lower
+            return round(lower + (upper - lower) * (target - cumulative) / count, 2)
+        cumulative += count
+    return float(BUCKET_EDGES[-1])
+
+
+def summary(weeks: int = 12, department: str | None = None) -> list[dict]:
+    """
+    p50/p95 por semana, etapa y departamento; department=None en una fila
+    significa todos los departamentos.
+    """
+    since = week_of(timezone.now()) - timedelta(weeks=weeks - 1)
+    rows = FulfillmentLatencyBucket.objects.filter(week__gte=since)
+    if department:
+        rows = rows.filter(department__iexact=department)
+
+    histograms = defaultdict(lambda: [0] * (len(BUCKET_EDGES) + 1))
+    for week, dept, stage, bucket, count in rows.values_list(
+        "week", "department", "stage", "bucket", "count"
+    ):
+        histograms[(week, stage, dept)][bucket] += count
+        histograms[(week, stage, None)][bucket] += count
+
+    return [
+        {
+            "week": week.isoformat(),
+            "stage": stage,
+            "department": dept,
+            "count": sum(histogram),
+            "p50_hours": percentile(histogram, 0.5),
+            "p95_hours": percentile(histogram, 0.95),
+        }
+        for (week, stage, dept), histogram in sorted(
+            histograms.items(), key=lambda item: (item[0][0], item[0][1], item[0][2] or "")
+        )
+    ]
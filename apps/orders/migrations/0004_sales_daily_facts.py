@@ -0,0 +1,122 @@
+# Generated by Django 6.0.2 on 2026-10-19 00:25
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def backfill_facts(apps, schema_editor):
+    """Carga inicial de las tablas de hechos con el histórico de pedidos."""
+    from apps.orders.rollups import rebuild
+
+    rebuild(apps=apps)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("catalog", "0002_alter_product_cover_image"),
+        ("orders", "0003_order_guest_email_order_guest_name_alter_order_user"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="OrderDailyFact",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("day", models.DateField()),
+                ("department", models.CharField(max_length=100)),
+                ("orders", models.PositiveIntegerField(default=0)),
+                (
+                    "subtotal",
+                    models.DecimalField(decimal_places=2, default=0, max_digits=14),
+                ),
+                (
+                    "discount_amount",
+                    models.DecimalField(decimal_places=2, default=0, max_digits=14),
+                ),
+                (
+                    "total",
+                    models.DecimalField(decimal_places=2, default=0, max_digits=14),
+                ),
+            ],
+            options={
+                "db_table": "orders_order_daily_facts",
+                "unique_together": {("day", "department")},
+            },
+        ),
+        migrations.CreateModel(
+            name="SalesDailyFact",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("day", models.DateField()),
+                ("department", models.CharField(max_length=100)),
+                ("units", models.PositiveIntegerField(default=0)),
+                (
+                    "revenue",
+                    models.DecimalField(decimal_places=2, default=0, max_digits=14),
+                ),
+                ("orders", models.PositiveIntegerField(default=0)),
+                (
+                    "brand",
+                    models.ForeignKey(
+                        blank=True,
+                        null=True,
+                        on_delete=django.db.models.deletion.SET_NULL,
+                        related_name="+",
+                        to="catalog.brand",
+                    ),
+                ),
+                (
+                    "product",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="+",
+                        to="catalog.product",
+                    ),
+                ),
+                (
+                    "root_category",
+                    models.ForeignKey(
+                        blank=True,
+                        null=True,
+                        on_delete=django.db.models.deletion.SET_NULL,
+                        related_name="+",
+                        to="catalog.category",
+                    ),
+                ),
+                (
+                    "variant",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="+",
+                        to="catalog.variant",
+                    ),
+                ),
+            ],
+            options={
+                "db_table": "orders_sales_daily_facts",
+                "indexes": [
+                    models.Index(
+                        fields=["day", "department"], name="orders_sales_fact_day_idx"
+                    )
+                ],
+            },
+        ),
+        migrations.RunPython(backfill_facts, migrations.RunPython.noop),
+    ]
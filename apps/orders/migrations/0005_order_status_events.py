@@ -0,0 +1,114 @@
+# Generated by Django 6.0.2 on 2026-10-19 00:44
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("orders", "0004_sales_daily_facts"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="FulfillmentLatencyBucket",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("week", models.DateField()),
+                ("department", models.CharField(max_length=100)),
+                (
+                    "stage",
+                    models.CharField(
+                        choices=[
+                            ("paid_to_shipped", "Pagado → Enviado"),
+                            ("shipped_to_delivered", "Enviado → Entregado"),
+                            ("paid_to_delivered", "Pagado → Entregado"),
+                        ],
+                        max_length=25,
+                    ),
+                ),
+                ("bucket", models.PositiveSmallIntegerField()),
+                ("count", models.PositiveIntegerField(default=0)),
+            ],
+            options={
+                "db_table": "orders_fulfillment_latency",
+                "unique_together": {("week", "department", "stage", "bucket")},
+            },
+        ),
+        migrations.CreateModel(
+            name="OrderStatusEvent",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "from_status",
+                    models.CharField(
+                        blank=True,
+                        choices=[
+                            ("PENDING_PAYMENT", "Pendiente de pago"),
+                            ("PAYMENT_PROCESSING", "Procesando pago"),
+                            ("PAID", "Pagado"),
+                            ("PREPARING", "Preparando"),
+                            ("SHIPPED", "Enviado"),
+                            ("DELIVERED", "Entregado"),
+                            ("CANCELLED", "Cancelado"),
+                            ("REFUNDED", "Reembolsado"),
+                            ("PARTIALLY_REFUNDED", "Reembolso parcial"),
+                        ],
+                        max_length=20,
+                    ),
+                ),
+                (
+                    "to_status",
+                    models.CharField(
+                        choices=[
+                            ("PENDING_PAYMENT", "Pendiente de pago"),
+                            ("PAYMENT_PROCESSING", "Procesando pago"),
+                            ("PAID", "Pagado"),
+                            ("PREPARING", "Preparando"),
+                            ("SHIPPED", "Enviado"),
+                            ("DELIVERED", "Entregado"),
+                            ("CANCELLED", "Cancelado"),
+                            ("REFUNDED", "Reembolsado"),
+                            ("PARTIALLY_REFUNDED", "Reembolso parcial"),
+                        ],
+                        max_length=20,
+                    ),
+                ),
+                ("created_at", models.DateTimeField(default=django.utils.timezone.now)),
+                (
+                    "order",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="status_events",
+                        to="orders.order",
+                    ),
+                ),
+            ],
+            options={
+                "db_table": "orders_status_events",
+                "indexes": [
+                    models.Index(
+                        fields=["order", "to_status"], name="orders_status_event_idx"
+                    )
+                ],
+            },
+        ),
+    ]
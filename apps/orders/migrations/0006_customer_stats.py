@@ -0,0 +1,103 @@
+# Generated by Django 6.0.2 on 2026-10-19 00:49
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+def backfill_customers(apps, schema_editor):
+    """Carga inicial de los agregados por cliente con el histórico de pedidos."""
+    from apps.orders.customers import rebuild
+
+    rebuild(apps=apps)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("orders", "0005_order_status_events"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="CustomerStats",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("email", models.CharField(max_length=254, unique=True)),
+                ("orders_count", models.PositiveIntegerField(default=0)),
+                (
+                    "total_spent",
+                    models.DecimalField(decimal_places=2, default=0, max_digits=14),
+                ),
+                ("refunds_count", models.PositiveIntegerField(default=0)),
+                (
+                    "refunded_amount",
+                    models.DecimalField(decimal_places=2, default=0, max_digits=14),
+                ),
+                ("first_order_at", models.DateTimeField()),
+                ("last_order_at", models.DateTimeField()),
+                ("updated_at", models.DateTimeField(auto_now=True)),
+                (
+                    "recency_score",
+                    models.PositiveSmallIntegerField(blank=True, null=True),
+                ),
+                (
+                    "frequency_score",
+                    models.PositiveSmallIntegerField(blank=True, null=True),
+                ),
+                (
+                    "monetary_score",
+                    models.PositiveSmallIntegerField(blank=True, null=True),
+                ),
+                (
+                    "segment",
+                    models.CharField(
+                        blank=True,
+                        choices=[
+                            ("champions", "Campeones"),
+                            ("loyal", "Leales"),
+                            ("new", "Nuevos"),
+                            ("promising", "Prometedores"),
+                            ("at_risk", "En riesgo"),
+                            ("lapsed", "Inactivos"),
+                            ("regular", "Regulares"),
+                        ],
+                        max_length=20,
+                    ),
+                ),
+                ("scored_at", models.DateTimeField(blank=True, null=True)),
+                (
+                    "user",
+                    models.ForeignKey(
+                        blank=True,
+                        null=True,
+                        on_delete=django.db.models.deletion.SET_NULL,
+                        related_name="+",
+                        to=settings.AUTH_USER_MODEL,
+                    ),
+                ),
+            ],
+            options={
+                "db_table": "orders_customer_stats",
+                "indexes": [
+                    models.Index(
+                        fields=["segment", "-total_spent"],
+                        name="orders_customer_segment_idx",
+                    ),
+                    models.Index(
+                        fields=["last_order_at"], name="orders_customer_last_idx"
+                    ),
+                ],
+            },
+        ),
+        migrations.RunPython(backfill_customers, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,42 @@
+# Generated by Django 6.0.2 on 2026-10-19 00:52
+
+from django.contrib.postgres.operations import TrigramExtension
+from django.db import migrations
+
+# Índices de apps.orders.search, solo en PostgreSQL. wompi_reference y
+# wompi_transaction_id ya tienen el índice varchar_pattern_ops (_like) que
+# Django crea para los CharField indexados.
+SEARCH_INDEXES = {
+    "orders_guest_email_prefix_idx":
+        "ON orders_orders (lower(guest_email) text_pattern_ops)",
+    "orders_guest_name_trgm_idx":
+        "ON orders_orders USING gin (guest_name gin_trgm_ops)",
+    "orders_shipping_name_trgm_idx":
+        "ON orders_orders USING gin (shipping_name gin_trgm_ops)",
+}
+
+
+def create_search_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != "postgresql":
+        return
+    for name, definition in SEARCH_INDEXES.items():
+        schema_editor.execute(f"CREATE INDEX IF NOT EXISTS {name} {definition}")
+
+
+def drop_search_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != "postgresql":
+        return
+    for name in SEARCH_INDEXES:
+        schema_editor.execute(f"DROP INDEX IF EXISTS {name}")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("orders", "0006_customer_stats"),
+    ]
+
+    operations = [
+        TrigramExtension(),
+        migrations.RunPython(create_search_indexes, drop_search_indexes),
+    ]
@@ -0,0 +1,198 @@
+# Generated by Django 6.0.2 on 2026-10-19 00:57
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("catalog", "0002_alter_product_cover_image"),
+        ("orders", "0007_order_search_indexes"),
+        ("promotions", "0001_initial"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="ArchivedOrder",
+            fields=[
+                (
+                    "id",
+                    models.UUIDField(editable=False, primary_key=True, serialize=False),
+                ),
+                (
+                    "status",
+                    models.CharField(
+                        choices=[
+                            ("PENDING_PAYMENT", "Pendiente de pago"),
+                            ("PAYMENT_PROCESSING", "Procesando pago"),
+                            ("PAID", "Pagado"),
+                            ("PREPARING", "Preparando"),
+                            ("SHIPPED", "Enviado"),
+                            ("DELIVERED", "Entregado"),
+                            ("CANCELLED", "Cancelado"),
+                            ("REFUNDED", "Reembolsado"),
+                            ("PARTIALLY_REFUNDED", "Reembolso parcial"),
+                        ],
+                        max_length=30,
+                    ),
+                ),
+                ("guest_email", models.EmailField(blank=True, max_length=254)),
+                ("guest_name", models.CharField(blank=True, max_length=255)),
+                (
+                    "subtotal",
+                    models.DecimalField(decimal_places=2, default=0, max_digits=12),
+                ),
+                (
+                    "discount_amount",
+                    models.DecimalField(decimal_places=2, default=0, max_digits=12),
+                ),
+                (
+                    "shipping_amount",
+                    models.DecimalField(decimal_places=2, default=0, max_digits=12),
+                ),
+                (
+                    "total",
+                    models.DecimalField(decimal_places=2, default=0, max_digits=12),
+                ),
+                ("shipping_name", models.CharField(max_length=255)),
+                ("shipping_address", models.TextField()),
+                ("shipping_city", models.CharField(max_length=100)),
+                ("shipping_department", models.CharField(max_length=100)),
+                ("shipping_postal_code", models.CharField(blank=True, max_length=20)),
+                ("shipping_phone", models.CharField(max_length=20)),
+                ("wompi_transaction_id", models.CharField(blank=True, max_length=100)),
+                ("wompi_reference", models.CharField(max_length=100, unique=True)),
+                ("notes", models.TextField(blank=True)),
+                ("status_history", models.JSONField(blank=True, default=list)),
+                ("created_at", models.DateTimeField()),
+                ("updated_at", models.DateTimeField()),
+                (
+                    "archived_at",
+                    models.DateTimeField(default=django.utils.timezone.now),
+                ),
+                (
+                    "coupon",
+                    models.ForeignKey(
+                        blank=True,
+                        null=True,
+                        on_delete=django.db.models.deletion.SET_NULL,
+                        related_name="+",
+                        to="promotions.coupon",
+                    ),
+                ),
+                (
+                    "user",
+                    models.ForeignKey(
+                        blank=True,
+                        null=True,
+                        on_delete=django.db.models.deletion.PROTECT,
+                        related_name="archived_orders",
+                        to=settings.AUTH_USER_MODEL,
+                    ),
+                ),
+            ],
+            options={
+                "db_table": "orders_archived_orders",
+                "ordering": ["-created_at"],
+            },
+        ),
+        migrations.CreateModel(
+            name="ArchivedOrderItem",
+            fields=[
+                (
+                    "id",
+                    models.UUIDField(editable=False, primary_key=True, serialize=False),
+                ),
+                ("product_name", models.CharField(max_length=255)),
+                ("variant_name", models.CharField(max_length=255)),
+                ("sku", models.CharField(max_length=100)),
+                ("unit_price", models.DecimalField(decimal_places=2, max_digits=12)),
+                ("quantity", models.PositiveIntegerField()),
+                ("subtotal", models.DecimalField(decimal_places=2, max_digits=12)),
+                ("refunded_quantity", models.PositiveIntegerField(default=0)),
+                ("created_at", models.DateTimeField()),
+                (
+                    "order",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="items",
+                        to="orders.archivedorder",
+                    ),
+                ),
+                (
+                    "variant",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.PROTECT,
+                        related_name="archived_order_items",
+                        to="catalog.variant",
+                    ),
+                ),
+            ],
+            options={
+                "db_table": "orders_archived_order_items",
+            },
+        ),
+        migrations.CreateModel(
+            name="ArchivedRefund",
+            fields=[
+                (
+                    "id",
+                    models.UUIDField(editable=False, primary_key=True, serialize=False),
+                ),
+                (
+                    "status",
+                    models.CharField(
+                        choices=[
+                            ("PENDING", "Pendiente"),
+                            ("APPROVED", "Aprobado"),
+                            ("REJECTED", "Rechazado"),
+                        ],
+                        max_length=20,
+                    ),
+                ),
+                ("reason", models.TextField()),
+                ("amount", models.DecimalField(decimal_places=2, max_digits=12)),
+                ("wompi_refund_id", models.CharField(blank=True, max_length=100)),
+                ("processed_at", models.DateTimeField(blank=True, null=True)),
+                ("items", models.JSONField(blank=True, default=list)),
+                ("created_at", models.DateTimeField()),
+                (
+                    "order",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="refunds",
+                        to="orders.archivedorder",
+                    ),
+                ),
+                (
+                    "processed_by",
+                    models.ForeignKey(
+                        blank=True,
+                        null=True,
+                        on_delete=django.db.models.deletion.SET_NULL,
+                        related_name="+",
+                        to=settings.AUTH_USER_MODEL,
+                    ),
+                ),
+            ],
+            options={
+                "db_table": "orders_archived_refunds",
+            },
+        ),
+        migrations.AddIndex(
+            model_name="archivedorder",
+            index=models.Index(
+                fields=["user", "-created_at"], name="orders_archived_user_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="archivedorder",
+            index=models.Index(
+                fields=["created_at"], name="orders_archived_created_idx"
+            ),
+        ),
+    ]
@@ -0,0 +1,68 @@
+# Generated by Django 6.0.2 on 2026-10-19 01:00
+
+import uuid
+from django.db import migrations, models
+
+
+def fill_idempotency_keys(apps, schema_editor):
+    """Un key distinto por reembolso existente (el default se evalúa una sola vez)."""
+    Refund = apps.get_model("orders", "Refund")
+    refunds = list(Refund.objects.only("pk"))
+    for refund in refunds:
+        refund.idempotency_key = uuid.uuid4()
+    Refund.objects.bulk_update(refunds, ["idempotency_key"], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("orders", "0008_archived_orders"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="refund",
+            name="failure_reason",
+            field=models.TextField(blank=True),
+        ),
+        migrations.AddField(
+            model_name="refund",
+            name="idempotency_key",
+            field=models.UUIDField(null=True, editable=False),
+        ),
+        migrations.RunPython(fill_idempotency_keys, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name="refund",
+            name="idempotency_key",
+            field=models.UUIDField(default=uuid.uuid4, editable=False),
+        ),
+        migrations.AlterField(
+            model_name="archivedrefund",
+            name="status",
+            field=models.CharField(
+                choices=[
+                    ("PENDING", "Pendiente"),
+                    ("PROCESSING", "Procesando"),
+                    ("APPROVED", "Aprobado"),
+                    ("REJECTED", "Rechazado"),
+                    ("FAILED", "Fallido"),
+                ],
+                max_length=20,
+            ),
+        ),
+        migrations.AlterField(
+            model_name="refund",
+            name="status",
+            field=models.CharField(
+                choices=[
+                    ("PENDING", "Pendiente"),
+                    ("PROCESSING", "Procesando"),
+                    ("APPROVED", "Aprobado"),
+                    ("REJECTED", "Rechazado"),
+                    ("FAILED", "Fallido"),
+                ],
+                default="PENDING",
+                max_length=20,
+            ),
+        ),
+    ]
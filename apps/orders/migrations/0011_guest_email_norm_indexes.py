@@ -0,0 +1,35 @@
+# Generated by Django 6.0.2 on 2026-10-19 02:18
+
+import django.db.models.functions.text
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("orders", "0010_refund_batches"),
+        ("promotions", "0001_initial"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="archivedorder",
+            index=models.Index(
+                django.db.models.functions.text.Lower(
+                    django.db.models.functions.text.Trim("guest_email")
+                ),
+                name="orders_archived_guest_idx",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="order",
+            index=models.Index(
+                django.db.models.functions.text.Lower(
+                    django.db.models.functions.text.Trim("guest_email")
+                ),
+                name="orders_guest_email_norm_idx",
+            ),
+        ),
+    ]
@@ -1,8 +1,12 @@
 from __future__ import annotations
 
+from datetime import timedelta
+
 from django.db import models, transaction
+from django.db.models.functions import Lower, Trim
 from django.conf import settings
 from django.core.validators import MinValueValidator
+from django.utils import timezone
 
 from common.models import TimeStampedModel
 from apps.catalog.models import Variant
@@ -21,12 +25,25 @@ class Order(TimeStampedModel):
               parciales o un reembolso total.
     """
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Estado con el que se cargó, para detectar cambios al guardar
+        instance._loaded_status = instance.__dict__.get("status")
+        return instance
+
     def save(self, *args, **kwargs):
         # Genera wompi_reference automáticamente si está vacío
         if not self.wompi_reference:
             self.wompi_reference = f"ORD-{uuid.uuid4().hex[:12].upper()}"
         super().save(*args, **kwargs)
 
+        previous = getattr(self, "_loaded_status", None)
+        if previous != self.status:
+            from .hooks import order_status_changed
+            order_status_changed(self, previous, self.status)
+            self._loaded_status = self.status
+
     class Status(models.TextChoices):
         PENDING_PAYMENT = "PENDING_PAYMENT", "Pendiente de pago"
         PAYMENT_PROCESSING = "PAYMENT_PROCESSING", "Procesando pago"
@@ -38,6 +55,15 @@ class Order(TimeStampedModel):
         REFUNDED = "REFUNDED", "Reembolsado"
         PARTIALLY_REFUNDED = "PARTIALLY_REFUNDED", "Reembolso parcial"
 
+    # Estados en los que las unidades cuentan como vendidas
+    SOLD_STATUSES = [
+        Status.PAID,
+        Status.PREPARING,
+        Status.SHIPPED,
+        Status.DELIVERED,
+        Status.PARTIALLY_REFUNDED,
+    ]
+
     user = models.ForeignKey(
         settings.AUTH_USER_MODEL,
         on_delete=models.PROTECT,
@@ -83,6 +109,10 @@ class Order(TimeStampedModel):
     class Meta:
         db_table = "orders_orders"
         ordering = ["-created_at"]
+        indexes = [
+            # Acota refresh_customers() para invitados (ver customers._narrow)
+            models.Index(Lower(Trim("guest_email")), name="orders_guest_email_norm_idx"),
+        ]
 
     def __str__(self) -> str:
         email = self.user.email if self.user else self.guest_email
@@ -99,8 +129,16 @@ class Order(TimeStampedModel):
         }
         if self.status not in cancellable_statuses:
             raise ValueError(f"No se puede cancelar un pedido en estado '{self.status}'.")
-        for item in self.items.select_related("variant__stock").all():
-            item.variant.stock.release_reservation(item.quantity)
+        from apps.inventory.allocation import release_allocations
+        from apps.inventory.ledger import movement_batch
+        from apps.inventory.reservations import release_reservations
+        # Pedidos pendientes: se liberan sus reservas vivas. Los que ya no
+        # tienen (pagados) conservan la liberación por ítem.
+        if not release_reservations([self.pk]):
+            with movement_batch():
+                for item in self.items.select_related("variant__stock").all():
+                    item.variant.stock.release_reservation(item.quantity, reference=self.wompi_reference)
+        release_allocations([self.pk])
         self.status = self.Status.CANCELLED
         self.save(update_fields=["status", "updated_at"])
 
@@ -145,15 +183,24 @@ class Refund(TimeStampedModel):
 
     Flujo:
       1. Se crea Refund con estado PENDING.
-      2. Se procesa el reembolso en Wompi.
-      3. Si exitoso → status=APPROVED → se llama approve().
-      4. Se actualiza el estado del Order (REFUNDED o PARTIALLY_REFUNDED).
+      2. approve() lo pasa a PROCESSING y encola orders.process_refund
+         (varios a la vez: RefundBatch, ver refund_batches.py).
+      3. La tarea llama a Wompi fuera de cualquier transacción, con
+         idempotency_key para que los reintentos no reembolsen dos veces.
+      4. En una sola transacción se restaura el stock, los refunded_quantity
+         y el estado del Order (REFUNDED o PARTIALLY_REFUNDED) → APPROVED.
+         Si Wompi falla tras los reintentos → FAILED (se puede reintentar).
+      5. Un reembolso que sigue en PROCESSING pasado
+         REFUND_PROCESSING_GRACE_MINUTES (worker caído, mensaje perdido) lo
+         reencola orders.requeue_stuck_refunds (ver stuck()).
     """
 
     class Status(models.TextChoices):
         PENDING = "PENDING", "Pendiente"
+        PROCESSING = "PROCESSING", "Procesando"
         APPROVED = "APPROVED", "Aprobado"
         REJECTED = "REJECTED", "Rechazado"
+        FAILED = "FAILED", "Fallido"
 
     order = models.ForeignKey(Order, on_delete=models.PROTECT, related_name="refunds")
     status = models.CharField(
@@ -162,6 +209,8 @@ class Refund(TimeStampedModel):
     reason = models.TextField()
     amount = models.DecimalField(max_digits=12, decimal_places=2)
     wompi_refund_id = models.CharField(max_length=100, blank=True)
+    idempotency_key = models.UUIDField(default=uuid.uuid4, editable=False)
+    failure_reason = models.TextField(blank=True)
     processed_at = models.DateTimeField(null=True, blank=True)
     processed_by = models.ForeignKey(
         settings.AUTH_USER_MODEL,          # ← corregido: era User
@@ -170,40 +219,110 @@ class Refund(TimeStampedModel):
         on_delete=models.SET_NULL,
         related_name="processed_refunds",
     )
+    batch = models.ForeignKey(
+        "RefundBatch",
+        null=True,
+        blank=True,
+        on_delete=models.SET_NULL,
+        related_name="refunds",
+    )
 
     class Meta:
         db_table = "orders_refunds"
 
-    @transaction.atomic
+    @classmethod
+    def stuck(cls, now=None):
+        """Reembolsos en PROCESSING sin cambios desde hace más del periodo de gracia."""
+        cutoff = (now or timezone.now()) - timedelta(minutes=settings.REFUND_PROCESSING_GRACE_MINUTES)
+        return cls.objects.filter(status=cls.Status.PROCESSING, updated_at__lt=cutoff)
+
     def approve(self) -> None:
-        from django.utils import timezone
+        """Pasa el reembolso a PROCESSING y encola su ejecución al confirmar."""
+        from apps.orders.tasks import process_refund
+
+        with transaction.atomic():
+            claimed = Refund.objects.filter(
+                pk=self.pk, status__in=[self.Status.PENDING, self.Status.FAILED],
+            ).update(status=self.Status.PROCESSING, failure_reason="", updated_at=timezone.now())
+            if not claimed:
+                raise ValueError("Solo se pueden aprobar reembolsos en estado PENDING o FAILED.")
+            self.status = self.Status.PROCESSING
+            self.failure_reason = ""
+            refund_id = str(self.pk)
+            transaction.on_commit(lambda: process_refund.delay(refund_id))
+
+    def execute(self) -> None:
+        """
+        Ejecuta un reembolso en PROCESSING: Wompi primero (sin transacción
+        abierta ni locks), luego stock y estados en una transacción.
+        Lanza ValueError si Wompi falla; la tarea decide si reintentar.
+        """
+        if self.status != self.Status.PROCESSING:
+            return
+        wompi_refund_id = self.call_gateway()
+        if wompi_refund_id != self.wompi_refund_id:
+            # Se guarda de inmediato: un reintento posterior no vuelve a llamar a Wompi
+            self.wompi_refund_id = wompi_refund_id
+            Refund.objects.filter(pk=self.pk).update(wompi_refund_id=wompi_refund_id)
+        self.apply()
+
+    def call_gateway(self) -> str:
+        """
+        Reembolsa en Wompi y retorna el id del reembolso. No toca la base
+        (requiere self.order cargado), así que se puede llamar desde hilos.
+        """
         from apps.payments.wompi import WompiService
-    
-        if self.status != self.Status.PENDING:
-            raise ValueError("Solo se pueden aprobar reembolsos en estado PENDING.")
-    
-        # ── Llamar a Wompi primero ─────────────────────────────────────────
+
         transaction_id = self.order.wompi_transaction_id
-        if transaction_id:
-            wompi = WompiService()
-            amount_in_cents = int(self.amount * 100)
-            result = wompi.refund_transaction(transaction_id, amount_in_cents)
-            if result is None:
-                raise ValueError("Error al procesar el reembolso en Wompi.")
-            self.wompi_refund_id = result.get("id", "")
-    
-        # ── Restaurar stock ────────────────────────────────────────────────
-        for refund_item in self.items.select_related(
-            "order_item__variant__stock"
-        ).all():
-            refund_item.order_item.variant.stock.restore(refund_item.quantity)
-            refund_item.order_item.refunded_quantity += refund_item.quantity
-            refund_item.order_item.save(update_fields=["refunded_quantity"])
-    
+        if not transaction_id or self.wompi_refund_id:
+            return self.wompi_refund_id
+        result = WompiService().refund_transaction(
+            transaction_id, int(self.amount * 100), idempotency_key=str(self.idempotency_key),
+        )
+        if result is None:
+            raise ValueError("Error al procesar el reembolso en Wompi.")
+        return result.get("id", "")
+
+    def fail(self, reason: str) -> None:
+        self.status = self.Status.FAILED
+        self.failure_reason = reason
+        Refund.objects.filter(pk=self.pk, status=self.Status.PROCESSING).update(
+            status=self.status, failure_reason=reason, updated_at=timezone.now(),
+        )
+
+    @transaction.atomic
+    def apply(self) -> None:
+        """Restaura stock, refunded_quantity y estado del pedido → APPROVED."""
+        from django.db.models import Case, F, Value, When
+
+        from apps.inventory.allocation import restore_allocations
+        from apps.inventory.reservations import restore_units
+        from apps.orders.customers import schedule_refresh_customers
+
+        if Refund.objects.select_for_update().get(pk=self.pk).status != self.Status.PROCESSING:
+            return  # Otro worker ya lo aplicó
+
+        rows = list(self.items.values_list("order_item_id", "order_item__variant_id", "quantity"))
+        by_item, by_variant = {}, {}
+        for order_item_id, variant_id, qty in rows:
+            by_item[order_item_id] = by_item.get(order_item_id, 0) + qty
+            by_variant[variant_id] = by_variant.get(variant_id, 0) + qty
+
+        restore_units(by_variant, reference=f"refund:{self.pk}")
+        if by_item:
+            OrderItem.objects.filter(pk__in=by_item).update(
+                refunded_quantity=F("refunded_quantity") + Case(
+                    *[When(pk=pk, then=Value(qty)) for pk, qty in by_item.items()],
+                    default=Value(0),
+                )
+            )
+        restore_allocations(self.order_id, by_variant)
+
         self.status = self.Status.APPROVED
         self.processed_at = timezone.now()
         self.save(update_fields=["status", "wompi_refund_id", "processed_at", "updated_at"])
         self._update_order_status()
+        schedule_refresh_customers([self.order])
 
     def _update_order_status(self) -> None:
         from apps.orders.tasks import send_refund_email  # ← agrega
@@ -217,7 +336,9 @@ class Refund(TimeStampedModel):
             order.status = Order.Status.PARTIALLY_REFUNDED
             is_partial = True
         order.save(update_fields=["status", "updated_at"])
-        send_refund_email.delay(str(order.id), str(self.amount), self.reason, is_partial)  # ← agrega
+        transaction.on_commit(
+            lambda: send_refund_email.delay(str(order.id), str(self.amount), self.reason, is_partial)
+        )
 
 
 class RefundItem(models.Model):
@@ -230,4 +351,266 @@ class RefundItem(models.Model):
     reason = models.CharField(max_length=255, blank=True)
 
     class Meta:
-        db_table = "orders_refund_items"
\ No newline at end of file
+        db_table = "orders_refund_items"
+
+
+class RefundBatch(models.Model):
+    """
+    Aprobación de reembolsos en bloque (refund_batches.py). El progreso y el
+    resultado de cada reembolso se leen de sus refunds.
+    """
+
+    class Status(models.TextChoices):
+        PENDING = "PENDING", "Pendiente"
+        RUNNING = "RUNNING", "En curso"
+        DONE = "DONE", "Terminado"
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    status = models.CharField(max_length=10, choices=Status.choices, default=Status.PENDING)
+    total = models.PositiveIntegerField(default=0)
+    created_by = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        null=True,
+        blank=True,
+        on_delete=models.SET_NULL,
+        related_name="refund_batches",
+    )
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        db_table = "orders_refund_batches"
+        ordering = ["-created_at"]
+
+    def __str__(self):
+        return f"Lote {self.pk} ({self.status})"
+
+
+# ─── Tablas de hechos (analytics) ─────────────────────────────────────────────
+
+class SalesDailyFact(models.Model):
+    """
+    Ventas de pedidos DELIVERED agregadas por día (hora local), departamento
+    y variante. Producto, marca y categoría raíz se guardan al refrescar
+    para que el dashboard no tenga que recorrer el catálogo.
+    Se mantiene con rollups.refresh_slice (ver hooks.py).
+    """
+    day = models.DateField()
+    department = models.CharField(max_length=100)
+    variant = models.ForeignKey(Variant, on_delete=models.CASCADE, related_name="+")
+    product = models.ForeignKey("catalog.Product", on_delete=models.CASCADE, related_name="+")
+    brand = models.ForeignKey(
+        "catalog.Brand", null=True, blank=True, on_delete=models.SET_NULL, related_name="+"
+    )
+    root_category = models.ForeignKey(
+        "catalog.Category", null=True, blank=True, on_delete=models.SET_NULL, related_name="+"
+    )
+    units = models.PositiveIntegerField(default=0)
+    revenue = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    orders = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        db_table = "orders_sales_daily_facts"
+        indexes = [
+            models.Index(fields=["day", "department"], name="orders_sales_fact_day_idx"),
+        ]
+
+
+class OrderDailyFact(models.Model):
+    """Totales por pedido de los DELIVERED, agregados por día y departamento."""
+    day = models.DateField()
+    department = models.CharField(max_length=100)
+    orders = models.PositiveIntegerField(default=0)
+    subtotal = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    discount_amount = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    total = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+
+    class Meta:
+        db_table = "orders_order_daily_facts"
+        unique_together = ("day", "department")
+
+
+class OrderStatusEvent(models.Model):
+    """
+    Historial append-only de estados de un pedido. Se escribe desde
+    hooks.orders_status_changed en cada transición (save, webhook, admin,
+    cambios en bloque y expiración).
+    """
+    order = models.ForeignKey(Order, on_delete=models.CASCADE, related_name="status_events")
+    from_status = models.CharField(max_length=20, choices=Order.Status.choices, blank=True)
+    to_status = models.CharField(max_length=20, choices=Order.Status.choices)
+    created_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        db_table = "orders_status_events"
+        indexes = [
+            models.Index(fields=["order", "to_status"], name="orders_status_event_idx"),
+        ]
+
+    def __str__(self) -> str:
+        return f"{self.order_id}: {self.from_status or '—'} → {self.to_status}"
+
+
+class FulfillmentLatencyBucket(models.Model):
+    """
+    Histograma de latencias de despacho por semana (lunes local, de la
+    transición que cierra la etapa), departamento y etapa. Cada fila cuenta
+    las transiciones que cayeron en un bucket de latencia (ver latency.py).
+    """
+
+    class Stage(models.TextChoices):
+        PAID_TO_SHIPPED = "paid_to_shipped", "Pagado → Enviado"
+        SHIPPED_TO_DELIVERED = "shipped_to_delivered", "Enviado → Entregado"
+        PAID_TO_DELIVERED = "paid_to_delivered", "Pagado → Entregado"
+
+    week = models.DateField()
+    department = models.CharField(max_length=100)
+    stage = models.CharField(max_length=25, choices=Stage.choices)
+    bucket = models.PositiveSmallIntegerField()
+    count = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        db_table = "orders_fulfillment_latency"
+        unique_together = ("week", "department", "stage", "bucket")
+
+
+class CustomerStats(models.Model):
+    """
+    Agregados por cliente (email normalizado: usuario o invitado), mantenidos
+    al cambiar de estado sus pedidos (customers.py). Solo cuentan los pedidos
+    que llegaron a pagarse. Los puntajes RFM (1-5) y el segmento se recalculan
+    cada noche para todos los clientes a la vez.
+    """
+
+    class Segment(models.TextChoices):
+        CHAMPIONS = "champions", "Campeones"
+        LOYAL = "loyal", "Leales"
+        NEW = "new", "Nuevos"
+        PROMISING = "promising", "Prometedores"
+        AT_RISK = "at_risk", "En riesgo"
+        LAPSED = "lapsed", "Inactivos"
+        REGULAR = "regular", "Regulares"
+
+    email = models.CharField(max_length=254, unique=True)
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.SET_NULL,
+        related_name="+",
+        null=True,
+        blank=True,
+    )
+    orders_count = models.PositiveIntegerField(default=0)
+    total_spent = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    refunds_count = models.PositiveIntegerField(default=0)
+    refunded_amount = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    first_order_at = models.DateTimeField()
+    last_order_at = models.DateTimeField()
+    updated_at = models.DateTimeField(auto_now=True)
+
+    recency_score = models.PositiveSmallIntegerField(null=True, blank=True)
+    frequency_score = models.PositiveSmallIntegerField(null=True, blank=True)
+    monetary_score = models.PositiveSmallIntegerField(null=True, blank=True)
+    segment = models.CharField(max_length=20, choices=Segment.choices, blank=True)
+    scored_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        db_table = "orders_customer_stats"
+        indexes = [
+            models.Index(fields=["segment", "-total_spent"], name="orders_customer_segment_idx"),
+            models.Index(fields=["last_order_at"], name="orders_customer_last_idx"),
+        ]
+
+    def __str__(self) -> str:
+        return f"{self.email} | {self.orders_count} pedidos | {self.segment or '—'}"
+
+
+# ─── Archivo de pedidos cerrados ──────────────────────────────────────────────
+
+class ArchivedOrder(models.Model):
+    """
+    Pedido cerrado (DELIVERED/CANCELLED/REFUNDED) movido fuera de
+    orders_orders por archive.py. Conserva id, fechas y montos originales;
+    el historial de estados queda en status_history.
+    """
+    id = models.UUIDField(primary_key=True, editable=False)
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.PROTECT,
+        related_name="archived_orders",
+        null=True,
+        blank=True,
+    )
+    status = models.CharField(max_length=30, choices=Order.Status.choices)
+    guest_email = models.EmailField(blank=True)
+    guest_name = models.CharField(max_length=255, blank=True)
+
+    subtotal = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+    discount_amount = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+    shipping_amount = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+    total = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+    coupon = models.ForeignKey(Coupon, null=True, blank=True, on_delete=models.SET_NULL, related_name="+")
+
+    shipping_name = models.CharField(max_length=255)
+    shipping_address = models.TextField()
+    shipping_city = models.CharField(max_length=100)
+    shipping_department = models.CharField(max_length=100)
+    shipping_postal_code = models.CharField(max_length=20, blank=True)
+    shipping_phone = models.CharField(max_length=20)
+
+    wompi_transaction_id = models.CharField(max_length=100, blank=True)
+    wompi_reference = models.CharField(max_length=100, unique=True)
+    notes = models.TextField(blank=True)
+
+    status_history = models.JSONField(default=list, blank=True)
+    created_at = models.DateTimeField()
+    updated_at = models.DateTimeField()
+    archived_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        db_table = "orders_archived_orders"
+        ordering = ["-created_at"]
+        indexes = [
+            models.Index(fields=["user", "-created_at"], name="orders_archived_user_idx"),
+            models.Index(fields=["created_at"], name="orders_archived_created_idx"),
+            models.Index(Lower(Trim("guest_email")), name="orders_archived_guest_idx"),
+        ]
+
+    def __str__(self) -> str:
+        return f"Order #{self.id} (archivado) — {self.status}"
+
+
+class ArchivedOrderItem(models.Model):
+    id = models.UUIDField(primary_key=True, editable=False)
+    order = models.ForeignKey(ArchivedOrder, on_delete=models.CASCADE, related_name="items")
+    variant = models.ForeignKey(Variant, on_delete=models.PROTECT, related_name="archived_order_items")
+    product_name = models.CharField(max_length=255)
+    variant_name = models.CharField(max_length=255)
+    sku = models.CharField(max_length=100)
+    unit_price = models.DecimalField(max_digits=12, decimal_places=2)
+    quantity = models.PositiveIntegerField()
+    subtotal = models.DecimalField(max_digits=12, decimal_places=2)
+    refunded_quantity = models.PositiveIntegerField(default=0)
+    created_at = models.DateTimeField()
+
+    class Meta:
+        db_table = "orders_archived_order_items"
+
+
+class ArchivedRefund(models.Model):
+    """Reembolso de un pedido archivado; items = [{"order_item", "quantity", "reason"}]."""
+    id = models.UUIDField(primary_key=True, editable=False)
+    order = models.ForeignKey(ArchivedOrder, on_delete=models.CASCADE, related_name="refunds")
+    status = models.CharField(max_length=20, choices=Refund.Status.choices)
+    reason = models.TextField()
+    amount = models.DecimalField(max_digits=12, decimal_places=2)
+    wompi_refund_id = models.CharField(max_length=100, blank=True)
+    processed_at = models.DateTimeField(null=True, blank=True)
+    processed_by = models.ForeignKey(
+        settings.AUTH_USER_MODEL, null=True, blank=True, on_delete=models.SET_NULL, related_name="+",
+    )
+    items = models.JSONField(default=list, blank=True)
+    created_at = models.DateTimeField()
+
+    class Meta:
+        db_table = "orders_archived_refunds"
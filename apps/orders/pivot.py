@@ -0,0 +1,324 @@
+"""
+Motor columnar para pivots ad-hoc de ventas (ítems de pedidos DELIVERED).
+
+Cada ítem vendido es una fila con columnas NumPy: día, departamento, marca,
+producto, cupón, unidades e ingreso. Las columnas se guardan como archivos
+.npy (uno por columna) particionados por mes local y se leen con mmap, así
+un pivot sobre millones de filas es un filtro y un bincount vectorizados.
+
+Archivos en settings.ANALYTICS_COLUMNAR_DIR:
+  meta.json                → watermark, vocabularios y partición vigente por mes
+  YYYY-MM.<build>/<col>.npy → columnas de una partición
+
+Los departamentos, marcas, productos y cupones se guardan como códigos
+enteros (posición en el vocabulario; -1 = sin valor). El refresco
+incremental solo reconstruye los meses con pedidos modificados desde el
+último watermark (Order.updated_at); las particiones incluyen los pedidos
+archivados (archive.py), que ya no cambian.
+"""
+from __future__ import annotations
+
+import itertools
+import json
+import os
+import shutil
+import uuid
+from datetime import date, timedelta
+from pathlib import Path
+
+import numpy as np
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import F
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from .rollups import day_bounds
+
+COLUMNS = {
+    "day":        np.int32,    # Días desde 1970-01-01 (día local)
+    "department": np.int32,
+    "brand":      np.int32,
+    "product":    np.int32,
+    "coupon":     np.int32,
+    "units":      np.int32,
+    "revenue":    np.float64,
+}
+CODED = ("department", "brand", "product", "coupon")
+DIMENSIONS = ("day", "week", "month", "department", "brand", "product", "coupon")
+VALUES = ("units", "revenue")
+
+EPOCH = date(1970, 1, 1)
+
+# Pedidos confirmados durante el refresco anterior pueden tener updated_at
+# menor al watermark: se revisa de nuevo este margen.
+REFRESH_OVERLAP = timedelta(minutes=5)
+LOCK_KEY = "orders:pivot:refresh"
+
+
+# ─── Almacenamiento ────────────────────────────────────────────────────────
+
+def _root() -> Path:
+    return Path(settings.ANALYTICS_COLUMNAR_DIR)
+
+
+def load_meta() -> dict:
+    try:
+        with open(_root() / "meta.json") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {"watermark": None, "vocab": {name: [] for name in CODED}, "partitions": {}}
+
+
+def _save_meta(meta: dict) -> None:
+    path = _root() / "meta.json"
+    tmp = path.with_suffix(f".{uuid.uuid4().hex}.tmp")
+    with open(tmp, "w") as f:
+        json.dump(meta, f)
+    os.replace(tmp, path)
+
+
+def _next_month(month: date) -> date:
+    return (month.replace(day=28) + timedelta(days=4)).replace(day=1)
+
+
+def _build_partition(month: date, meta: dict) -> str | None:
+    """Escribe las columnas del mes en un directorio nuevo. None si no hay ventas."""
+    from django.apps import apps
+
+    from .archive import sources
+    from .models import Order
+
+    start, _ = day_bounds(month)
+    end, _ = day_bounds(_next_month(month))
+    sold = [
+        OrderItem.objects
+        .filter(
+            order__status=Order.Status.DELIVERED,
+            order__created_at__gte=start,
+            order__created_at__lt=end,
+        )
+        .values_list(
+            TruncDate("order__created_at"),
+            F("order__shipping_department"),
+            F("variant__product__brand_id"),
+            F("variant__product_id"),
+            F("order__coupon_id"),
+            "quantity",
+            "subtotal",
+        )
+        for _, OrderItem, _ in sources(apps)
+    ]
+
+    vocab = meta["vocab"]
+    index = {name: {value: code for code, value in enumerate(vocab[name])} for name in CODED}
+
+    def encode(name, value):
+        if value is None:
+            return -1
+        value = str(value)
+        code = index[name].get(value)
+        if code is None:
+            code = index[name][value] = len(vocab[name])
+            vocab[name].append(value)
+        return code
+
+    columns = {name: [] for name in COLUMNS}
+    rows = itertools.chain.from_iterable(queryset.iterator(chunk_size=5000) for queryset in sold)
+    for day, department, brand, product, coupon, units, revenue in rows:
+        columns["day"].append((day - EPOCH).days)
+        columns["department"].append(encode("department", department))
+        columns["brand"].append(encode("brand", brand))
+        columns["product"].append(encode("product", product))
+        columns["coupon"].append(encode("coupon", coupon))
+        columns["units"].append(units)
+        columns["revenue"].append(float(revenue))
+    if not columns["day"]:
+        return None
+
+    name = f"{month:%Y-%m}.{uuid.uuid4().hex[:8]}"
+    directory = _root() / name
+    directory.mkdir(parents=True)
+    for column, dtype in COLUMNS.items():
+        np.save(directory / f"{column}.npy", np.asarray(columns[column], dtype=dtype))
+    return name
+
+
+def refresh(full: bool = False) -> int:
+    """
+    Reconstruye las particiones de los meses con pedidos modificados desde
+    el último refresco (o todas con full=True). Retorna meses reconstruidos.
+    """
+    from .models import ArchivedOrder, Order
+
+    if not cache.add(LOCK_KEY, 1, timeout=60 * 30):
+        return 0  # Otro worker está refrescando
+    try:
+        _root().mkdir(parents=True, exist_ok=True)
+        meta = load_meta()
+        started = timezone.now()
+
+        orders = Order.objects.all()
+        if meta["watermark"] and not full:
+            orders = orders.filter(updated_at__gte=parse_datetime(meta["watermark"]) - REFRESH_OVERLAP)
+        months = set(orders.dates("created_at", "month"))
+        if full:
+            months.update(ArchivedOrder.objects.dates("created_at", "month"))
+        months = sorted(months)
+
+        replaced = []
+        for month in months:
+            key = f"{month:%Y-%m}"
+            name = _build_partition(month, meta)
+            old = meta["partitions"].pop(key, None)
+            if name:
+                meta["partitions"][key] = name
+            if old:
+                replaced.append(old)
+        meta["watermark"] = started.isoformat()
+        _save_meta(meta)
+
+        # Los lectores con mmap abierto siguen viendo los archivos borrados
+        for name in replaced:
+            shutil.rmtree(_root() / name, ignore_errors=True)
+        return len(months)
+    finally:
+        cache.delete(LOCK_KEY)
+
+
+def load(first: date | None = None, last: date | None = None, meta: dict | None = None) -> dict[str, np.ndarray]:
+    """Columnas de las particiones que cubren [first, last] (mmap si es una sola)."""
+    meta = meta or load_meta()
+    selected = [
+        name for key, name in sorted(meta["partitions"].items())
+        if (first is None or key >= f"{first:%Y-%m}") and (last is None or key <= f"{last:%Y-%m}")
+    ]
+    parts = {
+        column: [np.load(_root() / name / f"{column}.npy", mmap_mode="r") for name in selected]
+        for column in COLUMNS
+    }
+    return {
+        column: arrays[0] if len(arrays) == 1 else np.concatenate(arrays) if arrays
+        else np.empty(0, dtype=COLUMNS[column])
+        for column, arrays in parts.items()
+    }
+
+
+# ─── Consulta ──────────────────────────────────────────────────────────────
+
+def _dimension(columns: dict, name: str) -> np.ndarray:
+    days = columns["day"]
+    if name == "week":
+        return days - (days + 3) % 7  # 1970-01-01 fue jueves: semanas desde el lunes
+    if name == "month":
+        return days.astype("datetime64[D]").astype("datetime64[M]").astype(np.int64)
+    return columns[name]
+
+
+def _group(keys: list[np.ndarray]) -> tuple[np.ndarray, np.ndarray]:
+    """Retorna (claves únicas por columna, índice de grupo de cada fila)."""
+    offsets = [k.min() for k in keys]
+    spans = [int(k.max() - o) + 1 for k, o in zip(keys, offsets)]
+    try:
+        flat = np.ravel_multi_index([k - o for k, o in zip(keys, offsets)], spans)
+    except ValueError:  # Demasiadas combinaciones para un int64
+        unique, inverse = np.unique(np.stack(keys, axis=1), axis=0, return_inverse=True)
+        return unique.T, inverse.reshape(-1)
+    unique, inverse = np.unique(flat, return_inverse=True)
+    return (
+        np.stack([u + o for u, o in zip(np.unravel_index(unique, spans), offsets)]),
+        inverse.reshape(-1),
+    )
+
+
+def _codes(meta: dict, name: str, values) -> list[int]:
+    values = {str(v) for v in values}
+    return [code for code, value in enumerate(meta["vocab"][name]) if value in values]
+
+
+def _labels(meta: dict, name: str, codes: np.ndarray) -> list:
+    from apps.catalog.models import Brand, Product
+    from apps.promotions.models import Coupon
+
+    if name in ("day", "week"):
+        return [(EPOCH + timedelta(days=int(c))).isoformat() for c in codes]
+    if name == "month":
+        return [str(np.datetime64(int(c), "M")) for c in codes]
+
+    vocab = meta["vocab"][name]
+    raw = [vocab[c] if c >= 0 else None for c in codes]
+    if name == "department":
+        return raw
+    model, field = {"brand": (Brand, "name"), "product": (Product, "name"), "coupon": (Coupon, "code")}[name]
+    names = dict(model.objects.filter(pk__in=[r for r in raw if r]).values_list("pk", field))
+    return [names.get(uuid.UUID(r)) if r else None for r in raw]
+
+
+def pivot(
+    rows: list[str],
+    date_from: date | None = None,
+    date_to: date | None = None,
+    department: str | None = None,
+    brand: str | None = None,
+    product: str | None = None,
+    coupon: str | None = None,
+    sort: str = "revenue",
+    limit: int = 1000,
+) -> dict:
+    """Agrupa por las dimensiones de `rows` y suma unidades e ingresos."""
+    from apps.catalog.models import Brand, Product
+    from apps.promotions.models import Coupon
+
+    meta = load_meta()
+    columns = load(date_from, date_to, meta)
+
+    mask = np.ones(len(columns["day"]), dtype=bool)
+    if date_from:
+        mask &= columns["day"] >= (date_from - EPOCH).days
+    if date_to:
+        mask &= columns["day"] <= (date_to - EPOCH).days
+    if department:
+        codes = [
+            code for code, value in enumerate(meta["vocab"]["department"])
+            if value.lower() == department.lower()
+        ]
+        mask &= np.isin(columns["department"], codes)
+    for name, model, lookup, value in (
+        ("brand", Brand, "slug", brand),
+        ("product", Product, "slug", product),
+        ("coupon", Coupon, "code__iexact", coupon),
+    ):
+        if value:
+            ids = model.objects.filter(**{lookup: value}).values_list("pk", flat=True)
+            mask &= np.isin(columns[name], _codes(meta, name, ids))
+
+    units = columns["units"][mask].astype(np.int64)
+    revenue = columns["revenue"][mask]
+    totals = {"units": int(units.sum()), "revenue": float(revenue.sum())}
+
+    result_rows = []
+    if rows and mask.any():
+        keys, inverse = _group([_dimension(columns, name)[mask] for name in rows])
+        groups = keys.shape[1]
+        sums = {
+            "units": np.bincount(inverse, weights=units, minlength=groups),
+            "revenue": np.bincount(inverse, weights=revenue, minlength=groups),
+        }
+        order = np.argsort(-sums[sort], kind="stable")[:limit]
+        labels = {name: _labels(meta, name, keys[i][order]) for i, name in enumerate(rows)}
+        result_rows = [
+            {
+                **{name: labels[name][n] for name in rows},
+                "units": int(sums["units"][g]),
+                "revenue": round(float(sums["revenue"][g]), 2),
+            }
+            for n, g in enumerate(order)
+        ]
+
+    return {
+        "rows": result_rows,
+        "totals": totals,
+        "matched": int(mask.sum()),
+        "refreshed_at": meta["watermark"],
+    }
@@ -0,0 +1,131 @@
+"""
+Aprobación de reembolsos en bloque.
+
+start_batch() reclama en un solo UPDATE los reembolsos PENDING/FAILED
+(→ PROCESSING) y encola orders.process_refund_batch al confirmar. La tarea
+los procesa en tramos de REFUND_BATCH_CHUNK_SIZE:
+
+  1. Las llamadas a Wompi del tramo corren en paralelo, a lo sumo
+     REFUND_BATCH_CONCURRENCY a la vez. Los hilos no tocan la base.
+  2. Los ids de Wompi se guardan con un bulk_update.
+  3. Stock, refunded_quantity y estados se aplican en una transacción por
+     tramo, con un savepoint por reembolso: un error no arrastra al resto.
+
+Un reembolso que falla queda FAILED con su failure_reason; los demás siguen.
+Si el worker muere, reejecutar la tarea retoma los que siguen en PROCESSING
+(idempotency_key y wompi_refund_id evitan reembolsar dos veces).
+"""
+from __future__ import annotations
+
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.db import DatabaseError, transaction
+from django.db.models import Count, Q
+from django.utils import timezone
+
+from .models import Refund, RefundBatch
+
+logger = logging.getLogger(__name__)
+
+APPROVABLE_STATUSES = [Refund.Status.PENDING, Refund.Status.FAILED]
+
+
+def start_batch(refund_ids, user=None) -> tuple[RefundBatch | None, list[str]]:
+    """
+    Crea el lote con los reembolsos aprobables de `refund_ids`.
+    Retorna (lote, ids omitidos); lote es None si ninguno se pudo aprobar.
+    """
+    from .tasks import process_refund_batch
+
+    requested = [str(pk) for pk in refund_ids]
+    with transaction.atomic():
+        claimed = [
+            str(pk) for pk in Refund.objects.select_for_update(skip_locked=True)
+            .filter(pk__in=requested, status__in=APPROVABLE_STATUSES)
+            .order_by("pk")
+            .values_list("pk", flat=True)
+        ]
+        claimed_set = set(claimed)
+        skipped = [pk for pk in requested if pk not in claimed_set]
+        if not claimed:
+            return None, skipped
+
+        batch = RefundBatch.objects.create(created_by=user, total=len(claimed))
+        Refund.objects.filter(pk__in=claimed).update(
+            status=Refund.Status.PROCESSING,
+            failure_reason="",
+            batch=batch,
+            processed_by=user,
+            updated_at=timezone.now(),
+        )
+        batch_id = str(batch.pk)
+        transaction.on_commit(lambda: process_refund_batch.delay(batch_id))
+    return batch, skipped
+
+
+def _call_gateway(refund: Refund) -> tuple[str, str]:
+    """(id en Wompi, error) de un reembolso; corre en un hilo del pool."""
+    try:
+        return refund.call_gateway(), ""
+    except ValueError as exc:
+        return "", str(exc)
+
+
+def _process_chunk(refunds: list[Refund], pool: ThreadPoolExecutor) -> None:
+    failed = {}
+    called = []
+    for refund, (wompi_refund_id, error) in zip(refunds, pool.map(_call_gateway, refunds)):
+        if error:
+            failed[refund] = error
+        else:
+            refund.wompi_refund_id = wompi_refund_id
+            called.append(refund)
+    # Antes de aplicar: si la transacción del tramo falla, Wompi no se vuelve a llamar
+    Refund.objects.bulk_update(called, ["wompi_refund_id"])
+
+    with transaction.atomic():
+        for refund in called:
+            try:
+                refund.apply()  # Savepoint propio
+            except (DatabaseError, ValueError) as exc:
+                logger.exception("Reembolso %s del lote no aplicado.", refund.pk)
+                failed[refund] = str(exc)
+        for refund, reason in failed.items():
+            refund.fail(reason)
+
+
+def run_batch(batch_id) -> RefundBatch:
+    """Procesa los reembolsos del lote que siguen en PROCESSING."""
+    batch = RefundBatch.objects.get(pk=batch_id)
+    if batch.status == RefundBatch.Status.DONE:
+        return batch
+    batch.status = RefundBatch.Status.RUNNING
+    batch.started_at = batch.started_at or timezone.now()
+    batch.save(update_fields=["status", "started_at"])
+
+    refunds = list(
+        batch.refunds.filter(status=Refund.Status.PROCESSING)
+        .select_related("order")
+        .order_by("created_at", "pk")
+    )
+    chunk_size = settings.REFUND_BATCH_CHUNK_SIZE
+    with ThreadPoolExecutor(max_workers=settings.REFUND_BATCH_CONCURRENCY) as pool:
+        for start in range(0, len(refunds), chunk_size):
+            _process_chunk(refunds[start:start + chunk_size], pool)
+
+    batch.status = RefundBatch.Status.DONE
+    batch.finished_at = timezone.now()
+    batch.save(update_fields=["status", "finished_at"])
+    return batch
+
+
+def with_progress(queryset):
+    """Anota pending/approved/failed (conteo de reembolsos del lote por estado)."""
+    S = Refund.Status
+    return queryset.annotate(
+        pending=Count("refunds", filter=Q(refunds__status=S.PROCESSING)),
+        approved=Count("refunds", filter=Q(refunds__status=S.APPROVED)),
+        failed=Count("refunds", filter=Q(refunds__status=S.FAILED)),
+    )
@@ -0,0 +1,174 @@
+"""
+Tablas de hechos diarias para analytics (SalesDailyFact, OrderDailyFact).
+
+Cada "slice" es un (día local, departamento). Refrescar un slice borra sus
+filas y las recalcula desde los pedidos DELIVERED de ese día (incluidos los
+archivados, ver archive.py), así que es idempotente y se puede repetir sin riesgo. Los slices se refrescan por
+Celery cuando un pedido entra o sale de DELIVERED (hooks.py).
+"""
+from __future__ import annotations
+
+from datetime import date, datetime, time, timedelta
+
+from django.apps import apps as django_apps
+from django.db import transaction
+from django.db.models import Count, F, Sum
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+from . import analytics_cache
+
+
+def day_bounds(day: date) -> tuple[datetime, datetime]:
+    """[inicio, fin) del día en la zona horaria local."""
+    start = timezone.make_aware(datetime.combine(day, time.min))
+    end = timezone.make_aware(datetime.combine(day + timedelta(days=1), time.min))
+    return start, end
+
+
+def fact_days(start: datetime, end: datetime) -> tuple[date, date]:
+    """Días locales [primero, último] que cubre el rango de fechas [start, end]."""
+    first = timezone.localdate(start)
+    last = timezone.localdate(end)
+    # Un rango que termina justo a medianoche no incluye ese día
+    if end > start and timezone.localtime(end).time() == time.min:
+        last -= timedelta(days=1)
+    return first, last
+
+
+def schedule_refresh(order) -> None:
+    """Encola (al confirmar la transacción) el refresco del slice del pedido."""
+    schedule_refresh_slices([order])
+
+
+def schedule_refresh_slices(orders) -> None:
+    """Como schedule_refresh, una sola vez por slice aunque varios pedidos lo compartan."""
+    from .tasks import refresh_sales_facts
+
+    slices = {
+        (timezone.localdate(order.created_at).isoformat(), order.shipping_department)
+        for order in orders
+    }
+    for day, department in sorted(slices):
+        transaction.on_commit(
+            lambda day=day, department=department: refresh_sales_facts.delay(day, department),
+            robust=True,
+        )
+
+
+def _root_categories(product_ids, apps) -> dict:
+    """Categoría raíz principal de cada producto (la primera según ProductCategory.order)."""
+    ProductCategory = apps.get_model("catalog", "ProductCategory")
+    roots = {}
+    for product_id, category_id in (
+        ProductCategory.objects
+        .filter(product_id__in=product_ids, category__parent=None)
+        .order_by("order", "category__name")
+        .values_list("product_id", "category_id")
+    ):
+        roots.setdefault(product_id, category_id)
+    return roots
+
+
+@transaction.atomic
+def refresh_slice(day: date, department: str, apps=django_apps) -> int:
+    """
+    Recalcula las filas de hechos de un día y departamento, con los pedidos
+    transaccionales y los archivados. Retorna filas de ítems.
+    """
+    from .archive import sources
+
+    SalesDailyFact = apps.get_model("orders", "SalesDailyFact")
+    OrderDailyFact = apps.get_model("orders", "OrderDailyFact")
+
+    SalesDailyFact.objects.filter(day=day, department=department).delete()
+    OrderDailyFact.objects.filter(day=day, department=department).delete()
+    transaction.on_commit(lambda: analytics_cache.bump_days([day]))
+
+    start, end = day_bounds(day)
+    totals = dict.fromkeys(("orders", "subtotal", "discount_amount", "total"), 0)
+    items = {}
+    for Order, OrderItem, _ in sources(apps):
+        orders = Order.objects.filter(
+            status="DELIVERED",
+            created_at__gte=start,
+            created_at__lt=end,
+            shipping_department=department,
+        )
+        for name, value in orders.aggregate(
+            orders=Count("id"),
+            subtotal=Sum("subtotal"),
+            discount_amount=Sum("discount_amount"),
+            total=Sum("total"),
+        ).items():
+            totals[name] += value or 0
+
+        # Un pedido está en una sola de las tablas: las sumas se pueden juntar
+        for row in (
+            OrderItem.objects
+            .filter(order__in=orders)
+            .values(
+                "variant_id",
+                product_id=F("variant__product_id"),
+                brand_id=F("variant__product__brand_id"),
+            )
+            .annotate(
+                units=Sum("quantity"),
+                revenue=Sum("subtotal"),
+                orders=Count("order", distinct=True),
+            )
+        ):
+            merged = items.setdefault(row["variant_id"], {**row, "units": 0, "revenue": 0, "orders": 0})
+            for name in ("units", "revenue", "orders"):
+                merged[name] += row[name]
+
+    if not totals["orders"]:
+        return 0
+    OrderDailyFact.objects.create(day=day, department=department, **totals)
+
+    rows = list(items.values())
+    roots = _root_categories({row["product_id"] for row in rows}, apps)
+    SalesDailyFact.objects.bulk_create([
+        SalesDailyFact(
+            day=day,
+            department=department,
+            variant_id=row["variant_id"],
+            product_id=row["product_id"],
+            brand_id=row["brand_id"],
+            root_category_id=roots.get(row["product_id"]),
+            units=row["units"],
+            revenue=row["revenue"],
+            orders=row["orders"],
+        )
+        for row in rows
+    ])
+    return len(rows)
+
+
+def rebuild(since: date | None = None, apps=django_apps) -> int:
+    """
+    Recalcula todos los slices (o los desde `since`): los que tienen pedidos
+    DELIVERED (transaccionales o archivados) y los que ya tenían hechos,
+    para limpiar los que quedaron vacíos.
+    """
+    from .archive import sources
+
+    OrderDailyFact = apps.get_model("orders", "OrderDailyFact")
+
+    facts = OrderDailyFact.objects.all()
+    if since:
+        facts = facts.filter(day__gte=since)
+    slices = set(facts.values_list("day", "department"))
+
+    for Order, _, _ in sources(apps):
+        orders = Order.objects.filter(status="DELIVERED")
+        if since:
+            orders = orders.filter(created_at__gte=day_bounds(since)[0])
+        slices.update(
+            orders.annotate(day=TruncDate("created_at"))
+            .values_list("day", "shipping_department")
+            .distinct()
+        )
+    for day, department in sorted(slices):
+        refresh_slice(day, department, apps=apps)
+    return len(slices)
@@ -0,0 +1,77 @@
+"""
+Búsqueda de pedidos para soporte (API ?search= y admin).
+
+El término se clasifica y cada tipo usa un filtro que aprovecha un índice,
+en vez de ILIKE '%q%' sobre cuatro columnas:
+
+  UUID                 → pk exacto
+  contiene "@"         → prefijo del email normalizado (invitado o usuario)
+  ORD-...              → prefijo de wompi_reference
+  123-456...           → prefijo de wompi_transaction_id
+  otro texto           → nombre (guest_name / shipping_name): similitud de
+                         trigramas en PostgreSQL, icontains en otras bases
+
+Los índices de prefijo (text_pattern_ops sobre lower(email)) y los GIN de
+trigramas solo existen en PostgreSQL (migración 0007_order_search_indexes).
+"""
+from __future__ import annotations
+
+import re
+import uuid
+
+from django.contrib.auth import get_user_model
+from django.db import connection
+from django.db.models import Q
+from django.db.models.functions import Lower
+from rest_framework import filters
+
+REFERENCE_PREFIX = "ORD-"
+TRANSACTION_ID = re.compile(r"^\d+-\d")
+MIN_NAME_LENGTH = 3
+
+
+def _email_filter(term: str) -> Q:
+    users = (
+        get_user_model().objects
+        .annotate(email_lower=Lower("email"))
+        .filter(email_lower__startswith=term)
+        .values("pk")
+    )
+    return Q(guest_email_lower__startswith=term) | Q(user_id__in=users)
+
+
+def search_orders(queryset, term: str):
+    """Filtra `queryset` por el término de búsqueda (ver docstring del módulo)."""
+    term = " ".join(term.split())
+    if not term:
+        return queryset
+
+    try:
+        return queryset.filter(pk=uuid.UUID(term))
+    except ValueError:
+        pass
+
+    if "@" in term:
+        return queryset.annotate(guest_email_lower=Lower("guest_email")).filter(
+            _email_filter(term.lower())
+        )
+    if term.upper().startswith(REFERENCE_PREFIX):
+        return queryset.filter(wompi_reference__startswith=term.upper())
+    if TRANSACTION_ID.match(term):
+        return queryset.filter(wompi_transaction_id__startswith=term)
+
+    if len(term) < MIN_NAME_LENGTH:
+        return queryset.none()
+    if connection.vendor == "postgresql":
+        # term <% columna: usa los índices GIN y tolera errores de tipeo
+        return queryset.filter(
+            Q(guest_name__trigram_word_similar=term) | Q(shipping_name__trigram_word_similar=term)
+        )
+    return queryset.filter(Q(guest_name__icontains=term) | Q(shipping_name__icontains=term))
+
+
+class OrderSearchFilter(filters.SearchFilter):
+    """SearchFilter de DRF (?search=) que delega en search_orders()."""
+
+    def filter_queryset(self, request, queryset, view):
+        return search_orders(queryset, request.query_params.get(self.search_param, ""))
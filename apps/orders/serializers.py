@@ -1,23 +1,33 @@
 from rest_framework import serializers
-from .models import Order, OrderItem, Refund, RefundItem
 
+from common.serializers import SparseFieldsMixin
+from . import pivot
+from .transitions import BULK_STATUSES
+from .models import (
+    ArchivedOrder, ArchivedOrderItem, ArchivedRefund, CustomerStats, Order, OrderItem,
+    Refund, RefundBatch, RefundItem,
+)
 
-class OrderItemSerializer(serializers.ModelSerializer):
+
+class OrderItemSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     class Meta:
         model = OrderItem
         fields = [
             "id", "variant", "product_name", "variant_name",
             "sku", "unit_price", "quantity", "subtotal", "refunded_quantity",
         ]
+        expandable_fields = {
+            "variant": ("apps.catalog.serializers.VariantReadSerializer", {}),
+        }
 
 
-class RefundSummarySerializer(serializers.ModelSerializer):
+class RefundSummarySerializer(SparseFieldsMixin, serializers.ModelSerializer):
     class Meta:
         model = Refund
         fields = ["id", "status", "amount", "reason", "processed_at"]
 
 
-class OrderSerializer(serializers.ModelSerializer):
+class OrderSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     items = OrderItemSerializer(many=True, read_only=True)
     refunds = RefundSummarySerializer(many=True, read_only=True)
 
@@ -34,6 +44,45 @@ class OrderSerializer(serializers.ModelSerializer):
         read_only_fields = ["status", "subtotal", "total"]
 
 
+class OrderSummarySerializer(SparseFieldsMixin, serializers.ModelSerializer):
+    """
+    Representación liviana para listados ("Mis pedidos"). item_count y
+    first_item_name vienen anotados en el queryset (OrderViewSet.get_queryset).
+    """
+    item_count = serializers.IntegerField(read_only=True)
+    first_item_name = serializers.CharField(read_only=True, allow_null=True)
+
+    class Meta:
+        model = Order
+        fields = [
+            "id", "wompi_reference", "status", "total",
+            "item_count", "first_item_name", "created_at",
+        ]
+
+
+class ArchivedOrderItemSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = ArchivedOrderItem
+        fields = OrderItemSerializer.Meta.fields
+
+
+class ArchivedRefundSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = ArchivedRefund
+        fields = RefundSummarySerializer.Meta.fields
+
+
+class ArchivedOrderSerializer(serializers.ModelSerializer):
+    """Pedido archivado con la misma forma que OrderSerializer (ver archive.py)."""
+    items = ArchivedOrderItemSerializer(many=True, read_only=True)
+    refunds = ArchivedRefundSerializer(many=True, read_only=True)
+
+    class Meta:
+        model = ArchivedOrder
+        fields = OrderSerializer.Meta.fields + ["status_history", "archived_at"]
+        read_only_fields = fields
+
+
 class OrderStatusSerializer(serializers.ModelSerializer):
     class Meta:
         model = Order
@@ -69,9 +118,9 @@ class RefundSerializer(serializers.ModelSerializer):
         model = Refund
         fields = [
             "id", "order", "order_reference", "status", "reason",
-            "amount", "items", "items_write", "processed_at",
+            "amount", "items", "items_write", "processed_at", "failure_reason",
         ]
-        read_only_fields = ["status", "processed_at"]
+        read_only_fields = ["status", "processed_at", "failure_reason"]
 
     def validate(self, attrs):
         order = attrs.get("order")
@@ -102,4 +151,82 @@ class RefundSerializer(serializers.ModelSerializer):
         refund = Refund.objects.create(**validated_data)
         for item_data in items_data:
             RefundItem.objects.create(refund=refund, **item_data)
-        return refund
\ No newline at end of file
+        return refund
+
+class PivotSerializer(serializers.Serializer):
+    """Parámetros de POST /api/orders/pivot/ (ver pivot.py)."""
+
+    rows      = serializers.ListField(
+        child=serializers.ChoiceField(choices=pivot.DIMENSIONS), max_length=4, default=list,
+    )
+    date_from  = serializers.DateField(required=False)
+    date_to    = serializers.DateField(required=False)
+    department = serializers.CharField(required=False)
+    brand      = serializers.SlugField(required=False)
+    product    = serializers.SlugField(required=False)
+    coupon     = serializers.CharField(required=False)
+    sort       = serializers.ChoiceField(choices=pivot.VALUES, default="revenue")
+    limit      = serializers.IntegerField(min_value=1, max_value=10000, default=1000)
+
+    def validate_rows(self, rows):
+        if len(set(rows)) != len(rows):
+            raise serializers.ValidationError("Dimensiones repetidas.")
+        return rows
+
+    def validate(self, attrs):
+        if attrs.get("date_from") and attrs.get("date_to") and attrs["date_from"] > attrs["date_to"]:
+            raise serializers.ValidationError({"date_to": "Debe ser posterior a date_from."})
+        return attrs
+
+
+class BulkStatusSerializer(serializers.Serializer):
+    """Parámetros de POST /api/orders/bulk-status/."""
+    order_ids = serializers.ListField(
+        child=serializers.UUIDField(), allow_empty=False, max_length=2000,
+    )
+    status = serializers.ChoiceField(choices=BULK_STATUSES)
+
+
+class BulkRefundApproveSerializer(serializers.Serializer):
+    """Parámetros de POST /api/orders/refunds/bulk-approve/."""
+    refund_ids = serializers.ListField(
+        child=serializers.UUIDField(), allow_empty=False, max_length=500,
+    )
+
+
+class RefundBatchItemSerializer(serializers.ModelSerializer):
+    order_reference = serializers.CharField(source="order.wompi_reference", read_only=True)
+
+    class Meta:
+        model = Refund
+        fields = ["id", "order_reference", "amount", "status", "wompi_refund_id", "failure_reason", "processed_at"]
+
+
+class RefundBatchSerializer(serializers.ModelSerializer):
+    """Progreso del lote; pending/approved/failed vienen de refund_batches.with_progress()."""
+    pending = serializers.IntegerField(read_only=True)
+    approved = serializers.IntegerField(read_only=True)
+    failed = serializers.IntegerField(read_only=True)
+    refunds = RefundBatchItemSerializer(many=True, read_only=True)
+
+    class Meta:
+        model = RefundBatch
+        fields = [
+            "id", "status", "total", "pending", "approved", "failed",
+            "created_by", "created_at", "started_at", "finished_at", "refunds",
+        ]
+
+
+class CustomerStatsSerializer(serializers.ModelSerializer):
+    net_spent = serializers.SerializerMethodField()
+
+    class Meta:
+        model = CustomerStats
+        fields = [
+            "email", "user", "orders_count", "total_spent", "refunds_count",
+            "refunded_amount", "net_spent", "first_order_at", "last_order_at",
+            "recency_score", "frequency_score", "monetary_score", "segment", "scored_at",
+        ]
+
+    def get_net_spent(self, obj) -> str:
+        return str(obj.total_spent - obj.refunded_amount)
@@ -13,34 +13,188 @@ from django.conf import settings
 logger = logging.getLogger(__name__)
 
 RESERVATION_EXPIRY_MINUTES = 2
+EXPIRY_BATCH_SIZE = 500
+
+
+def schedule_reservation_expiry(order) -> None:
+    """Programa (al confirmar la transacción) la expiración puntual del pedido."""
+    transaction.on_commit(
+        lambda: release_expired_reservations.apply_async(
+            args=[str(order.pk)], countdown=RESERVATION_EXPIRY_MINUTES * 60 + 1
+        ),
+        robust=True,
+    )
+
+
+def reservation_expiry():
+    """Vencimiento de una reserva creada ahora."""
+    return timezone.now() + timedelta(minutes=RESERVATION_EXPIRY_MINUTES)
+
+
+def _expire_orders(order_ids: list) -> None:
+    """
+    Cancela los pedidos y libera sus reservas en bloque: borrado de
+    StockReservation con descuento agregado de Stock.reserved, un UPDATE
+    de pedidos y un INSERT de movimientos.
+    """
+    from apps.orders.hooks import orders_status_changed
+    from apps.orders.models import Order
+    from apps.inventory.allocation import release_allocations
+    from apps.inventory.reservations import release_reservations
+
+    orders = list(
+        Order.objects.filter(pk__in=order_ids).only("pk", "status", "created_at", "shipping_department")
+    )
+    release_reservations(order_ids)
+    release_allocations(order_ids)
+    Order.objects.filter(pk__in=order_ids).update(
+        status=Order.Status.CANCELLED, updated_at=timezone.now()
+    )
+    orders_status_changed([(order, order.status) for order in orders], Order.Status.CANCELLED)
 
 
 @shared_task(name="orders.release_expired_reservations")
-def release_expired_reservations():
+def release_expired_reservations(order_id: str | None = None):
+    """
+    Cancela los pedidos PENDING_PAYMENT con reservas vencidas y libera su
+    stock, en lotes. Los vencidos se ubican por el índice de expires_at.
+
+    Con order_id (programado con countdown desde el checkout) solo revisa
+    ese pedido; sin argumentos es el barrido periódico de respaldo.
+    Los pedidos bloqueados por otra transacción (ej: webhook) se saltan.
+    """
     from apps.orders.models import Order
-    expiry_threshold = timezone.now() - timedelta(minutes=RESERVATION_EXPIRY_MINUTES)
-    expired_orders = Order.objects.filter(
-        status=Order.Status.PENDING_PAYMENT,
-        created_at__lte=expiry_threshold,
-    ).prefetch_related("items__variant__stock")
+    from apps.inventory.models import StockReservation
 
+    expired_reservations = StockReservation.objects.filter(expires_at__lte=timezone.now())
     count = 0
-    for order in expired_orders:
+    while True:
         try:
             with transaction.atomic():
-                for item in order.items.all():
-                    item.variant.stock.release_reservation(item.quantity)
-                order.status = Order.Status.CANCELLED
-                order.save(update_fields=["status", "updated_at"])
-                count += 1
-                logger.info("Reserva liberada — Order %s expiró tras %d minutos", order.wompi_reference, RESERVATION_EXPIRY_MINUTES)
+                expired = Order.objects.select_for_update(skip_locked=True).filter(
+                    status=Order.Status.PENDING_PAYMENT,
+                    pk__in=expired_reservations.values("order_id"),
+                )
+                if order_id:
+                    expired = expired.filter(pk=order_id)
+                order_ids = list(expired.values_list("pk", flat=True)[:EXPIRY_BATCH_SIZE])
+                if order_ids:
+                    _expire_orders(order_ids)
         except Exception as e:
-            logger.error("Error liberando reserva de Order %s: %s", order.wompi_reference, e)
+            logger.error("Error liberando reservas vencidas: %s", e)
+            break
+        count += len(order_ids)
+        if len(order_ids) < EXPIRY_BATCH_SIZE:
+            break
 
-    logger.info("release_expired_reservations: %d órdenes expiradas procesadas.", count)
+    if count:
+        logger.info("release_expired_reservations: %d órdenes expiradas.", count)
     return f"{count} reservas liberadas"
 
 
+# ─── Analytics ───────────────────────────────────────────────────────────────
+
+@shared_task(name="orders.refresh_sales_facts")
+def refresh_sales_facts(day: str, department: str) -> str:
+    """Recalcula las tablas de hechos de un día (YYYY-MM-DD) y departamento."""
+    from datetime import date
+    from apps.orders.rollups import refresh_slice
+    rows = refresh_slice(date.fromisoformat(day), department)
+    return f"{day} {department}: {rows} filas"
+
+
+@shared_task(name="orders.rebuild_sales_facts")
+def rebuild_sales_facts(since: str | None = None) -> str:
+    """Reconstruye las tablas de hechos completas (o desde `since`)."""
+    from datetime import date
+    from apps.orders.rollups import rebuild
+    count = rebuild(date.fromisoformat(since) if since else None)
+    logger.info("rebuild_sales_facts: %d slices recalculados.", count)
+    return f"{count} slices"
+
+
+@shared_task(name="orders.refresh_pivot")
+def refresh_pivot(full: bool = False) -> str:
+    """Actualiza el caché columnar de pivots con los meses modificados."""
+    from apps.orders.pivot import refresh
+    months = refresh(full=full)
+    return f"{months} meses"
+
+
+@shared_task(name="orders.refresh_customer_stats")
+def refresh_customer_stats(order_ids: list[str]) -> str:
+    """Recalcula los agregados de los clientes de esos pedidos."""
+    from apps.orders.customers import emails_for_orders, refresh_customers
+    count = refresh_customers(emails_for_orders(order_ids))
+    return f"{count} clientes"
+
+
+@shared_task(name="orders.score_customers")
+def score_customers() -> str:
+    """Recalcula los puntajes RFM y el segmento de todos los clientes."""
+    from apps.orders.customers import score_customers as score
+    count = score()
+    logger.info("score_customers: %d clientes segmentados.", count)
+    return f"{count} clientes"
+
+
+@shared_task(name="orders.archive_orders")
+def archive_orders() -> str:
+    """Mueve los pedidos cerrados viejos a las tablas de archivo."""
+    from apps.orders.archive import archive_closed_orders
+    count = archive_closed_orders()
+    return f"{count} pedidos archivados"
+
+
+# ─── Reembolsos ──────────────────────────────────────────────────────────────
+
+@shared_task(
+    bind=True, name="orders.process_refund", max_retries=3, default_retry_delay=60, acks_late=True,
+)
+def process_refund(self, refund_id: str) -> str:
+    """
+    Ejecuta un reembolso aprobado (Refund.execute). Cualquier error (Wompi,
+    deadlock, base caída) se reintenta con el mismo idempotency_key; agotados
+    los reintentos, el reembolso queda FAILED.
+    """
+    from apps.orders.models import Refund
+    refund = Refund.objects.select_related("order").get(pk=refund_id)
+    try:
+        refund.execute()
+    except Exception as exc:
+        if self.request.retries < self.max_retries:
+            raise self.retry(exc=exc)
+        refund.fail(str(exc))
+        logger.error("process_refund %s: %s", refund_id, exc)
+    return f"{refund_id}: {refund.status}"
+
+
+@shared_task(name="orders.requeue_stuck_refunds")
+def requeue_stuck_refunds() -> str:
+    """
+    Reencola los reembolsos que quedaron en PROCESSING. Es seguro: la tarea
+    reusa idempotency_key y no vuelve a llamar a Wompi si ya hay wompi_refund_id.
+    """
+    from apps.orders.models import Refund
+    ids = [str(pk) for pk in Refund.stuck().values_list("pk", flat=True)]
+    if not ids:
+        return "0 reembolsos reencolados"
+    # Reinicia el periodo de gracia: el siguiente barrido no los vuelve a encolar
+    Refund.objects.filter(pk__in=ids).update(updated_at=timezone.now())
+    for refund_id in ids:
+        process_refund.delay(refund_id)
+    logger.warning("requeue_stuck_refunds: %d reembolsos reencolados.", len(ids))
+    return f"{len(ids)} reembolsos reencolados"
+
+
+@shared_task(name="orders.process_refund_batch", acks_late=True)
+def process_refund_batch(batch_id: str) -> str:
+    """Aprobación en bloque (refund_batches.run_batch)."""
+    from apps.orders.refund_batches import run_batch
+    batch = run_batch(batch_id)
+    return f"{batch_id}: {batch.status}"
+
+
 # ─── Helpers email ────────────────────────────────────────────────────────────
 
 def _get_name(order) -> str:
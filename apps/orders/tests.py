@@ -1,17 +1,37 @@
 from __future__ import annotations
 
+import shutil
+import tempfile
+from datetime import date, timedelta
 from decimal import Decimal
 from unittest.mock import patch, MagicMock
 
 from django.contrib.auth import get_user_model
-from django.test import TestCase
+from django.core.cache import cache
+from django.db import OperationalError, connection
+from django.db.models import Sum
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
 from django.urls import reverse
 from rest_framework.test import APITestCase, APIClient
 from rest_framework import status
 
-from apps.catalog.models import Brand, Product, Variant
-from apps.inventory.models import Stock
-from apps.orders.models import Order, OrderItem, Refund, RefundItem
+from apps.catalog.models import Brand, Category, Product, ProductCategory, Variant
+from apps.inventory.models import Stock, StockMovement, StockReservation
+from apps.inventory.reservations import create_reservations, recompute_reserved
+from apps.orders.models import (
+    ArchivedOrder, CustomerStats, FulfillmentLatencyBucket, Order, OrderDailyFact, OrderItem, OrderStatusEvent,
+    Refund, RefundBatch, RefundItem, SalesDailyFact,
+)
+from apps.orders import archive, customers, latency, pivot, timeseries
+from apps.orders.rollups import rebuild
+from apps.orders.tasks import (
+    process_refund, release_expired_reservations, requeue_stuck_refunds, reservation_expiry,
+)
+from apps.orders.views import OrderViewSet
+from apps.payments.models import PaymentEvent
+from apps.promotions.models import Coupon
 
 from unittest.mock import patch
 
@@ -166,6 +186,222 @@ class OrderCancelTest(TestCase):
         self.assertEqual(len(order.wompi_reference), 16)  # ORD- + 12 hex
 
 
+class OrderListTest(APITestCase):
+
+    def setUp(self):
+        self.user = make_user()
+        self.client.force_authenticate(user=self.user)
+        self.order, self.item, self.variant = make_order(user=self.user, qty=3)
+
+    def add_order(self):
+        order = Order.objects.create(
+            user=self.user, status=Order.Status.PAID, total=Decimal("50000"),
+            shipping_name="Test", shipping_address="Calle 1", shipping_city="Bogotá",
+            shipping_department="Cundinamarca", shipping_phone="3001234567",
+        )
+        OrderItem.objects.create(
+            order=order, variant=self.variant, product_name="Otro", variant_name="Tono",
+            sku=self.variant.sku, unit_price=Decimal("50000"), quantity=1, subtotal=Decimal("50000"),
+        )
+        return order
+
+    def test_list_returns_summary(self):
+        res = self.client.get("/api/orders/")
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        rows = res.data["results"] if isinstance(res.data, dict) else res.data
+        self.assertEqual(rows[0]["item_count"], 3)
+        self.assertEqual(rows[0]["first_item_name"], "Labial Test")
+        self.assertNotIn("items", rows[0])
+
+    def test_list_query_count_is_constant(self):
+        with CaptureQueriesContext(connection) as one:
+            self.client.get("/api/orders/")
+        for _ in range(3):
+            self.add_order()
+        with CaptureQueriesContext(connection) as many:
+            self.client.get("/api/orders/")
+        self.assertEqual(len(one), len(many))
+
+    def test_retrieve_keeps_nested_form(self):
+        res = self.client.get(f"/api/orders/{self.order.pk}/")
+        self.assertEqual(len(res.data["items"]), 1)
+        self.assertEqual(res.data["refunds"], [])
+
+    def test_retrieve_expands_item_variant(self):
+        url = f"/api/orders/{self.order.pk}/"
+        res = self.client.get(url + "?fields=status,items.sku,items.variant")
+        self.assertEqual(res.data["items"], [{"variant": self.variant.pk, "sku": self.variant.sku}])
+        self.assertNotIn("refunds", res.data)
+
+        res = self.client.get(url + "?fields=items.variant&expand=items.variant")
+        self.assertEqual(res.data["items"][0]["variant"]["sku"], self.variant.sku)
+        self.assertEqual(res.data["items"][0]["variant"]["stock"]["quantity"], 10)
+
+
+class BulkStatusTest(APITestCase):
+
+    def setUp(self):
+        self.client.force_authenticate(user=make_admin())
+        self.order, self.item, self.variant = make_order(status=Order.Status.PENDING_PAYMENT, qty=2)
+        self.other = self.add_order(Order.Status.PENDING_PAYMENT, qty=3)
+        for order, qty in ((self.order, 2), (self.other, 3)):
+            self.variant.stock.reserve(qty)
+            create_reservations(order, {self.variant.pk: qty}, reservation_expiry())
+
+    def add_order(self, status_, qty=1):
+        order = Order.objects.create(
+            status=status_, total=Decimal("50000"),
+            shipping_name="Test", shipping_address="Calle 1", shipping_city="Bogotá",
+            shipping_department="Cundinamarca", shipping_phone="3001234567",
+        )
+        OrderItem.objects.create(
+            order=order, variant=self.variant, product_name="Labial", variant_name="Tono",
+            sku=self.variant.sku, unit_price=self.variant.price, quantity=qty,
+            subtotal=self.variant.price * qty,
+        )
+        return order
+
+    def post(self, ids, new_status):
+        with self.captureOnCommitCallbacks(execute=True):
+            return self.client.post(
+                "/api/orders/bulk-status/",
+                {"order_ids": [str(pk) for pk in ids], "status": new_status},
+                format="json",
+            )
+
+    @patch("apps.orders.tasks.send_order_paid_email.chunks")
+    def test_paid_confirms_stock_in_bulk(self, chunks):
+        res = self.post([self.order.pk, self.other.pk], Order.Status.PAID)
+        self.assertEqual(res.data, {"updated": 2, "rejected": []})
+
+        self.variant.stock.refresh_from_db()
+        self.assertEqual((self.variant.stock.quantity, self.variant.stock.reserved), (5, 0))
+        self.assertFalse(StockReservation.objects.exists())
+        self.assertEqual(StockMovement.objects.filter(kind=StockMovement.Kind.CONFIRM).count(), 2)
+        self.assertEqual(
+            set(Order.objects.values_list("status", flat=True)), {Order.Status.PAID}
+        )
+        chunks.assert_called_once()
+        self.assertEqual(len(chunks.call_args.args[0]), 2)
+        chunks.return_value.group.return_value.apply_async.assert_called_once()
+
+    @patch("apps.orders.tasks.send_order_status_email.chunks")
+    def test_invalid_transitions_are_rejected(self, chunks):
+        delivered = self.add_order(Order.Status.DELIVERED)
+        res = self.post([self.order.pk, delivered.pk], Order.Status.SHIPPED)
+        self.assertEqual(res.data["updated"], 0)
+        self.assertEqual(len(res.data["rejected"]), 2)
+        chunks.assert_not_called()
+
+    @patch("apps.orders.tasks.send_order_status_email.chunks")
+    def test_cancel_releases_reservations(self, chunks):
+        res = self.post([self.order.pk], Order.Status.CANCELLED)
+        self.assertEqual(res.data["updated"], 1)
+        self.variant.stock.refresh_from_db()
+        self.assertEqual(self.variant.stock.reserved, 3)
+        self.assertEqual(chunks.call_args.args[0], [(str(self.order.pk), Order.Status.CANCELLED)])
+
+    @patch("apps.orders.tasks.send_order_status_email.chunks")
+    def test_delivered_refreshes_facts_once_per_slice(self, chunks):
+        shipped = [self.add_order(Order.Status.SHIPPED) for _ in range(3)]
+        self.post([o.pk for o in shipped], Order.Status.DELIVERED)
+        self.assertEqual(OrderDailyFact.objects.get().orders, 3)
+
+    def test_requires_admin(self):
+        self.client.force_authenticate(user=make_user())
+        res = self.post([self.order.pk], Order.Status.PAID)
+        self.assertEqual(res.status_code, status.HTTP_403_FORBIDDEN)
+
+
+class ReservationExpiryTest(TestCase):
+
+    def setUp(self):
+        self.order, self.item, self.variant = make_order(status=Order.Status.PENDING_PAYMENT)
+        self.hold(self.order, self.item.quantity)
+
+    def hold(self, order, qty, expires_at=None):
+        self.variant.stock.reserve(qty)
+        create_reservations(
+            order, {self.variant.pk: qty}, expires_at or timezone.now() - timedelta(seconds=1)
+        )
+
+    def add_pending_order(self, qty=1):
+        order = Order.objects.create(
+            status=Order.Status.PENDING_PAYMENT,
+            shipping_name="Test", shipping_address="Calle 1", shipping_city="Bogotá",
+            shipping_department="Cundinamarca", shipping_phone="3001234567",
+        )
+        OrderItem.objects.create(
+            order=order, variant=self.variant, product_name="Labial", variant_name="Tono",
+            sku=self.variant.sku, unit_price=self.variant.price, quantity=qty,
+            subtotal=self.variant.price * qty,
+        )
+        self.hold(order, qty)
+        return order
+
+    def test_releases_stock_and_cancels(self):
+        release_expired_reservations()
+        self.order.refresh_from_db()
+        self.variant.stock.refresh_from_db()
+        self.assertEqual(self.order.status, Order.Status.CANCELLED)
+        self.assertEqual(self.variant.stock.reserved, 0)
+        self.assertEqual(
+            StockMovement.objects.filter(kind=StockMovement.Kind.RELEASE).count(), 1
+        )
+
+    def test_ignores_live_reservations(self):
+        StockReservation.objects.update(expires_at=reservation_expiry())
+        release_expired_reservations()
+        self.order.refresh_from_db()
+        self.assertEqual(self.order.status, Order.Status.PENDING_PAYMENT)
+
+    def test_releases_reservation_rows(self):
+        release_expired_reservations()
+        self.assertFalse(StockReservation.objects.exists())
+
+    def test_recompute_reserved_matches_live_reservations(self):
+        other = self.add_pending_order(qty=3)
+        Stock.objects.filter(variant=self.variant).update(reserved=42)  # descuadre
+        self.assertEqual(recompute_reserved([self.variant.pk]), 1)
+        self.variant.stock.refresh_from_db()
+        self.assertEqual(self.variant.stock.reserved, self.item.quantity + 3)
+
+        Order.objects.get(pk=other.pk).cancel()
+        self.variant.stock.refresh_from_db()
+        self.assertEqual(self.variant.stock.reserved, self.item.quantity)
+
+    def test_recompute_reserved_in_chunks(self):
+        self.add_pending_order(qty=3)
+        Stock.objects.filter(variant=self.variant).update(reserved=42)
+        with patch("apps.inventory.reservations.RECOMPUTE_CHUNK_SIZE", 1):
+            self.assertEqual(recompute_reserved(), 1)
+        self.variant.stock.refresh_from_db()
+        self.assertEqual(self.variant.stock.reserved, self.item.quantity + 3)
+
+    def test_single_order_mode(self):
+        other = self.add_pending_order()
+        release_expired_reservations(str(other.pk))
+        self.order.refresh_from_db()
+        other.refresh_from_db()
+        self.assertEqual(self.order.status, Order.Status.PENDING_PAYMENT)
+        self.assertEqual(other.status, Order.Status.CANCELLED)
+
+    def test_query_count_is_independent_of_orders(self):
+        for _ in range(2):
+            self.add_pending_order()
+        with CaptureQueriesContext(connection) as few:
+            release_expired_reservations()
+
+        for _ in range(10):
+            self.add_pending_order()
+        with CaptureQueriesContext(connection) as many:
+            release_expired_reservations()
+
+        self.assertEqual(len(few), len(many))
+        self.variant.stock.refresh_from_db()
+        self.assertEqual(self.variant.stock.reserved, 0)
+
+
 # ══════════════════════════════════════════════════════════════════════════════
 # Refund Tests
 # ══════════════════════════════════════════════════════════════════════════════
@@ -178,6 +414,12 @@ class RefundApproveTest(TestCase):
         self.variant.stock.quantity = 6
         self.variant.stock.save()
 
+    def _approve(self, refund):
+        # approve() encola orders.process_refund al confirmar la transacción
+        with self.captureOnCommitCallbacks(execute=True):
+            refund.approve()
+        refund.refresh_from_db()
+
     def _make_refund(self, qty=2):
         refund = Refund.objects.create(
             order=self.order,
@@ -193,35 +435,52 @@ class RefundApproveTest(TestCase):
 
     def test_approve_restores_stock(self):
         refund = self._make_refund(qty=2)
-        refund.approve()
+        self._approve(refund)
 
         self.variant.stock.refresh_from_db()
         self.assertEqual(self.variant.stock.quantity, 8)  # 6 + 2
 
     def test_approve_updates_refunded_quantity(self):
         refund = self._make_refund(qty=2)
-        refund.approve()
+        self._approve(refund)
 
         self.item.refresh_from_db()
         self.assertEqual(self.item.refunded_quantity, 2)
 
     def test_partial_refund_sets_order_status(self):
         refund = self._make_refund(qty=2)  # 2 de 4 → parcial
-        refund.approve()
+        self._approve(refund)
 
         self.order.refresh_from_db()
         self.assertEqual(self.order.status, Order.Status.PARTIALLY_REFUNDED)
 
     def test_full_refund_sets_order_status(self):
         refund = self._make_refund(qty=4)  # todos → total
-        refund.approve()
+        self._approve(refund)
 
         self.order.refresh_from_db()
         self.assertEqual(self.order.status, Order.Status.REFUNDED)
 
     def test_approve_already_approved_raises(self):
         refund = self._make_refund()
-        refund.approve()
+        self._approve(refund)
+        with self.assertRaises(ValueError):
+            refund.approve()
+
+    def test_approve_defers_execution_to_commit(self):
+        refund = self._make_refund(qty=2)
+        with self.captureOnCommitCallbacks():
+            refund.approve()
+
+        refund.refresh_from_db()
+        self.assertEqual(refund.status, Refund.Status.PROCESSING)
+        self.variant.stock.refresh_from_db()
+        self.assertEqual(self.variant.stock.quantity, 6)
+
+    def test_approve_processing_raises(self):
+        refund = self._make_refund()
+        with self.captureOnCommitCallbacks():
+            refund.approve()
         with self.assertRaises(ValueError):
             refund.approve()
 
@@ -261,8 +520,9 @@ class RefundAPITest(APITestCase):
         self.assertEqual(res.status_code, status.HTTP_200_OK)
 
     def test_approve_refund(self):
-        res = self.client.post(f"/api/orders/refunds/{self.refund.id}/approve/")
-        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        with self.captureOnCommitCallbacks(execute=True):
+            res = self.client.post(f"/api/orders/refunds/{self.refund.id}/approve/")
+        self.assertEqual(res.status_code, status.HTTP_202_ACCEPTED)
         self.refund.refresh_from_db()
         self.assertEqual(self.refund.status, Refund.Status.APPROVED)
 
@@ -273,7 +533,8 @@ class RefundAPITest(APITestCase):
         self.assertEqual(self.refund.status, Refund.Status.REJECTED)
 
     def test_reject_already_approved_fails(self):
-        self.refund.approve()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.refund.approve()
         res = self.client.post(f"/api/orders/refunds/{self.refund.id}/reject/")
         self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
 
@@ -306,6 +567,127 @@ class RefundAPITest(APITestCase):
         self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
 
 
+# ══════════════════════════════════════════════════════════════════════════════
+# Checkout Tests
+# ══════════════════════════════════════════════════════════════════════════════
+
+@patch("apps.payments.views.WompiService.get_acceptance_token", return_value="token")
+class CheckoutTest(APITestCase):
+
+    def setUp(self):
+        cache.clear()
+        brand = Brand.objects.create(name="TestBrand", slug="testbrand")
+        product = Product.objects.create(name="Labial Test", slug="labial", brand=brand, description="desc")
+        self.variants = []
+        for i in range(20):
+            variant = Variant.objects.create(
+                product=product, sku=f"SKU-{i:03d}", name=f"Tono {i}", price=Decimal("10000"),
+            )
+            Stock.objects.create(variant=variant, quantity=10)
+            self.variants.append(variant)
+
+    def checkout(self, lines):
+        return self.client.post("/api/payments/checkout/", {
+            "items": [{"variant_id": str(variant.pk), "quantity": qty} for variant, qty in lines],
+            "shipping_name": "Test", "shipping_address": "Calle 1", "shipping_city": "Bogotá",
+            "shipping_department": "Cundinamarca", "shipping_phone": "3001234567",
+            "guest_email": "invitado@test.com", "guest_name": "Invitado",
+        }, format="json")
+
+    def test_checkout_reserves_every_line(self, _token):
+        res = self.checkout([(self.variants[2], 3), (self.variants[0], 1)])
+
+        self.assertEqual(res.status_code, status.HTTP_201_CREATED)
+        order = Order.objects.get(pk=res.data["order_id"])
+        self.assertEqual(order.items.count(), 2)
+        self.assertEqual(order.subtotal, Decimal("40000"))
+        for variant, qty in [(self.variants[2], 3), (self.variants[0], 1)]:
+            variant.stock.refresh_from_db()
+            self.assertEqual(variant.stock.reserved, qty)
+            self.assertEqual(StockReservation.objects.get(order=order, variant=variant).quantity, qty)
+        self.assertEqual(
+            StockMovement.objects.filter(reference=order.wompi_reference, kind=StockMovement.Kind.RESERVE).count(), 2,
+        )
+
+    def test_repeated_variant_is_reserved_once(self, _token):
+        res = self.checkout([(self.variants[0], 4), (self.variants[0], 5)])
+
+        self.assertEqual(res.status_code, status.HTTP_201_CREATED)
+        self.variants[0].stock.refresh_from_db()
+        self.assertEqual(self.variants[0].stock.reserved, 9)
+        self.assertEqual(StockReservation.objects.get(order_id=res.data["order_id"]).quantity, 9)
+
+    def test_repeated_variant_over_stock_fails(self, _token):
+        res = self.checkout([(self.variants[0], 6), (self.variants[0], 6)])
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertFalse(Order.objects.exists())
+
+    def test_unknown_variant_fails(self, _token):
+        inactive = self.variants[1]
+        inactive.is_active = False
+        inactive.save(update_fields=["is_active"])
+
+        res = self.checkout([(self.variants[0], 1), (inactive, 1)])
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertFalse(Order.objects.exists())
+
+    def test_query_count_does_not_grow_with_cart(self, _token):
+        with CaptureQueriesContext(connection) as small:
+            self.checkout([(variant, 1) for variant in self.variants[:2]])
+        with CaptureQueriesContext(connection) as large:
+            self.checkout([(variant, 1) for variant in self.variants])
+
+        self.assertEqual(len(small), len(large))
+
+    def test_reserve_units_is_all_or_nothing(self, _token):
+        from django.core.exceptions import ValidationError
+        from apps.inventory.reservations import reserve_units
+
+        with self.assertRaises(ValidationError):
+            reserve_units({self.variants[0].pk: 2, self.variants[1].pk: 11})
+
+        self.assertEqual(Stock.objects.filter(reserved__gt=0).count(), 0)
+
+
+class AcceptanceTokenTest(TestCase):
+
+    def setUp(self):
+        cache.clear()
+
+    @patch("apps.payments.wompi.WompiService.get_acceptance_token", return_value="tok-1")
+    def test_token_is_cached(self, fetch):
+        from apps.payments import acceptance
+
+        self.assertEqual(acceptance.get_token(), "tok-1")
+        self.assertEqual(acceptance.get_token(), "tok-1")
+        fetch.assert_called_once()
+
+    @patch("apps.payments.wompi.WompiService.get_acceptance_token", return_value="tok-2")
+    def test_stale_token_is_served_while_refreshing(self, fetch):
+        from apps.payments import acceptance
+
+        cache.set(acceptance.CACHE_KEY, {"token": "tok-1", "fetched_at": 0})
+        with self.captureOnCommitCallbacks() as callbacks:
+            self.assertEqual(acceptance.get_token(), "tok-1")
+            self.assertEqual(acceptance.get_token(), "tok-1")
+        fetch.assert_not_called()
+        self.assertEqual(len(callbacks), 1)  # Un solo refresco encolado
+
+        callbacks[0]()
+        fetch.assert_called_once()
+        self.assertEqual(acceptance.get_token(), "tok-2")
+
+    @patch("apps.payments.wompi.WompiService.get_acceptance_token", return_value="")
+    def test_failed_refresh_keeps_previous_token(self, fetch):
+        from apps.payments import acceptance
+
+        cache.set(acceptance.CACHE_KEY, {"token": "tok-1", "fetched_at": 0})
+        self.assertEqual(acceptance.refresh(), "tok-1")
+        self.assertEqual(cache.get(acceptance.CACHE_KEY)["token"], "tok-1")
+
+
 # ══════════════════════════════════════════════════════════════════════════════
 # Webhook Tests
 # ══════════════════════════════════════════════════════════════════════════════
@@ -336,10 +718,15 @@ class WompiWebhookTest(APITestCase):
             "timestamp": "1234567890",
         }
 
+    def post(self, payload):
+        # El webhook guarda el evento y lo procesa payments.process_event al confirmar
+        with self.captureOnCommitCallbacks(execute=True):
+            return self.client.post(self.url, payload, format="json")
+
     @patch("apps.payments.views.WompiService.validate_webhook_signature", return_value=True)
     def test_approved_sets_paid_and_confirms_stock(self, _mock):
         payload = self._build_payload("APPROVED")
-        res = self.client.post(self.url, payload, format="json")
+        res = self.post(payload)
 
         self.assertEqual(res.status_code, status.HTTP_200_OK)
         self.order.refresh_from_db()
@@ -352,7 +739,7 @@ class WompiWebhookTest(APITestCase):
     @patch("apps.payments.views.WompiService.validate_webhook_signature", return_value=True)
     def test_declined_sets_cancelled_and_releases_stock(self, _mock):
         payload = self._build_payload("DECLINED")
-        self.client.post(self.url, payload, format="json")
+        self.post(payload)
 
         self.order.refresh_from_db()
         self.assertEqual(self.order.status, Order.Status.CANCELLED)
@@ -370,13 +757,14 @@ class WompiWebhookTest(APITestCase):
     def test_unknown_reference_does_not_crash(self, _mock):
         payload = self._build_payload("APPROVED")
         payload["data"]["transaction"]["reference"] = "ORD-NOEXISTE"
-        res = self.client.post(self.url, payload, format="json")
+        res = self.post(payload)
         self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertIsNotNone(PaymentEvent.objects.get().processed_at)
 
     @patch("apps.payments.views.WompiService.validate_webhook_signature", return_value=True)
     def test_pending_sets_payment_processing(self, _mock):
         payload = self._build_payload("PENDING")
-        self.client.post(self.url, payload, format="json")
+        self.post(payload)
 
         self.order.refresh_from_db()
         self.assertEqual(self.order.status, Order.Status.PAYMENT_PROCESSING)
@@ -385,6 +773,103 @@ class WompiWebhookTest(APITestCase):
         res = self.client.post(self.url, {}, format="json")
         self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
 
+    @patch("apps.payments.views.WompiService.validate_webhook_signature", return_value=True)
+    def test_event_is_stored_before_processing(self, _mock):
+        with self.captureOnCommitCallbacks() as callbacks:
+            res = self.client.post(self.url, self._build_payload("APPROVED"), format="json")
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        event = PaymentEvent.objects.get()
+        self.assertEqual((event.transaction_id, event.transaction_status), ("wompi-txn-001", "APPROVED"))
+        self.assertIsNone(event.processed_at)
+        self.order.refresh_from_db()
+        self.assertEqual(self.order.status, Order.Status.PENDING_PAYMENT)
+        self.assertEqual(len(callbacks), 1)
+
+    @patch("apps.payments.tasks.process_payment_event.delay")
+    @patch("apps.payments.views.WompiService.validate_webhook_signature", return_value=True)
+    def test_duplicate_delivery_is_discarded(self, _mock, delay):
+        payload = self._build_payload("APPROVED")
+        first = self.post(payload)
+        second = self.post(payload)
+
+        self.assertEqual((first.status_code, second.status_code), (status.HTTP_200_OK, status.HTTP_200_OK))
+        self.assertEqual(PaymentEvent.objects.count(), 1)
+        delay.assert_called_once()
+
+    @patch("apps.payments.views.WompiService.validate_webhook_signature", return_value=True)
+    def test_late_pending_does_not_undo_payment(self, _mock):
+        self.post(self._build_payload("APPROVED"))
+        late = self._build_payload("PENDING")
+        late["timestamp"] = "1234567800"
+        self.post(late)
+
+        self.order.refresh_from_db()
+        self.assertEqual(self.order.status, Order.Status.PAID)
+        self.assertEqual(PaymentEvent.objects.filter(processed_at__isnull=True).count(), 0)
+
+    def expire(self):
+        """Simula que la reserva venció mientras el cliente pagaba."""
+        create_reservations(self.order, {self.variant.id: 2}, timezone.now() - timedelta(minutes=1))
+        release_expired_reservations(str(self.order.pk))
+        self.order.refresh_from_db()
+        self.assertEqual(self.order.status, Order.Status.CANCELLED)
+
+    @patch("apps.payments.views.WompiService.validate_webhook_signature", return_value=True)
+    def test_approved_after_expiry_reserves_again(self, _mock):
+        self.expire()
+        self.post(self._build_payload("APPROVED"))
+
+        self.order.refresh_from_db()
+        self.assertEqual(self.order.status, Order.Status.PAID)
+        self.variant.stock.refresh_from_db()
+        self.assertEqual((self.variant.stock.quantity, self.variant.stock.reserved), (8, 0))
+        self.assertFalse(PaymentEvent.objects.get().needs_manual_refund)
+
+    @patch("apps.payments.views.WompiService.validate_webhook_signature", return_value=True)
+    def test_approved_after_expiry_without_stock_is_flagged(self, _mock):
+        self.expire()
+        Stock.objects.filter(pk=self.variant.stock.pk).update(quantity=1)
+
+        with self.assertLogs("apps.payments.events", level="ERROR"):
+            self.post(self._build_payload("APPROVED"))
+
+        self.order.refresh_from_db()
+        self.assertEqual(self.order.status, Order.Status.CANCELLED)
+        self.assertEqual(self.order.wompi_transaction_id, "wompi-txn-001")
+        event = PaymentEvent.objects.get()
+        self.assertTrue(event.needs_manual_refund)
+        self.assertIsNotNone(event.processed_at)
+        self.variant.stock.refresh_from_db()
+        self.assertEqual((self.variant.stock.quantity, self.variant.stock.reserved), (1, 0))
+
+    def test_pending_events_are_requeued(self):
+        from apps.payments.events import pending_event_ids, process_event
+
+        event = PaymentEvent.objects.create(
+            event="transaction.updated", transaction_id="wompi-txn-001",
+            transaction_status="APPROVED", reference=self.order.wompi_reference,
+            timestamp=1234567890, payload={},
+        )
+        self.assertEqual(pending_event_ids(), [])
+        self.assertEqual(pending_event_ids(now=timezone.now() + timedelta(minutes=5)), [event.pk])
+
+        process_event(event.pk)
+        self.order.refresh_from_db()
+        self.assertEqual(self.order.status, Order.Status.PAID)
+        self.assertEqual(pending_event_ids(now=timezone.now() + timedelta(minutes=5)), [])
+
+    def test_exhausted_events_are_not_requeued(self):
+        from apps.payments.events import MAX_ATTEMPTS, exhausted_events, pending_event_ids
+
+        event = PaymentEvent.objects.create(
+            event="transaction.updated", transaction_id="wompi-txn-001",
+            transaction_status="APPROVED", reference=self.order.wompi_reference,
+            timestamp=1234567890, payload={}, attempts=MAX_ATTEMPTS,
+        )
+        self.assertEqual(pending_event_ids(now=timezone.now() + timedelta(minutes=5)), [])
+        self.assertEqual(list(exhausted_events()), [event])
+
 
 
 class RefundWompiIntegrationTest(TestCase):
@@ -396,6 +881,11 @@ class RefundWompiIntegrationTest(TestCase):
         self.variant.stock.quantity = 10
         self.variant.stock.save()
 
+    def _approve(self, refund):
+        with self.captureOnCommitCallbacks(execute=True):
+            refund.approve()
+        refund.refresh_from_db()
+
     def _make_refund(self, qty=2):
         refund = Refund.objects.create(
             order=self.order,
@@ -413,28 +903,29 @@ class RefundWompiIntegrationTest(TestCase):
     def test_approve_calls_wompi(self, mock_refund):
         mock_refund.return_value = {"id": "wompi-refund-001"}
         refund = self._make_refund()
-        refund.approve()
+        self._approve(refund)
 
-        mock_refund.assert_called_once_with("wompi-txn-123", 5000000)  # 50000 * 100
+        mock_refund.assert_called_once_with(
+            "wompi-txn-123", 5000000, idempotency_key=str(refund.idempotency_key),
+        )  # 50000 * 100
 
     @patch("apps.payments.wompi.WompiService.refund_transaction")
     def test_approve_saves_wompi_refund_id(self, mock_refund):
         mock_refund.return_value = {"id": "wompi-refund-001"}
         refund = self._make_refund()
-        refund.approve()
+        self._approve(refund)
 
-        refund.refresh_from_db()
         self.assertEqual(refund.wompi_refund_id, "wompi-refund-001")
 
     @patch("apps.payments.wompi.WompiService.refund_transaction")
     def test_approve_fails_if_wompi_returns_none(self, mock_refund):
         mock_refund.return_value = None
         refund = self._make_refund()
+        self._approve(refund)
 
-        with self.assertRaises(ValueError) as ctx:
-            refund.approve()
-
-        self.assertIn("Wompi", str(ctx.exception))
+        # Agotados los reintentos queda FAILED con el motivo
+        self.assertEqual(refund.status, Refund.Status.FAILED)
+        self.assertIn("Wompi", refund.failure_reason)
         # Stock no debe haberse restaurado
         self.variant.stock.refresh_from_db()
         self.assertEqual(self.variant.stock.quantity, 10)
@@ -446,8 +937,674 @@ class RefundWompiIntegrationTest(TestCase):
         self.order.save(update_fields=["wompi_transaction_id"])
 
         refund = self._make_refund()
-        refund.approve()
+        self._approve(refund)
 
         mock_refund.assert_not_called()
+        self.assertEqual(refund.status, Refund.Status.APPROVED)
+
+    @patch("apps.payments.wompi.WompiService.refund_transaction")
+    def test_failed_refund_retries_with_same_key(self, mock_refund):
+        mock_refund.return_value = None
+        refund = self._make_refund()
+        self._approve(refund)
+        key = refund.idempotency_key
+
+        mock_refund.reset_mock(return_value=True)
+        mock_refund.return_value = {"id": "wompi-refund-002"}
+        self._approve(refund)
+
+        mock_refund.assert_called_once_with("wompi-txn-123", 5000000, idempotency_key=str(key))
+        self.assertEqual(refund.status, Refund.Status.APPROVED)
+        self.assertEqual(refund.failure_reason, "")
+
+    @patch("apps.payments.wompi.WompiService.refund_transaction")
+    def test_duplicate_task_does_not_refund_twice(self, mock_refund):
+        mock_refund.return_value = {"id": "wompi-refund-001"}
+        refund = self._make_refund(qty=2)
+        self._approve(refund)
+        process_refund(str(refund.pk))  # Entrega repetida de la tarea
+
+        mock_refund.assert_called_once()
+        self.variant.stock.refresh_from_db()
+        self.assertEqual(self.variant.stock.quantity, 12)
+
+    @patch("apps.payments.wompi.WompiService.refund_transaction")
+    def test_database_error_is_retried_then_failed(self, mock_refund):
+        mock_refund.return_value = {"id": "wompi-refund-001"}
+        refund = self._make_refund()
+        with patch.object(Refund, "apply", side_effect=OperationalError("deadlock")) as apply:
+            self._approve(refund)
+
+        self.assertEqual(apply.call_count, 4)  # Primer intento + 3 reintentos
+        mock_refund.assert_called_once()  # El id de Wompi ya quedó guardado
+        self.assertEqual(refund.status, Refund.Status.FAILED)
+        self.assertEqual(refund.wompi_refund_id, "wompi-refund-001")
+
+    @patch("apps.payments.wompi.WompiService.refund_transaction")
+    def test_stuck_processing_refund_is_requeued(self, mock_refund):
+        mock_refund.return_value = {"id": "wompi-refund-001"}
+        refund = self._make_refund()
+        # approve() confirmó pero la tarea se perdió
+        refund.approve()
+        self.assertEqual(requeue_stuck_refunds(), "0 reembolsos reencolados")  # Aún en gracia
+
+        Refund.objects.filter(pk=refund.pk).update(updated_at=timezone.now() - timedelta(hours=1))
+        requeue_stuck_refunds()
         refund.refresh_from_db()
-        self.assertEqual(refund.status, Refund.Status.APPROVED)
\ No newline at end of file
+        self.assertEqual(refund.status, Refund.Status.APPROVED)
+        mock_refund.assert_called_once()
+
+
+class RefundBatchTest(APITestCase):
+
+    def setUp(self):
+        self.client.force_authenticate(user=make_admin())
+        self.variant = make_variant()
+        self.refunds = []
+        for i in range(3):
+            order = Order.objects.create(
+                status=Order.Status.PAID, total=Decimal("100000"), wompi_transaction_id=f"wompi-txn-{i}",
+                shipping_name="Test", shipping_address="Calle 1", shipping_city="Bogotá",
+                shipping_department="Cundinamarca", shipping_phone="3001234567",
+            )
+            item = OrderItem.objects.create(
+                order=order, variant=self.variant, product_name="Labial", variant_name="Tono",
+                sku=self.variant.sku, unit_price=self.variant.price, quantity=2,
+                subtotal=self.variant.price * 2,
+            )
+            refund = Refund.objects.create(order=order, reason="Devolución", amount=Decimal("10000"))
+            RefundItem.objects.create(refund=refund, order_item=item, quantity=1)
+            self.refunds.append(refund)
+
+    def _bulk_approve(self, refunds):
+        with self.captureOnCommitCallbacks(execute=True):
+            return self.client.post(
+                "/api/orders/refunds/bulk-approve/",
+                {"refund_ids": [str(refund.pk) for refund in refunds]},
+                format="json",
+            )
+
+    @patch("apps.payments.wompi.WompiService.refund_transaction")
+    def test_bulk_approve_processes_all(self, mock_refund):
+        mock_refund.side_effect = lambda txn, amount, idempotency_key: {"id": f"r-{txn}"}
+        res = self._bulk_approve(self.refunds)
+
+        self.assertEqual(res.status_code, status.HTTP_202_ACCEPTED)
+        self.assertEqual(res.data["total"], 3)
+        self.assertEqual(mock_refund.call_count, 3)
+        for refund in self.refunds:
+            refund.refresh_from_db()
+            self.assertEqual(refund.status, Refund.Status.APPROVED)
+            self.assertEqual(refund.wompi_refund_id, f"r-{refund.order.wompi_transaction_id}")
+            self.assertEqual(refund.order.status, Order.Status.PARTIALLY_REFUNDED)
+        self.variant.stock.refresh_from_db()
+        self.assertEqual(self.variant.stock.quantity, 13)  # 10 + 3
+
+        batch = self.client.get(f"/api/orders/refund-batches/{res.data['batch']}/").data
+        self.assertEqual(batch["status"], RefundBatch.Status.DONE)
+        self.assertEqual((batch["approved"], batch["failed"], batch["pending"]), (3, 0, 0))
+        self.assertEqual(len(batch["refunds"]), 3)
+
+    @patch("apps.payments.wompi.WompiService.refund_transaction")
+    def test_one_failure_does_not_abort_batch(self, mock_refund):
+        mock_refund.side_effect = lambda txn, amount, idempotency_key: (
+            None if txn == "wompi-txn-1" else {"id": f"r-{txn}"}
+        )
+        res = self._bulk_approve(self.refunds)
+
+        statuses = {}
+        for refund in self.refunds:
+            refund.refresh_from_db()
+            statuses[refund.order.wompi_transaction_id] = refund.status
+        self.assertEqual(statuses, {
+            "wompi-txn-0": Refund.Status.APPROVED,
+            "wompi-txn-1": Refund.Status.FAILED,
+            "wompi-txn-2": Refund.Status.APPROVED,
+        })
+        self.assertIn("Wompi", self.refunds[1].failure_reason)
+        self.assertEqual(self.refunds[1].order.items.get().refunded_quantity, 0)
+
+        batch = self.client.get(f"/api/orders/refund-batches/{res.data['batch']}/").data
+        self.assertEqual((batch["approved"], batch["failed"]), (2, 1))
+
+    @patch("apps.payments.wompi.WompiService.refund_transaction")
+    def test_skips_refunds_not_pending(self, mock_refund):
+        mock_refund.return_value = {"id": "r"}
+        Refund.objects.filter(pk=self.refunds[0].pk).update(status=Refund.Status.REJECTED)
+
+        res = self._bulk_approve(self.refunds)
+
+        self.assertEqual(res.data["total"], 2)
+        self.assertEqual(res.data["skipped"], [str(self.refunds[0].pk)])
+        self.refunds[0].refresh_from_db()
+        self.assertEqual(self.refunds[0].status, Refund.Status.REJECTED)
+
+    def test_nothing_to_approve_returns_400(self):
+        Refund.objects.update(status=Refund.Status.REJECTED)
+        res = self._bulk_approve(self.refunds)
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertFalse(RefundBatch.objects.exists())
+
+    @patch("apps.payments.wompi.WompiService.refund_transaction")
+    def test_rerun_does_not_refund_twice(self, mock_refund):
+        from apps.orders.refund_batches import run_batch
+
+        mock_refund.return_value = {"id": "r"}
+        res = self._bulk_approve(self.refunds)
+        RefundBatch.objects.filter(pk=res.data["batch"]).update(status=RefundBatch.Status.RUNNING)
+        run_batch(res.data["batch"])  # Entrega repetida de la tarea
+
+        self.assertEqual(mock_refund.call_count, 3)
+
+
+# ══════════════════════════════════════════════════════════════════════════════
+# Analytics (tablas de hechos)
+# ══════════════════════════════════════════════════════════════════════════════
+
+class SalesFactsTest(APITestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_authenticate(user=make_admin())
+        self.lips = Category.objects.create(name="Labios", slug="labios")
+        matte = Category.objects.create(name="Mate", slug="mate", parent=self.lips)
+        self.brand = Brand.objects.create(name="Marca", slug="marca")
+        self.product = Product.objects.create(
+            name="Labial", slug="labial", brand=self.brand, description="desc"
+        )
+        ProductCategory.objects.create(product=self.product, category=self.lips)
+        ProductCategory.objects.create(product=self.product, category=matte, order=1)
+        self.red = Variant.objects.create(product=self.product, sku="RED", name="Rojo", price=Decimal("10000"))
+        self.pink = Variant.objects.create(product=self.product, sku="PINK", name="Rosa", price=Decimal("20000"))
+
+    def make_order(self, lines, department="Nariño"):
+        order = Order.objects.create(
+            status=Order.Status.SHIPPED, total=Decimal("99"),
+            shipping_name="Test", shipping_address="Calle 1", shipping_city="Pasto",
+            shipping_department=department, shipping_phone="3001234567",
+        )
+        for variant, qty in lines:
+            OrderItem.objects.create(
+                order=order, variant=variant, product_name=self.product.name,
+                variant_name=variant.name, sku=variant.sku, unit_price=variant.price,
+                quantity=qty, subtotal=variant.price * qty,
+            )
+        return order
+
+    def deliver(self, order):
+        with self.captureOnCommitCallbacks(execute=True):
+            order.status = Order.Status.DELIVERED
+            order.save(update_fields=["status", "updated_at"])
+
+    def test_delivery_refreshes_slice(self):
+        self.deliver(self.make_order([(self.red, 2), (self.pink, 1)]))
+        self.assertEqual(OrderDailyFact.objects.get().orders, 1)
+        fact = SalesDailyFact.objects.get(variant=self.red)
+        self.assertEqual((fact.units, fact.revenue, fact.root_category_id), (2, Decimal("20000"), self.lips.pk))
+
+    def test_leaving_delivered_removes_facts(self):
+        order = self.make_order([(self.red, 1)])
+        self.deliver(order)
+        with self.captureOnCommitCallbacks(execute=True):
+            order.status = Order.Status.PARTIALLY_REFUNDED
+            order.save(update_fields=["status", "updated_at"])
+        self.assertFalse(SalesDailyFact.objects.exists())
+        self.assertFalse(OrderDailyFact.objects.exists())
+
+    def test_rebuild_matches_incremental(self):
+        self.deliver(self.make_order([(self.red, 2)]))
+        self.deliver(self.make_order([(self.pink, 1)], department="Cauca"))
+        incremental = sorted(SalesDailyFact.objects.values_list("department", "variant_id", "units"))
+        SalesDailyFact.objects.all().delete()
+        OrderDailyFact.objects.all().delete()
+        self.assertEqual(rebuild(), 2)
+        self.assertEqual(
+            sorted(SalesDailyFact.objects.values_list("department", "variant_id", "units")), incremental
+        )
+
+    def test_analytics_reads_facts(self):
+        self.deliver(self.make_order([(self.red, 2), (self.pink, 1)]))
+        self.deliver(self.make_order([(self.pink, 1)], department="Cauca"))
+
+        res = self.client.get("/api/orders/analytics/?preset=today")
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.data["summary"]["revenue"], 60000.0)
+        self.assertEqual(res.data["summary"]["orders"], 2)
+        self.assertEqual(res.data["by_category"], [{"category": "Labios", "revenue": 60000.0, "units_sold": 4}])
+        self.assertEqual(res.data["top_products"][0]["units_sold"], 4)
+        self.assertEqual(len(res.data["by_department"]), 2)
+
+    def test_analytics_item_filters_count_distinct_orders(self):
+        self.deliver(self.make_order([(self.red, 2), (self.pink, 1)]))
+        res = self.client.get("/api/orders/analytics/?preset=today&category=mate")
+        self.assertEqual(res.data["summary"]["orders"], 1)
+        self.assertEqual(res.data["summary"]["revenue"], 40000.0)
+
+    def test_revenue_and_products_stats(self):
+        self.deliver(self.make_order([(self.red, 2)]))
+        res = self.client.get("/api/orders/revenue/")
+        self.assertEqual(res.data["summary"]["today"], 99.0)
+
+        res = self.client.get("/api/orders/products-stats/?department=nariño")
+        self.assertEqual(res.data, [{
+            "product_name": "Labial", "variant_name": "Rojo", "sku": "RED",
+            "units_sold": 2, "revenue": 20000.0, "orders_count": 1,
+        }])
+
+    def test_analytics_cached_until_covered_day_changes(self):
+        self.deliver(self.make_order([(self.red, 2)]))
+        self.client.get("/api/orders/analytics/?preset=last7")
+
+        with CaptureQueriesContext(connection) as ctx:
+            res = self.client.get("/api/orders/analytics/?preset=last7")
+        self.assertEqual(res.data["summary"]["orders"], 1)
+        self.assertFalse([q for q in ctx.captured_queries if "orders_" in q["sql"]])
+
+        # Una entrega de hoy invalida el rango que incluye hoy
+        self.deliver(self.make_order([(self.pink, 1)]))
+        res = self.client.get("/api/orders/analytics/?preset=last7")
+        self.assertEqual(res.data["summary"]["orders"], 2)
+
+    def test_change_outside_range_keeps_cache(self):
+        self.client.get("/api/orders/analytics/?date_from=2020-01-01&date_to=2020-01-31")
+        self.deliver(self.make_order([(self.red, 2)]))
+        with CaptureQueriesContext(connection) as ctx:
+            self.client.get("/api/orders/analytics/?date_from=2020-01-01&date_to=2020-01-31")
+        self.assertFalse([q for q in ctx.captured_queries if "orders_" in q["sql"]])
+
+    def test_stats_invalidated_by_status_change(self):
+        order = self.make_order([(self.red, 1)])
+        self.assertEqual(self.client.get("/api/orders/stats/").data["by_status"], {"SHIPPED": 1})
+        self.deliver(order)
+        self.assertEqual(self.client.get("/api/orders/stats/").data["by_status"], {"DELIVERED": 1})
+
+    def test_revenue_series_fills_empty_buckets(self):
+        self.deliver(self.make_order([(self.red, 2)]))
+        res = self.client.get("/api/orders/revenue/")
+        self.assertEqual(res.data["granularity"], "day")
+        self.assertEqual(len(res.data["series"]), 31)
+        self.assertEqual(res.data["series"][-1]["total"], 99.0)
+        self.assertEqual(sum(p["total"] for p in res.data["series"]), 99.0)
+        self.assertEqual(res.data["daily"][-1], {"day": timezone.localdate().isoformat(), "total": 99.0})
+
+    def test_hourly_series_buckets_in_local_time(self):
+        order = self.make_order([(self.red, 1)])
+        self.deliver(order)
+        res = self.client.get("/api/orders/analytics/?preset=today&granularity=hour")
+        self.assertEqual(len(res.data["series"]), 24)
+        self.assertNotIn("daily", res.data)
+        hour = timezone.localtime(order.created_at).replace(minute=0, second=0, microsecond=0)
+        point = next(p for p in res.data["series"] if p["bucket"] == hour.isoformat())
+        self.assertEqual((point["revenue"], point["orders"]), (99.0, 1))
+
+    def test_weekly_and_monthly_series(self):
+        self.deliver(self.make_order([(self.red, 1)]))
+        res = self.client.get("/api/orders/revenue/?date_from=2026-01-01&date_to=2026-03-31&granularity=month")
+        self.assertEqual([p["bucket"] for p in res.data["series"]], ["2026-01-01", "2026-02-01", "2026-03-01"])
+        res = self.client.get("/api/orders/revenue/?granularity=week")
+        self.assertEqual(sum(p["total"] for p in res.data["series"]), 99.0)
+        self.assertTrue(all(date.fromisoformat(p["bucket"]).weekday() == 0 for p in res.data["series"]))
+
+    def test_invalid_granularity(self):
+        res = self.client.get("/api/orders/revenue/?granularity=minute")
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_hourly_series_rejects_long_ranges(self):
+        res = self.client.get("/api/orders/analytics/?date_from=2025-01-01&date_to=2025-02-01&granularity=hour")
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        res = self.client.get("/api/orders/revenue/?date_from=2025-01-01&date_to=2025-03-31&granularity=hour")
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        res = self.client.get("/api/orders/revenue/?granularity=hour")
+        self.assertEqual(len(res.data["series"]), 31 * 24)
+
+
+# ══════════════════════════════════════════════════════════════════════════════
+# Pivots columnares
+# ══════════════════════════════════════════════════════════════════════════════
+
+class PivotTest(APITestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.dir, ignore_errors=True)
+        override = override_settings(ANALYTICS_COLUMNAR_DIR=self.dir)
+        override.enable()
+        self.addCleanup(override.disable)
+
+        self.client.force_authenticate(user=make_admin())
+        self.coupon = Coupon.objects.create(code="VERANO", discount_value=Decimal("10"))
+        self.brand = Brand.objects.create(name="Marca", slug="marca")
+        self.other = Brand.objects.create(name="Otra", slug="otra")
+        self.red = self.variant(self.brand, "labial", "RED", Decimal("10000"))
+        self.blue = self.variant(self.other, "sombra", "BLUE", Decimal("5000"))
+
+    def variant(self, brand, slug, sku, price):
+        product = Product.objects.create(name=slug.title(), slug=slug, brand=brand, description="desc")
+        return Variant.objects.create(product=product, sku=sku, name=sku, price=price)
+
+    def sell(self, lines, department="Nariño", coupon=None, status_=Order.Status.DELIVERED):
+        order = Order.objects.create(
+            status=status_, total=Decimal("99"), coupon=coupon,
+            shipping_name="Test", shipping_address="Calle 1", shipping_city="Pasto",
+            shipping_department=department, shipping_phone="3001234567",
+        )
+        for variant, qty in lines:
+            OrderItem.objects.create(
+                order=order, variant=variant, product_name=variant.product.name,
+                variant_name=variant.name, sku=variant.sku, unit_price=variant.price,
+                quantity=qty, subtotal=variant.price * qty,
+            )
+        return order
+
+    def test_pivot_groups_and_filters(self):
+        self.sell([(self.red, 2), (self.blue, 1)], coupon=self.coupon)
+        self.sell([(self.red, 1)], department="Cauca")
+        self.sell([(self.blue, 5)], status_=Order.Status.CANCELLED)
+        pivot.refresh()
+
+        res = self.client.post("/api/orders/pivot/", {"rows": ["brand", "department"]}, format="json")
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.data["totals"], {"units": 4, "revenue": 35000.0})
+        self.assertEqual(res.data["rows"][0], {"brand": "Marca", "department": "Nariño", "units": 2, "revenue": 20000.0})
+        self.assertEqual(len(res.data["rows"]), 3)
+
+        res = self.client.post("/api/orders/pivot/", {"rows": ["week"], "coupon": "verano"}, format="json")
+        self.assertEqual(res.data["totals"]["revenue"], 25000.0)
+        week = timezone.localdate() - timedelta(days=timezone.localdate().weekday())
+        self.assertEqual(res.data["rows"], [{"week": week.isoformat(), "units": 3, "revenue": 25000.0}])
+
+    def test_incremental_refresh_rebuilds_touched_months(self):
+        order = self.sell([(self.red, 1)])
+        self.assertEqual(pivot.refresh(), 1)
+        self.assertEqual(pivot.pivot([])["totals"]["units"], 1)
+
+        order.status = Order.Status.REFUNDED
+        order.save(update_fields=["status", "updated_at"])
+        pivot.refresh()
+        self.assertEqual(pivot.pivot([])["totals"]["units"], 0)
+        self.assertEqual(pivot.load_meta()["partitions"], {})
+
+    def test_invalid_dimension(self):
+        res = self.client.post("/api/orders/pivot/", {"rows": ["color"]}, format="json")
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+# ══════════════════════════════════════════════════════════════════════════════
+# Historial de estados y latencias
+# ══════════════════════════════════════════════════════════════════════════════
+
+class FulfillmentLatencyTest(APITestCase):
+
+    def setUp(self):
+        self.client.force_authenticate(user=make_admin())
+        self.order, _, _ = make_order(status=Order.Status.PENDING_PAYMENT)
+
+    def move(self, order, new_status, hours_later=0):
+        with patch("apps.orders.latency.timezone.now", return_value=timezone.now() + timedelta(hours=hours_later)):
+            order.status = new_status
+            order.save(update_fields=["status", "updated_at"])
+
+    def test_every_transition_is_recorded(self):
+        self.move(self.order, Order.Status.PAID)
+        self.order.cancel()
+        self.assertEqual(
+            list(self.order.status_events.order_by("created_at", "id").values_list("from_status", "to_status")),
+            [("", "PENDING_PAYMENT"), ("PENDING_PAYMENT", "PAID"), ("PAID", "CANCELLED")],
+        )
+
+    def test_latency_histogram_and_percentiles(self):
+        self.move(self.order, Order.Status.PAID)
+        self.move(self.order, Order.Status.SHIPPED, hours_later=10)
+        self.move(self.order, Order.Status.DELIVERED, hours_later=30)
+
+        stages = dict(FulfillmentLatencyBucket.objects.values_list("stage", "bucket"))
+        self.assertEqual(stages["paid_to_shipped"], latency.bucket_for(10))
+        self.assertEqual(stages["shipped_to_delivered"], latency.bucket_for(20))
+        self.assertEqual(stages["paid_to_delivered"], latency.bucket_for(30))
+
+        res = self.client.get("/api/orders/fulfillment-latency/?department=cundinamarca")
+        rows = {(r["stage"], r["department"]): r for r in res.data}
+        row = rows[("paid_to_shipped", "Cundinamarca")]
+        self.assertEqual(row["count"], 1)
+        self.assertTrue(8 <= row["p50_hours"] <= 12)
+        self.assertEqual(rows[("paid_to_shipped", None)]["count"], 1)
+
+    def test_percentile_interpolates_within_bucket(self):
+        histogram = [0] * (len(latency.BUCKET_EDGES) + 1)
+        histogram[latency.bucket_for(3)] = 10  # (2, 4]
+        self.assertEqual(latency.percentile(histogram, 0.5), 3.0)
+        self.assertIsNone(latency.percentile([0, 0], 0.5))
+
+    def test_bulk_transition_writes_events(self):
+        from apps.orders.transitions import bulk_transition
+        self.move(self.order, Order.Status.PAID)
+        with patch("apps.orders.tasks.send_order_status_email.chunks"):
+            bulk_transition([str(self.order.pk)], Order.Status.SHIPPED)
+        self.assertTrue(OrderStatusEvent.objects.filter(order=self.order, to_status="SHIPPED").exists())
+        self.assertEqual(FulfillmentLatencyBucket.objects.get().stage, "paid_to_shipped")
+
+
+# ══════════════════════════════════════════════════════════════════════════════
+# Agregados por cliente y RFM
+# ══════════════════════════════════════════════════════════════════════════════
+
+class CustomerStatsTest(APITestCase):
+
+    def setUp(self):
+        self.user = make_user(email="Ana@Test.com")
+
+    def order(self, status=Order.Status.PENDING_PAYMENT, total="100000", **kwargs):
+        return Order.objects.create(
+            status=status, total=Decimal(total), shipping_name="Test", shipping_address="Calle 1",
+            shipping_city="Bogotá", shipping_department="Cundinamarca", shipping_phone="300", **kwargs,
+        )
+
+    def pay(self, order):
+        with self.captureOnCommitCallbacks(execute=True):
+            order.status = Order.Status.PAID
+            order.save(update_fields=["status", "updated_at"])
+
+    def test_paid_orders_update_customer_by_normalized_email(self):
+        self.pay(self.order(user=self.user, total="100000"))
+        self.pay(self.order(guest_email=" ana@test.COM ", total="50000"))
+        self.order(guest_email="ana@test.com")  # Sin pagar: no cuenta
+
+        stats = CustomerStats.objects.get()
+        self.assertEqual(stats.email, "ana@test.com")
+        self.assertEqual(stats.user, self.user)
+        self.assertEqual(stats.orders_count, 2)
+        self.assertEqual(stats.total_spent, Decimal("150000"))
+
+    def test_cancelling_last_paid_order_removes_customer(self):
+        order = self.order(guest_email="b@test.com")
+        self.pay(order)
+        with self.captureOnCommitCallbacks(execute=True):
+            order.cancel()
+        self.assertFalse(CustomerStats.objects.exists())
+
+    def test_approved_refund_is_counted(self):
+        order, item, _ = make_order(user=self.user, status=Order.Status.PENDING_PAYMENT, qty=4)
+        self.pay(order)
+        refund = Refund.objects.create(order=order, reason="x", amount=Decimal("30000"))
+        RefundItem.objects.create(refund=refund, order_item=item, quantity=1)
+        with self.captureOnCommitCallbacks(execute=True):
+            refund.approve()
+
+        stats = CustomerStats.objects.get()
+        self.assertEqual((stats.refunds_count, stats.refunded_amount), (1, Decimal("30000")))
+
+    def test_quintile_scores_give_ties_the_same_score(self):
+        import numpy as np
+        scores = customers.quintile_scores(np.array([50, 10, 40, 20, 30]))
+        self.assertEqual(scores.tolist(), [5, 1, 4, 2, 3])
+        self.assertEqual(customers.quintile_scores(np.array([1, 1, 1])).tolist(), [3, 3, 3])
+
+    def test_score_and_filter_by_segment(self):
+        now = timezone.now()
+        for i in range(10):
+            CustomerStats.objects.create(
+                email=f"c{i}@test.com",
+                orders_count=i + 1,
+                total_spent=Decimal(10000 * (i + 1)),
+                first_order_at=now - timedelta(days=400),
+                last_order_at=now - timedelta(days=300 - 30 * i),
+            )
+        self.assertEqual(customers.score_customers(now), 10)
+
+        best = CustomerStats.objects.get(email="c9@test.com")
+        worst = CustomerStats.objects.get(email="c0@test.com")
+        self.assertEqual((best.recency_score, best.frequency_score, best.monetary_score), (5, 5, 5))
+        self.assertEqual(best.segment, CustomerStats.Segment.CHAMPIONS)
+        self.assertEqual(worst.segment, CustomerStats.Segment.LAPSED)
+
+        self.client.force_authenticate(user=make_admin())
+        res = self.client.get("/api/orders/customers/?segment=champions&ordering=-total_spent")
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.data["results"][0]["email"], "c9@test.com")
+        self.assertTrue(all(r["segment"] == "champions" for r in res.data["results"]))
+
+        res = self.client.get("/api/orders/customers/c9@test.com/")
+        self.assertEqual(res.data["orders_count"], 10)
+
+
+# ══════════════════════════════════════════════════════════════════════════════
+# Búsqueda de pedidos
+# ══════════════════════════════════════════════════════════════════════════════
+
+class OrderSearchTest(APITestCase):
+
+    def setUp(self):
+        self.client.force_authenticate(user=make_admin())
+        self.customer = make_user(email="Laura.Gomez@Mail.com")
+        self.user_order = self.order(user=self.customer, shipping_name="Laura Gómez")
+        self.guest_order = self.order(guest_email="pedro@mail.com", guest_name="Pedro Pérez", shipping_name="Pedro Pérez")
+
+    def order(self, **kwargs):
+        defaults = dict(
+            shipping_name="Test", shipping_address="Calle 1", shipping_city="Bogotá",
+            shipping_department="Cundinamarca", shipping_phone="300",
+        )
+        defaults.update(kwargs)
+        return Order.objects.create(**defaults)
+
+    def search(self, term):
+        res = self.client.get("/api/orders/", {"search": term})
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        return {r["id"] for r in res.data["results"]}
+
+    def test_email_prefix_matches_guest_and_user_email(self):
+        self.assertEqual(self.search("PEDRO@mail"), {str(self.guest_order.pk)})
+        self.assertEqual(self.search("laura.gomez@"), {str(self.user_order.pk)})
+
+    def test_reference_and_id(self):
+        reference = self.guest_order.wompi_reference
+        self.assertEqual(self.search(reference[:10].lower()), {str(self.guest_order.pk)})
+        self.assertEqual(self.search(str(self.user_order.pk)), {str(self.user_order.pk)})
+
+    def test_name_search(self):
+        self.assertEqual(self.search("pedro"), {str(self.guest_order.pk)})
+        self.assertEqual(self.search("pe"), set())
+
+
+# ══════════════════════════════════════════════════════════════════════════════
+# Archivo de pedidos cerrados
+# ══════════════════════════════════════════════════════════════════════════════
+
+@override_settings(ORDER_ARCHIVE_AFTER_DAYS=365, ORDER_ARCHIVE_BATCH_SIZE=1)
+class OrderArchiveTest(APITestCase):
+
+    def setUp(self):
+        self.customer = make_user()
+        self.old, self.item, self.variant = make_order(user=self.customer, status=Order.Status.PENDING_PAYMENT)
+        for new_status in (Order.Status.PAID, Order.Status.SHIPPED, Order.Status.DELIVERED):
+            self.old.status = new_status
+            self.old.save(update_fields=["status", "updated_at"])
+        refund = Refund.objects.create(order=self.old, reason="x", amount=Decimal("1000"), status=Refund.Status.APPROVED)
+        RefundItem.objects.create(refund=refund, order_item=self.item, quantity=1)
+
+        self.recent = Order.objects.create(
+            user=self.customer, status=Order.Status.DELIVERED, total=Decimal("5000"),
+            shipping_name="Test", shipping_address="Calle 1", shipping_city="Bogotá",
+            shipping_department="Cundinamarca", shipping_phone="300",
+        )
+        self.cancelled = Order.objects.create(
+            status=Order.Status.CANCELLED, shipping_name="Test", shipping_address="Calle 1",
+            shipping_city="Bogotá", shipping_department="Cundinamarca", shipping_phone="300",
+        )
+        long_ago = timezone.now() - timedelta(days=400)
+        Order.objects.filter(pk__in=[self.old.pk, self.cancelled.pk]).update(
+            created_at=long_ago, updated_at=long_ago,
+        )
+
+    def test_moves_closed_orders_with_items_refunds_and_history(self):
+        created_at = Order.objects.get(pk=self.old.pk).created_at
+        self.assertEqual(archive.archive_closed_orders(), 2)
+
+        self.assertEqual(set(Order.objects.values_list("pk", flat=True)), {self.recent.pk})
+        archived = ArchivedOrder.objects.get(pk=self.old.pk)
+        self.assertEqual(archived.wompi_reference, self.old.wompi_reference)
+        self.assertEqual(archived.created_at, created_at)
+        self.assertEqual(archived.items.get().pk, self.item.pk)
+        self.assertEqual(archived.refunds.get().items, [{"order_item": str(self.item.pk), "quantity": 1, "reason": ""}])
+        self.assertEqual([e["to"] for e in archived.status_history], ["PENDING_PAYMENT", "PAID", "SHIPPED", "DELIVERED"])
+
+    def test_history_and_analytics_read_through(self):
+        archive.archive_closed_orders()
+
+        self.assertEqual(rebuild(), 2)
+        self.assertEqual(OrderDailyFact.objects.aggregate(n=Sum("orders"))["n"], 2)
+        customers.refresh_customers([self.customer.email])
+        self.assertEqual(CustomerStats.objects.get().orders_count, 2)
+
+        self.client.force_authenticate(user=self.customer)
+        res = self.client.get(f"/api/orders/{self.old.pk}/")
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.data["items"][0]["sku"], self.item.sku)
+        res = self.client.get("/api/orders/archived/")
+        self.assertEqual([r["id"] for r in res.data["results"]], [str(self.old.pk)])
+
+    def test_my_orders_list_includes_archived(self):
+        archive.archive_closed_orders()
+        self.client.force_authenticate(user=self.customer)
+
+        res = self.client.get("/api/orders/")
+        self.assertEqual(res.data["count"], 2)
+        self.assertEqual([r["id"] for r in res.data["results"]], [str(self.recent.pk), str(self.old.pk)])
+        self.assertEqual(res.data["results"][1]["item_count"], self.item.quantity)
+        self.assertEqual(res.data["results"][1]["first_item_name"], self.item.product_name)
+
+        res = self.client.get("/api/orders/?ordering=created_at&status=DELIVERED")
+        self.assertEqual([r["id"] for r in res.data["results"]], [str(self.old.pk), str(self.recent.pk)])
+        res = self.client.get(f"/api/orders/?search={self.old.wompi_reference}")
+        self.assertEqual([r["id"] for r in res.data["results"]], [str(self.old.pk)])
+
+    def test_order_level_analytics_read_archive(self):
+        day = timezone.localdate(Order.objects.get(pk=self.old.pk).created_at)
+        archive.archive_closed_orders()
+
+        points = timeseries.order_series("hour", day, day)
+        self.assertEqual(sum(p["orders"] for p in points), 1)
+        counts = OrderViewSet._filtered_order_counts(day - timedelta(days=1), day, day, None, None, None, None)
+        self.assertEqual(counts, {"current": 1, "previous": 0})
+
+    def test_recent_and_open_orders_stay(self):
+        Order.objects.filter(pk=self.old.pk).update(status=Order.Status.SHIPPED)
+        self.assertEqual(archive.archive_closed_orders(), 1)
+        self.assertTrue(Order.objects.filter(pk=self.old.pk).exists())
+
+    def test_open_refund_keeps_order(self):
+        Refund.objects.create(order=self.old, reason="y", amount=Decimal("500"), status=Refund.Status.FAILED)
+        self.assertEqual(archive.archive_closed_orders(), 1)
+        self.assertTrue(Order.objects.filter(pk=self.old.pk).exists())
+
+    def test_stats_count_archived_orders(self):
+        self.client.force_authenticate(user=make_admin())
+        self.assertEqual(self.client.get("/api/orders/stats/").data["total"], 3)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            archive.archive_closed_orders()
+
+        res = self.client.get("/api/orders/stats/")
+        self.assertEqual(res.data["total"], 3)
+        self.assertEqual(res.data["by_status"], {"CANCELLED": 1, "DELIVERED": 2})
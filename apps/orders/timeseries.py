@@ -0,0 +1,158 @@
+"""
+Series de tiempo para los endpoints de analytics.
+
+- window_totals(): varias ventanas de comparación (hoy, semana, periodo
+  anterior...) en una sola consulta con agregación condicional.
+- series(): agrupa por hora/día/semana/mes con Trunc en la zona horaria
+  local (America/Bogota) y completa en Python los buckets sin datos.
+
+Las granularidades day/week/month se leen de las tablas de hechos diarias
+(campo `day`); hour no cabe en ellas y se calcula sobre los pedidos, por eso
+solo admite rangos de hasta MAX_HOUR_RANGE_DAYS días.
+"""
+from __future__ import annotations
+
+from datetime import date, datetime, timedelta
+
+from django.db.models import DateTimeField, Q, Sum
+from django.db.models.functions import Trunc
+from django.utils import timezone
+
+from .rollups import day_bounds
+
+GRANULARITIES = ("hour", "day", "week", "month")
+DEFAULT_GRANULARITY = "day"
+# 24 buckets por día: limita la serie por hora a ~750 puntos
+MAX_HOUR_RANGE_DAYS = 31
+
+
+def range_error(granularity: str, first: date, last: date) -> str | None:
+    """Mensaje de error si [first, last] es demasiado largo para la granularidad."""
+    if granularity == "hour" and (last - first).days + 1 > MAX_HOUR_RANGE_DAYS:
+        return f"La granularidad hour admite rangos de hasta {MAX_HOUR_RANGE_DAYS} días."
+    return None
+
+
+def window_totals(queryset, field: str, value: str, windows: dict) -> dict:
+    """
+    Suma `value` en cada ventana con una sola consulta.
+    windows: {nombre: (desde, hasta)} inclusivo sobre `field`.
+    """
+    return queryset.aggregate(**{
+        name: Sum(value, filter=Q(**{f"{field}__range": bounds}))
+        for name, bounds in windows.items()
+    })
+
+
+def bucket_start(value, granularity: str):
+    """Inicio del bucket que contiene `value` (date, o datetime local para hour)."""
+    if granularity == "hour":
+        return timezone.localtime(value).replace(minute=0, second=0, microsecond=0)
+    if isinstance(value, datetime):
+        value = timezone.localdate(value)
+    if granularity == "week":
+        return value - timedelta(days=value.weekday())  # Lunes, como TruncWeek
+    if granularity == "month":
+        return value.replace(day=1)
+    return value
+
+
+def buckets(first: date, last: date, granularity: str) -> list:
+    """Todos los buckets entre los días locales [first, last]."""
+    error = range_error(granularity, first, last)
+    if error:
+        raise ValueError(error)
+    if granularity == "hour":
+        current, end = day_bounds(first)[0], day_bounds(last)[1]
+        step = timedelta(hours=1)
+        result = []
+        while current < end:
+            result.append(timezone.localtime(current))
+            current += step
+        return result
+
+    result = []
+    current = bucket_start(first, granularity)
+    while current <= last:
+        result.append(current)
+        if granularity == "month":
+            current = (current.replace(day=28) + timedelta(days=4)).replace(day=1)
+        else:
+            current += timedelta(days=7 if granularity == "week" else 1)
+    return result
+
+
+def series(queryset, field: str, granularity: str, first: date, last: date, **values) -> list[dict]:
+    """
+    Agrupa `queryset` por bucket de `field` y retorna un dict por bucket con
+    las agregaciones de `values` (0 donde no hay datos), en orden.
+
+    El queryset ya debe estar filtrado al rango [first, last].
+    """
+    if granularity not in GRANULARITIES:
+        raise ValueError(f"Granularidad inválida: {granularity}")
+
+    # Trunc solo acepta tzinfo sobre DateTimeField; los DateField ya son días locales
+    tzinfo = None
+    if isinstance(queryset.model._meta.get_field(field), DateTimeField):
+        tzinfo = timezone.get_current_timezone()
+    rows = (
+        queryset
+        .annotate(bucket=Trunc(field, granularity, tzinfo=tzinfo))
+        .values("bucket")
+        .annotate(**values)
+        .order_by("bucket")
+    )
+    found = {bucket_start(row["bucket"], granularity): row for row in rows}
+
+    result = []
+    for bucket in buckets(first, last, granularity):
+        row = found.get(bucket, {})
+        result.append({
+            "bucket": bucket.isoformat(),
+            **{name: row.get(name) or 0 for name in values},
+        })
+    return result
+
+
+def order_series(granularity: str, first: date, last: date, department: str | None = None) -> list[dict]:
+    """
+    Total vendido y número de pedidos DELIVERED por bucket entre [first, last].
+    Por día o más se lee de OrderDailyFact; por hora, de los pedidos activos
+    y archivados (archive.sources), sumando bucket a bucket.
+    """
+    from django.apps import apps as django_apps
+    from django.db.models import Count
+
+    from .archive import sources
+    from .models import Order, OrderDailyFact
+
+    if granularity == "hour":
+        start, _ = day_bounds(first)
+        _, end = day_bounds(last)
+        result = None
+        for order_model, _, _ in sources(django_apps):
+            queryset = order_model.objects.filter(
+                status=Order.Status.DELIVERED, created_at__gte=start, created_at__lt=end,
+            )
+            if department:
+                queryset = queryset.filter(shipping_department__iexact=department)
+            rows = series(
+                queryset, "created_at", granularity, first, last,
+                total=Sum("total"), orders=Count("id"),
+            )
+            if result is None:
+                result = rows
+                continue
+            for merged, row in zip(result, rows):
+                merged["total"] += row["total"]
+                merged["orders"] += row["orders"]
+        return result
+
+    queryset = OrderDailyFact.objects.filter(day__range=(first, last))
+    if department:
+        queryset = queryset.filter(department__iexact=department)
+    return series(
+        queryset, "day", granularity, first, last,
+        total=Sum("total"), orders=Sum("orders"),
+    )
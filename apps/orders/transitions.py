@@ -0,0 +1,107 @@
+"""
+Cambios de estado en bloque (día de despachos, acciones del admin).
+
+bulk_transition() valida cada pedido contra TRANSITIONS y aplica el cambio
+con operaciones por conjunto: un UPDATE de pedidos, el stock confirmado o
+liberado agregado por variante y las notificaciones encoladas como un solo
+grupo de Celery en lotes.
+"""
+from __future__ import annotations
+
+from collections import Counter
+from dataclasses import dataclass, field
+
+from django.db import models, transaction
+from django.utils import timezone
+
+from .models import Order
+
+S = Order.Status
+
+# Estados destino permitidos desde cada estado
+TRANSITIONS = {
+    S.PENDING_PAYMENT:    {S.PAYMENT_PROCESSING, S.PAID, S.CANCELLED},
+    S.PAYMENT_PROCESSING: {S.PAID, S.CANCELLED},
+    S.PAID:               {S.PREPARING, S.SHIPPED, S.CANCELLED},
+    S.PREPARING:          {S.SHIPPED, S.CANCELLED},
+    S.SHIPPED:            {S.DELIVERED},
+}
+BULK_STATUSES = [S.PAID, S.PREPARING, S.SHIPPED, S.DELIVERED, S.CANCELLED]
+
+# Emails por tarea de Celery
+NOTIFICATION_CHUNK_SIZE = 50
+
+
+@dataclass
+class BulkResult:
+    updated: list = field(default_factory=list)
+    rejected: dict = field(default_factory=dict)  # {order_id: motivo}
+
+
+def _notify(order_ids: list[str], new_status: str) -> None:
+    from .tasks import send_order_paid_email, send_order_status_email
+
+    if not order_ids:
+        return
+    if new_status == S.PAID:
+        tasks = send_order_paid_email.chunks([(pk,) for pk in order_ids], NOTIFICATION_CHUNK_SIZE)
+    else:
+        tasks = send_order_status_email.chunks(
+            [(pk, new_status) for pk in order_ids], NOTIFICATION_CHUNK_SIZE
+        )
+    transaction.on_commit(lambda: tasks.group().apply_async(), robust=True)
+
+
+@transaction.atomic
+def bulk_transition(order_ids, new_status: str) -> BulkResult:
+    """Pasa los pedidos a `new_status`; los que no pueden hacerlo quedan en rejected."""
+    from apps.inventory.allocation import confirm_allocations, release_allocations
+    from apps.inventory.models import StockReservation
+    from apps.inventory.reservations import (
+        consume_reservations, release_reservations, settle_order_items,
+    )
+    from apps.promotions.models import Coupon
+
+    from .hooks import orders_status_changed
+
+    result = BulkResult()
+    orders = {
+        str(order.pk): order
+        for order in Order.objects.select_for_update()
+        .filter(pk__in=order_ids)
+        .only("pk", "status", "created_at", "shipping_department", "coupon_id")
+        .order_by("pk")
+    }
+    for order_id in map(str, order_ids):
+        order = orders.get(order_id)
+        if order is None:
+            result.rejected[order_id] = "No existe."
+        elif new_status not in TRANSITIONS.get(order.status, ()):
+            result.rejected[order_id] = f"No se puede pasar de {order.status} a {new_status}."
+        else:
+            result.updated.append(order_id)
+    if not result.updated:
+        return result
+
+    ids = result.updated
+    if new_status == S.PAID:
+        settle_order_items(ids, confirm=True)
+        confirm_allocations(ids)
+        consume_reservations(ids)
+        for coupon_id, uses in Counter(
+            orders[pk].coupon_id for pk in ids if orders[pk].coupon_id
+        ).items():
+            Coupon.objects.filter(pk=coupon_id).update(used_count=models.F("used_count") + uses)
+    elif new_status == S.CANCELLED:
+        with_reservations = set(
+            StockReservation.objects.filter(order_id__in=ids).values_list("order_id", flat=True)
+        )
+        release_reservations(ids)
+        # Pedidos sin reservas vivas (pagados o anteriores a StockReservation): por ítem
+        settle_order_items([pk for pk in ids if orders[pk].pk not in with_reservations], confirm=False)
+        release_allocations(ids)
+
+    Order.objects.filter(pk__in=ids).update(status=new_status, updated_at=timezone.now())
+    orders_status_changed([(orders[pk], orders[pk].status) for pk in ids], new_status)
+    _notify(ids, new_status)
+    return result
@@ -1,7 +1,7 @@
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
 
-from .views import OrderViewSet, RefundViewSet
+from .views import CustomerStatsViewSet, OrderViewSet, RefundBatchViewSet, RefundViewSet
 
 orders_router = DefaultRouter()
 orders_router.register("", OrderViewSet, basename="order")
@@ -9,7 +9,15 @@ orders_router.register("", OrderViewSet, basename="order")
 refunds_router = DefaultRouter()
 refunds_router.register("", RefundViewSet, basename="refund")
 
+refund_batches_router = DefaultRouter()
+refund_batches_router.register("", RefundBatchViewSet, basename="refund-batch")
+
+customers_router = DefaultRouter()
+customers_router.register("", CustomerStatsViewSet, basename="customer")
+
 urlpatterns = [
     path("refunds/", include(refunds_router.urls)),
+    path("refund-batches/", include(refund_batches_router.urls)),
+    path("customers/", include(customers_router.urls)),
     path("", include(orders_router.urls)),
 ]
\ No newline at end of file
@@ -1,55 +1,130 @@
 from rest_framework import viewsets, mixins, filters
 from rest_framework.permissions import IsAuthenticated, IsAdminUser
 from rest_framework.decorators import action
+from rest_framework.generics import get_object_or_404
 from rest_framework.response import Response
 from rest_framework import status
 from django_filters.rest_framework import DjangoFilterBackend
 
+from common.views import SparseQuerysetMixin
+
 from .tasks import send_order_status_email
 
 
-from .models import Order, Refund
-from .serializers import OrderSerializer, RefundSerializer, OrderStatusSerializer
+from . import analytics_cache, latency, pivot, refund_batches, timeseries
+from .transitions import bulk_transition
+from .archive import sources
+from .models import ArchivedOrder, ArchivedOrderItem, CustomerStats, Order, OrderDailyFact, OrderItem, Refund, RefundBatch, SalesDailyFact
+from .rollups import day_bounds, fact_days
+from .search import OrderSearchFilter
+from .serializers import ArchivedOrderSerializer, BulkRefundApproveSerializer, BulkStatusSerializer, CustomerStatsSerializer, OrderSerializer, OrderSummarySerializer, PivotSerializer, RefundBatchSerializer, RefundSerializer, OrderStatusSerializer
 
 from rest_framework.decorators import api_view, permission_classes
 from rest_framework.permissions import IsAdminUser
 from rest_framework.response import Response
 from django.db.models import Count
 
-from django.db.models import Sum, Count, F
+from django.apps import apps as django_apps
+from django.db.models import Sum, Count, F, OuterRef, Prefetch, Q, Subquery
+from django.http import Http404
+from django.db.models.functions import Coalesce
 from django.utils import timezone
 from datetime import timedelta
 
 
 class OrderViewSet(
+    SparseQuerysetMixin,
     mixins.ListModelMixin,
     mixins.RetrieveModelMixin,
     mixins.CreateModelMixin,
     viewsets.GenericViewSet,
 ):
     serializer_class = OrderSerializer
-    filter_backends = [DjangoFilterBackend, filters.SearchFilter, filters.OrderingFilter]
+    filter_backends = [DjangoFilterBackend, OrderSearchFilter, filters.OrderingFilter]
     filterset_fields = ["status"]
-    search_fields = ["guest_email", "guest_name", "shipping_name", "wompi_reference"]
     ordering_fields = ["created_at", "total"]
     ordering = ["-created_at"]
+    field_prefetch = {"items": ["items"], "refunds": ["refunds"]}
+    expand_prefetch = {
+        "items.variant": ["items__variant__stock", "items__variant__attribute_values__attribute_type"],
+    }
 
     def get_permissions(self):
-        if self.action in ["list_all", "update_status", "cancel"]:
+        if self.action in ["list_all", "update_status", "bulk_status", "cancel"]:
             return [IsAdminUser()]
         return [IsAuthenticated()]
 
+    def get_serializer_class(self):
+        if self.action == "list":
+            return OrderSummarySerializer
+        return OrderSerializer
+
     def get_queryset(self):
         user = self.request.user
-        # Admin ve todos los pedidos
-        if user.is_staff:
-            return Order.objects.prefetch_related(
-                "items__variant__product"
-            ).order_by("-created_at")
-        # Usuario normal solo ve los suyos
-        return Order.objects.filter(
-            user=user
-        ).prefetch_related("items__variant").order_by("-created_at")
+        # Admin ve todos los pedidos; usuario normal solo los suyos
+        orders = Order.objects.all() if user.is_staff else Order.objects.filter(user=user)
+
+        if self.action == "list":
+            return self.summaries(orders, OrderItem).order_by("-created_at")
+
+        return self.apply_sparse(orders).order_by("-created_at")
+
+    @staticmethod
+    def summaries(orders, item_model):
+        """Resumen en una sola consulta, sin ítems ni reembolsos anidados."""
+        first_item = (
+            item_model.objects
+            .filter(order=OuterRef("pk"))
+            .order_by("created_at")
+            .values("product_name")[:1]
+        )
+        return orders.annotate(
+            item_count=Coalesce(Sum("items__quantity"), 0),
+            first_item_name=Subquery(first_item),
+        )
+
+    def list(self, request, *args, **kwargs):
+        """
+        GET /api/orders/
+        "Mis pedidos": los activos y los archivados del usuario en una sola
+        lista paginada (UNION de los resúmenes). Admin ve solo los activos;
+        los archivados, en /api/orders/archived/.
+        """
+        if request.user.is_staff:
+            return super().list(request, *args, **kwargs)
+
+        fields = OrderSummarySerializer.Meta.fields
+        archived = self.summaries(ArchivedOrder.objects.filter(user=request.user), ArchivedOrderItem)
+        active = self.filter_queryset(self.get_queryset()).order_by().values(*fields)
+        archived = self.filter_queryset(archived).order_by().values(*fields)
+        ordering = filters.OrderingFilter().get_ordering(request, active, self)
+        orders = active.union(archived, all=True).order_by(*ordering, "-id")
+
+        page = self.paginate_queryset(orders)
+        return self.get_paginated_response(self.get_serializer(page, many=True).data)
+
+    def archived_orders(self):
+        user = self.request.user
+        orders = ArchivedOrder.objects.all() if user.is_staff else ArchivedOrder.objects.filter(user=user)
+        return orders.prefetch_related("items", "refunds").order_by("-created_at")
+
+    def retrieve(self, request, *args, **kwargs):
+        # Los pedidos viejos se leen del archivo con el mismo id
+        try:
+            return super().retrieve(request, *args, **kwargs)
+        except Http404:
+            order = get_object_or_404(self.archived_orders(), pk=kwargs["pk"])
+            return Response(ArchivedOrderSerializer(order, context=self.get_serializer_context()).data)
+
+    @action(detail=False, methods=["get"], url_path="archived")
+    def archived(self, request):
+        """
+        GET /api/orders/archived/
+        Pedidos cerrados archivados (archive.py) del usuario; admin ve todos.
+        """
+        page = self.paginate_queryset(self.archived_orders())
+        serializer = ArchivedOrderSerializer(page, many=True, context=self.get_serializer_context())
+        return self.get_paginated_response(serializer.data)
 
     @action(detail=True, methods=["patch"], url_path="status", permission_classes=[IsAdminUser])
     def update_status(self, request, pk=None):
@@ -64,6 +139,27 @@ class OrderViewSet(
         send_order_status_email.delay(str(order.id), serializer.data['status'])
         return Response(serializer.data)
 
+    @action(detail=False, methods=["post"], url_path="bulk-status", permission_classes=[IsAdminUser])
+    def bulk_status(self, request):
+        """
+        POST /api/orders/bulk-status/
+        Body: { "order_ids": [...], "status": "SHIPPED" }
+        Aplica el cambio a los pedidos cuya transición es válida y reporta el resto.
+        """
+        serializer = BulkStatusSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        result = bulk_transition(
+            [str(pk) for pk in serializer.validated_data["order_ids"]],
+            serializer.validated_data["status"],
+        )
+        return Response({
+            "updated": len(result.updated),
+            "rejected": [
+                {"id": order_id, "detail": detail}
+                for order_id, detail in result.rejected.items()
+            ],
+        })
+
     @action(detail=True, methods=["post"], permission_classes=[IsAdminUser])
     def cancel(self, request, pk=None):
         order = self.get_object()
@@ -82,7 +178,8 @@ class OrderViewSet(
         """
         orders = Order.objects.filter(
             status__in=[Order.Status.DELIVERED, Order.Status.PARTIALLY_REFUNDED]
-        ).prefetch_related("items__variant__product").order_by("-created_at")
+        ).order_by("-created_at")
+        orders = self.apply_sparse(orders)
         
         page = self.paginate_queryset(orders)
         if page is not None:
@@ -100,20 +197,25 @@ class OrderViewSet(
     def stats(self, request):
         """
         GET /api/orders/stats/
-        Retorna total de pedidos y conteo por estado en una sola query.
+        Retorna total de pedidos y conteo por estado, activos y archivados
+        (una query por tabla).
         """
-        status_counts = (
-            Order.objects
-            .values("status")
-            .annotate(count=Count("id"))
-            .order_by("status")
-        )
-        total = Order.objects.count()
-    
-        return Response({
-            "total": total,
-            "by_status": {item["status"]: item["count"] for item in status_counts},
-        })
+        cache_key = analytics_cache.cache_key("stats", {}, versions=[analytics_cache.STATUS_VERSION])
+        data = analytics_cache.get(cache_key)
+        if data is not None:
+            return Response(data)
+
+        by_status = {}
+        for order_model, _, _ in sources(django_apps):
+            for item in order_model.objects.values("status").annotate(count=Count("id")).order_by("status"):
+                by_status[item["status"]] = by_status.get(item["status"], 0) + item["count"]
+
+        data = {
+            "total": sum(by_status.values()),
+            "by_status": dict(sorted(by_status.items())),
+        }
+        analytics_cache.store(cache_key, data)
+        return Response(data)
 
     
     @action(
@@ -123,18 +225,28 @@ class OrderViewSet(
     permission_classes=[IsAdminUser]
 )
     def revenue(self, request):
-        from datetime import date
-
+        """
+        GET /api/orders/revenue/?department=&date_from=&date_to=&month=&granularity=
+        Ingresos de pedidos DELIVERED, leídos de OrderDailyFact.
+        `series` agrupa por hour|day|week|month (day por defecto); `daily`
+        se mantiene para los clientes que solo usan la serie diaria.
+        """
         department = request.query_params.get("department")
         date_from  = request.query_params.get("date_from")   # YYYY-MM-DD
         date_to    = request.query_params.get("date_to")     # YYYY-MM-DD
         month      = request.query_params.get("month")       # YYYY-MM
+        granularity = request.query_params.get("granularity", timeseries.DEFAULT_GRANULARITY)
+        if granularity not in timeseries.GRANULARITIES:
+            return Response(
+                {"granularity": f"Debe ser una de: {', '.join(timeseries.GRANULARITIES)}."},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
 
-        qs = Order.objects.filter(status=Order.Status.DELIVERED)
+        facts = OrderDailyFact.objects.all()
         if department:
-            qs = qs.filter(shipping_department__iexact=department)
+            facts = facts.filter(department__iexact=department)
 
-        now         = timezone.now()
+        now         = timezone.localtime()  # Los hechos se agrupan por día local
         today_start = now.replace(hour=0, minute=0, second=0, microsecond=0)
 
         # Rango para la gráfica
@@ -156,11 +268,10 @@ class OrderViewSet(
         else:
             range_start = today_start - timedelta(days=30)
             range_end   = now
-
-        def total_in_range(start, end):
-            return qs.filter(
-                created_at__gte=start, created_at__lt=end
-            ).aggregate(total=Sum("total"))["total"] or 0
+        first, last = fact_days(range_start, range_end)
+        error = timeseries.range_error(granularity, first, last)
+        if error:
+            return Response({"granularity": error}, status=status.HTTP_400_BAD_REQUEST)
 
         # Comparativas fijas (siempre hoy/semana/mes)
         week_start       = today_start - timedelta(days=7)
@@ -169,30 +280,48 @@ class OrderViewSet(
         prev_week_start  = week_start  - timedelta(days=7)
         prev_month_start = month_start - timedelta(days=30)
 
-        # Ingresos diarios para la gráfica
-        daily = (
-            qs.filter(created_at__gte=range_start, created_at__lte=range_end)
-            .extra(select={"day": "DATE(created_at)"})
-            .values("day")
-            .annotate(total=Sum("total"))
-            .order_by("day")
+        periods = {
+            "today":      (today_start, now),
+            "prev_today": (prev_today_start, today_start),
+            "week":       (week_start, now),
+            "prev_week":  (prev_week_start, week_start),
+            "month":      (month_start, now),
+            "prev_month": (prev_month_start, month_start),
+        }
+        cache_key = analytics_cache.cache_key(
+            "revenue",
+            {
+                "department": (department or "").lower(),
+                "range": (first, last),
+                "today": now.date(),
+                "granularity": granularity,
+            },
+            ranges=[fact_days(prev_month_start, now), (first, last)],
         )
+        data = analytics_cache.get(cache_key)
+        if data is not None:
+            return Response(data)
 
-        return Response({
-            "summary": {
-                "today":      float(total_in_range(today_start, now)),
-                "prev_today": float(total_in_range(prev_today_start, today_start)),
-                "week":       float(total_in_range(week_start, now)),
-                "prev_week":  float(total_in_range(prev_week_start, week_start)),
-                "month":      float(total_in_range(month_start, now)),
-                "prev_month": float(total_in_range(prev_month_start, month_start)),
-            },
-            "daily": [
-                {"day": str(row["day"]), "total": float(row["total"])}
-                for row in daily
-            ],
+        summary = timeseries.window_totals(facts, "day", "total", {
+            name: fact_days(start, end) for name, (start, end) in periods.items()
         })
 
+        # Serie para la gráfica (buckets vacíos en 0)
+        points = [
+            {"bucket": row["bucket"], "total": float(row["total"])}
+            for row in timeseries.order_series(granularity, first, last, department)
+        ]
+
+        data = {
+            "summary": {name: float(value or 0) for name, value in summary.items()},
+            "granularity": granularity,
+            "series": points,
+        }
+        if granularity == "day":
+            data["daily"] = [{"day": p["bucket"], "total": p["total"]} for p in points]
+        analytics_cache.store(cache_key, data)
+        return Response(data)
+
 
     @action(
         detail=False,
@@ -203,34 +332,40 @@ class OrderViewSet(
     def products_stats(self, request):
         """
         GET /api/orders/products-stats/?department=Nariño
-        Métricas de ventas por producto en pedidos DELIVERED.
+        Métricas de ventas por producto en pedidos DELIVERED (SalesDailyFact).
         """
         department = request.query_params.get("department")
 
-        qs = Order.objects.filter(status=Order.Status.DELIVERED)
-        if department:
-            qs = qs.filter(shipping_department__iexact=department)
+        cache_key = analytics_cache.cache_key(
+            "products_stats",
+            {"department": (department or "").lower()},
+            versions=[analytics_cache.FACTS_VERSION],
+        )
+        data = analytics_cache.get(cache_key)
+        if data is not None:
+            return Response(data)
 
-        order_ids = qs.values_list("id", flat=True)
+        facts = SalesDailyFact.objects.all()
+        if department:
+            facts = facts.filter(department__iexact=department)
 
-        from apps.orders.models import OrderItem
         items = (
-            OrderItem.objects
-            .filter(order_id__in=order_ids)
+            facts
             .values(
                 product_name=F("variant__product__name"),
                 variant_name=F("variant__name"),
                 sku=F("variant__sku"),
             )
             .annotate(
-                units_sold=Sum("quantity"),
-                revenue=Sum("subtotal"),
-                orders_count=Count("order", distinct=True),
+                units_sold=Sum("units"),
+                revenue=Sum("revenue"),
+                # Cada pedido cae en un solo día y departamento: la suma es exacta
+                orders_count=Sum("orders"),
             )
             .order_by("-revenue")
         )
 
-        return Response([
+        data = [
             {
                 "product_name":  row["product_name"],
                 "variant_name":  row["variant_name"],
@@ -240,8 +375,42 @@ class OrderViewSet(
                 "orders_count":  row["orders_count"],
             }
             for row in items
-        ])
+        ]
+        analytics_cache.store(cache_key, data)
+        return Response(data)
     
+    @staticmethod
+    def _filtered_order_counts(prev_first, first, last, department, brand_slug, category_slug, product_slug):
+        """
+        Pedidos distintos con ítems que cumplen los filtros (periodo actual y
+        anterior), activos y archivados: cada pedido está en una sola tabla.
+        """
+        range_start, _ = day_bounds(prev_first)
+        split, _       = day_bounds(first)
+        _, range_end   = day_bounds(last)
+        counts = {"current": 0, "previous": 0}
+        for _, item_model, _ in sources(django_apps):
+            items = item_model.objects.filter(
+                order__status=Order.Status.DELIVERED,
+                order__created_at__gte=range_start,
+                order__created_at__lt=range_end,
+            )
+            if department:
+                items = items.filter(order__shipping_department__iexact=department)
+            if brand_slug:
+                items = items.filter(variant__product__brand__slug=brand_slug)
+            if category_slug:
+                items = items.filter(variant__product__categories__slug=category_slug)
+            if product_slug:
+                items = items.filter(variant__product__slug=product_slug)
+            totals = items.aggregate(
+                current=Count("order", distinct=True, filter=Q(order__created_at__gte=split)),
+                previous=Count("order", distinct=True, filter=Q(order__created_at__lt=split)),
+            )
+            for key in counts:
+                counts[key] += totals[key]
+        return counts
+
     @action(
     detail=False,
     methods=["get"],
@@ -249,8 +418,13 @@ class OrderViewSet(
     permission_classes=[IsAdminUser]
     )
     def analytics(self, request):
-        from apps.orders.models import OrderItem
-        from apps.catalog.models import Category
+        """
+        GET /api/orders/analytics/?preset=last30&department=&brand=&category=&product=&granularity=
+        Dashboard de ventas DELIVERED, leído de las tablas de hechos diarias.
+        El periodo anterior es el mismo número de días inmediatamente antes.
+        `series` agrupa por hour|day|week|month; `daily` es la serie por día.
+        """
+        from apps.catalog.models import Product
 
         # ── Parámetros ──────────────────────────────────────────────────────
         preset       = request.query_params.get("preset")        # today|yesterday|last7|last30|this_month|this_year
@@ -260,8 +434,14 @@ class OrderViewSet(
         brand_slug   = request.query_params.get("brand")
         category_slug= request.query_params.get("category")
         product_slug = request.query_params.get("product")
+        granularity  = request.query_params.get("granularity", timeseries.DEFAULT_GRANULARITY)
+        if granularity not in timeseries.GRANULARITIES:
+            return Response(
+                {"granularity": f"Debe ser una de: {', '.join(timeseries.GRANULARITIES)}."},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
 
-        now         = timezone.now()
+        now         = timezone.localtime()  # Los hechos se agrupan por día local
         today_start = now.replace(hour=0, minute=0, second=0, microsecond=0)
 
         # ── Calcular rango actual ────────────────────────────────────────────
@@ -292,120 +472,116 @@ class OrderViewSet(
             range_start = today_start - timedelta(days=30)
             range_end   = now
 
-        # ── Periodo anterior (misma duración) ───────────────────────────────
-        duration       = range_end - range_start
-        prev_start     = range_start - duration
-        prev_end       = range_start
-
-        # ── QuerySet base ────────────────────────────────────────────────────
-        def base_qs(start, end):
-            qs = Order.objects.filter(
-                status=Order.Status.DELIVERED,
-                created_at__gte=start,
-                created_at__lte=end,
+        # ── Días cubiertos y periodo anterior (mismo número de días) ─────────
+        first, last = fact_days(range_start, range_end)
+        error = timeseries.range_error(granularity, first, last)
+        if error:
+            return Response({"granularity": error}, status=status.HTTP_400_BAD_REQUEST)
+        days        = (last - first).days + 1
+        prev_first  = first - timedelta(days=days)
+        prev_last   = first - timedelta(days=1)
+        current     = Q(day__gte=first)
+        windows     = {"current": (first, last), "previous": (prev_first, prev_last)}
+
+        cache_key = analytics_cache.cache_key(
+            "analytics",
+            {
+                "range":      (first, last),
+                "department": (department or "").lower(),
+                "brand":      brand_slug or "",
+                "category":   category_slug or "",
+                "product":    product_slug or "",
+                "granularity": granularity,
+            },
+            ranges=[(prev_first, last)],
+        )
+        data = analytics_cache.get(cache_key)
+        if data is not None:
+            return Response(data)
+
+        # ── Tablas de hechos ─────────────────────────────────────────────────
+        facts        = SalesDailyFact.objects.filter(day__range=(prev_first, last))
+        order_facts  = OrderDailyFact.objects.filter(day__range=(prev_first, last))
+        if department:
+            facts       = facts.filter(department__iexact=department)
+            order_facts = order_facts.filter(department__iexact=department)
+        if brand_slug:
+            facts = facts.filter(brand__slug=brand_slug)
+        if category_slug:
+            facts = facts.filter(
+                product__in=Product.objects.filter(categories__slug=category_slug)
             )
-            if department:
-                qs = qs.filter(shipping_department__iexact=department)
-            return qs
+        if product_slug:
+            facts = facts.filter(product__slug=product_slug)
+
+        revenue = timeseries.window_totals(facts, "day", "revenue", windows)
+        if brand_slug or category_slug or product_slug:
+            # Los pedidos distintos no se pueden sumar entre variantes
+            counts = self._filtered_order_counts(
+                prev_first, first, last, department, brand_slug, category_slug, product_slug
+            )
+        else:
+            counts = timeseries.window_totals(order_facts, "day", "orders", windows)
 
-        qs_current  = base_qs(range_start, range_end)
-        qs_previous = base_qs(prev_start,  prev_end)
+        rev, prev_rev       = float(revenue["current"] or 0), float(revenue["previous"] or 0)
+        orders, prev_orders = counts["current"] or 0, counts["previous"] or 0
+        ticket      = rev / orders if orders else 0
+        prev_ticket = prev_rev / prev_orders if prev_orders else 0
 
-        def items_qs(order_qs):
-            ids = order_qs.values_list("id", flat=True)
-            iq  = OrderItem.objects.filter(order_id__in=ids)
-            if brand_slug:
-                iq = iq.filter(variant__product__brand__slug=brand_slug)
-            if category_slug:
-                iq = iq.filter(variant__product__categories__slug=category_slug)
-            if product_slug:
-                iq = iq.filter(variant__product__slug=product_slug)
-            return iq
-
-        items_current  = items_qs(qs_current)
-        items_previous = items_qs(qs_previous)
-        def agg(qs_orders, qs_items):
-            rev = float(qs_items.aggregate(total=Sum("subtotal"))["total"] or 0)
-            cnt = qs_items.values("order").distinct().count()
-            return rev, cnt, (rev / cnt if cnt else 0)
-
-        rev,      orders,      ticket      = agg(qs_current,  items_current)
-        prev_rev, prev_orders, prev_ticket = agg(qs_previous, items_previous)
-        
         def pct(current, previous):
             if not previous:
                 return 100.0 if current > 0 else 0.0
             return round((current - previous) / previous * 100, 1)
 
-        # ── Ingresos diarios ─────────────────────────────────────────────────
-        daily = (
-            qs_current
-            .extra(select={"day": "DATE(created_at)"})
-            .values("day")
-            .annotate(
-                revenue=Sum("total"),
-                orders=Count("id"),
-            )
-            .order_by("day")
-        )
-
-        # ── Top 10 productos por unidades ────────────────────────────────────
-        top_products = (
-            items_current
-            .values(
-                pname=F("variant__product__name"),
-                pslug=F("variant__product__slug"),
-            )
-            .annotate(units_sold=Sum("quantity"), revenue=Sum("subtotal"))
-            .order_by("-units_sold")[:10]
-        )
+        # ── Serie de ingresos (buckets vacíos en 0) ─────────────────────────
+        points = [
+            {"bucket": r["bucket"], "revenue": float(r["total"]), "orders": r["orders"]}
+            for r in timeseries.order_series(granularity, first, last, department)
+        ]
 
-        # ── Top 10 productos por ingresos ────────────────────────────────────
-        revenue_by_product = (
-            items_current
+        # ── Productos, categorías y marcas: una sola consulta agrupada ───────
+        products, categories, brands = {}, {}, {}
+        for r in (
+            facts.filter(current)
             .values(
-                pname=F("variant__product__name"),
-                pslug=F("variant__product__slug"),
+                "product_id",
+                pname=F("product__name"),
+                cat_name=F("root_category__name"),
+                brand_name=F("brand__name"),
             )
-            .annotate(revenue=Sum("subtotal"), units_sold=Sum("quantity"))
-            .order_by("-revenue")[:10]
-        )
-
-        # ── Por categoría ────────────────────────────────────────────────────
-        by_category = (
-            items_current
-            .filter(variant__product__categories__parent=None)  # ← solo raíz
-            .values(cat_name=F("variant__product__categories__name"))
-            .annotate(revenue=Sum("subtotal"), units_sold=Sum("quantity"))
-            .exclude(cat_name=None)
-            .order_by("-revenue")
-        )
-
-        # ── Por marca ────────────────────────────────────────────────────────
-        by_brand = (
-            items_current
-            .values(brand_name=F("variant__product__brand__name"))
-            .annotate(revenue=Sum("subtotal"), units_sold=Sum("quantity"))
-            .order_by("-revenue")
-        )
-
-       
+            .annotate(units_sold=Sum("units"), revenue=Sum("revenue"))
+        ):
+            for groups, key, label in (
+                (products, r["product_id"], r["pname"]),
+                (categories, r["cat_name"], r["cat_name"]),
+                (brands, r["brand_name"], r["brand_name"]),
+            ):
+                if key is None:
+                    continue
+                row = groups.setdefault(key, {"name": label, "units_sold": 0, "revenue": 0})
+                row["units_sold"] += r["units_sold"]
+                row["revenue"]    += r["revenue"]
+
+        top_products       = sorted(products.values(), key=lambda r: r["units_sold"], reverse=True)[:10]
+        revenue_by_product = sorted(products.values(), key=lambda r: r["revenue"], reverse=True)[:10]
+        by_category        = sorted(categories.values(), key=lambda r: r["revenue"], reverse=True)
+        by_brand           = sorted(brands.values(), key=lambda r: r["revenue"], reverse=True)
 
         # ── Por departamento ─────────────────────────────────────────────────
         by_department = (
-            qs_current
-            .values("shipping_department")
+            order_facts.filter(current)
+            .values("department")
             .annotate(
                 revenue=Sum("subtotal") - Sum("discount_amount"),
-                orders_count=Count("id")
+                orders_count=Sum("orders"),
             )
             .order_by("-revenue")
         )
 
-        return Response({
+        data = {
             "period": {
-                "start": range_start.date().isoformat(),
-                "end":   range_end.date().isoformat(),
+                "start": first.isoformat(),
+                "end":   last.isoformat(),
             },
             "summary": {
                 "revenue":      rev,
@@ -418,17 +594,11 @@ class OrderViewSet(
                 "pct_orders":   pct(orders, prev_orders),
                 "pct_ticket":   pct(ticket, prev_ticket),
             },
-            "daily": [
-                {
-                    "day":     str(r["day"]),
-                    "revenue": float(r["revenue"]),
-                    "orders":  r["orders"],
-                }
-                for r in daily
-            ],
+            "granularity": granularity,
+            "series": points,
             "top_products": [
                 {
-                    "product_name": r["pname"],
+                    "product_name": r["name"],
                     "units_sold":   r["units_sold"],
                     "revenue":      float(r["revenue"]),
                 }
@@ -436,7 +606,7 @@ class OrderViewSet(
             ],
             "revenue_by_product": [
                 {
-                    "product_name": r["pname"],
+                    "product_name": r["name"],
                     "revenue":      float(r["revenue"]),
                     "units_sold":   r["units_sold"],
                 }
@@ -444,7 +614,7 @@ class OrderViewSet(
             ],
             "by_category": [
                 {
-                    "category":   r["cat_name"],
+                    "category":   r["name"],
                     "revenue":    float(r["revenue"]),
                     "units_sold": r["units_sold"],
                 }
@@ -452,7 +622,7 @@ class OrderViewSet(
             ],
             "by_brand": [
                 {
-                    "brand":      r["brand_name"],
+                    "brand":      r["name"],
                     "revenue":    float(r["revenue"]),
                     "units_sold": r["units_sold"],
                 }
@@ -460,13 +630,74 @@ class OrderViewSet(
             ],
             "by_department": [
                 {
-                    "department":   r["shipping_department"],
+                    "department":   r["department"],
                     "revenue":      float(r["revenue"]),
                     "orders_count": r["orders_count"],
                 }
                 for r in by_department
             ],
-        })
+        }
+        if granularity == "day":
+            data["daily"] = [
+                {"day": p["bucket"], "revenue": p["revenue"], "orders": p["orders"]}
+                for p in points
+            ]
+        analytics_cache.store(cache_key, data)
+        return Response(data)
+
+    @action(
+        detail=False,
+        methods=["get"],
+        url_path="fulfillment-latency",
+        permission_classes=[IsAdminUser]
+    )
+    def fulfillment_latency(self, request):
+        """
+        GET /api/orders/fulfillment-latency/?weeks=12&department=
+        p50/p95 (horas) de Pagado→Enviado→Entregado por semana y departamento,
+        leídos del histograma incremental (latency.py).
+        """
+        try:
+            weeks = min(max(int(request.query_params.get("weeks", 12)), 1), 104)
+        except ValueError:
+            return Response({"weeks": "Debe ser un entero."}, status=status.HTTP_400_BAD_REQUEST)
+        return Response(latency.summary(weeks, request.query_params.get("department")))
+
+    @action(
+        detail=False,
+        methods=["post"],
+        url_path="pivot",
+        permission_classes=[IsAdminUser]
+    )
+    def pivot(self, request):
+        """
+        POST /api/orders/pivot/
+        {"rows": ["brand", "department", "week"], "coupon": "VERANO", "date_from": "2026-01-01"}
+        Pivot ad-hoc de unidades e ingresos sobre el caché columnar (pivot.py).
+        """
+        serializer = PivotSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        return Response(pivot.pivot(**serializer.validated_data))
+
+
+class CustomerStatsViewSet(viewsets.ReadOnlyModelViewSet):
+    """
+    GET /api/orders/customers/?segment=at_risk&ordering=-total_spent
+    Clientes con sus agregados y segmento RFM (customers.py), paginados.
+    """
+    permission_classes = [IsAdminUser]
+    serializer_class = CustomerStatsSerializer
+    queryset = CustomerStats.objects.all()
+    lookup_field = "email"
+    lookup_value_regex = "[^/]+"
+    filterset_fields = {
+        "segment": ["exact", "in"],
+        "orders_count": ["gte"],
+        "last_order_at": ["gte", "lt"],
+    }
+    search_fields = ["email"]
+    ordering_fields = ["total_spent", "orders_count", "last_order_at", "first_order_at", "refunded_amount"]
+    ordering = ["-total_spent", "email"]
 
 
 class RefundViewSet(
@@ -498,4 +729,40 @@ class RefundViewSet(
             refund.approve()
         except ValueError as e:
             return Response({"detail": str(e)}, status=status.HTTP_400_BAD_REQUEST)
-        return Response({"status": "aprobado"})
\ No newline at end of file
+        # Wompi y el stock se procesan en orders.process_refund
+        return Response({"status": "procesando"}, status=status.HTTP_202_ACCEPTED)
+
+    @action(detail=False, methods=["post"], url_path="bulk-approve")
+    def bulk_approve(self, request):
+        """
+        POST /api/orders/refunds/bulk-approve/
+        Body: { "refund_ids": [...] }
+        Crea un RefundBatch con los reembolsos PENDING/FAILED y lo procesa en
+        segundo plano; el progreso se consulta en /api/orders/refund-batches/<id>/.
+        """
+        serializer = BulkRefundApproveSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        batch, skipped = refund_batches.start_batch(serializer.validated_data["refund_ids"], request.user)
+        if batch is None:
+            return Response(
+                {"detail": "Ningún reembolso está en estado PENDING o FAILED.", "skipped": skipped},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        return Response(
+            {"batch": str(batch.pk), "total": batch.total, "skipped": skipped},
+            status=status.HTTP_202_ACCEPTED,
+        )
+
+
+class RefundBatchViewSet(viewsets.ReadOnlyModelViewSet):
+    """
+    GET /api/orders/refund-batches/<id>/
+    Estado de una aprobación en bloque con el resultado de cada reembolso.
+    """
+    permission_classes = [IsAdminUser]
+    serializer_class = RefundBatchSerializer
+
+    def get_queryset(self):
+        return refund_batches.with_progress(RefundBatch.objects.all()).prefetch_related(
+            Prefetch("refunds", queryset=Refund.objects.select_related("order").order_by("created_at"))
+        )
@@ -0,0 +1,66 @@
+"""
+Caché del acceptance_token de Wompi.
+
+El token es del comercio y cambia poco, así que el checkout no lo pide a
+Wompi en cada pedido: lo lee de la caché (Redis). La entrada guarda el
+token y la hora en que se obtuvo:
+
+  - Hasta WOMPI_ACCEPTANCE_TOKEN_TTL segundos está fresca.
+  - Después se sirve igual (stale-while-revalidate) y se encola
+    payments.refresh_acceptance_token, una sola vez gracias a REFRESH_LOCK.
+  - La entrada vence a los WOMPI_ACCEPTANCE_TOKEN_MAX_AGE segundos, así que
+    una caída corta de Wompi no afecta al checkout.
+
+Beat la refresca antes de que deje de estar fresca. Solo con la caché vacía
+(arranque en frío, Redis reiniciado) el checkout la pide a Wompi en línea.
+"""
+from __future__ import annotations
+
+import logging
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+
+from .wompi import WompiService
+
+logger = logging.getLogger(__name__)
+
+CACHE_KEY = "wompi:acceptance_token"
+REFRESH_LOCK = "wompi:acceptance_token:refreshing"
+REFRESH_LOCK_TIMEOUT = 60
+
+
+def get_token() -> str:
+    """acceptance_token para el Widget; "" si Wompi no responde y no hay caché."""
+    entry = cache.get(CACHE_KEY)
+    if entry is None:
+        return refresh()
+    if time.time() - entry["fetched_at"] >= settings.WOMPI_ACCEPTANCE_TOKEN_TTL:
+        _schedule_refresh()
+    return entry["token"]
+
+
+def refresh() -> str:
+    """Pide el token a Wompi y lo guarda; si falla conserva (y retorna) el anterior."""
+    token = WompiService().get_acceptance_token()
+    if token:
+        cache.set(
+            CACHE_KEY,
+            {"token": token, "fetched_at": time.time()},
+            timeout=settings.WOMPI_ACCEPTANCE_TOKEN_MAX_AGE,
+        )
+    else:
+        entry = cache.get(CACHE_KEY)
+        token = entry["token"] if entry else ""
+        logger.warning("No se pudo refrescar el acceptance token; se mantiene el anterior.")
+    cache.delete(REFRESH_LOCK)
+    return token
+
+
+def _schedule_refresh() -> None:
+    from .tasks import refresh_acceptance_token
+
+    if cache.add(REFRESH_LOCK, 1, timeout=REFRESH_LOCK_TIMEOUT):
+        transaction.on_commit(refresh_acceptance_token.delay, robust=True)
@@ -1,3 +1,46 @@
-from django.contrib import admin
+from django.contrib import admin, messages
 
-# Register your models here.
+from .events import exhausted_events
+from .models import PaymentEvent
+from .tasks import process_payment_event
+
+
+class ExhaustedFilter(admin.SimpleListFilter):
+    title = "intentos agotados"
+    parameter_name = "exhausted"
+
+    def lookups(self, request, model_admin):
+        return [("1", "Intentos agotados")]
+
+    def queryset(self, request, queryset):
+        if self.value() == "1":
+            return queryset & exhausted_events()
+        return queryset
+
+
+@admin.register(PaymentEvent)
+class PaymentEventAdmin(admin.ModelAdmin):
+    list_display = [
+        "transaction_id", "transaction_status", "reference", "received_at",
+        "processed_at", "attempts", "needs_manual_refund",
+    ]
+    list_filter = ["transaction_status", "event", "needs_manual_refund", ExhaustedFilter]
+    search_fields = ["transaction_id", "reference"]
+    readonly_fields = [
+        "event", "transaction_id", "transaction_status", "reference", "timestamp",
+        "payload", "received_at", "processed_at", "attempts", "error",
+        "needs_manual_refund",
+    ]
+    actions = ["reprocess"]
+
+    def has_add_permission(self, request):
+        return False
+
+    @admin.action(description="Reprocesar eventos seleccionados")
+    def reprocess(self, request, queryset):
+        ids = list(queryset.filter(processed_at__isnull=True).values_list("pk", flat=True))
+        # Un reproceso manual devuelve los intentos al barrido periódico
+        PaymentEvent.objects.filter(pk__in=ids).update(attempts=0)
+        for event_id in ids:
+            process_payment_event.delay(event_id)
+        self.message_user(request, f"{len(ids)} evento(s) encolados.", messages.SUCCESS)
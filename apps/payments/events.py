@@ -0,0 +1,192 @@
+"""
+Eventos de pago de Wompi.
+
+El webhook solo valida la firma y llama a record_event(): un INSERT en
+PaymentEvent y la tarea payments.process_event encolada al confirmar. Una
+entrega repetida choca con la clave única y no se vuelve a encolar.
+
+process_event() aplica el evento con el pedido bloqueado, así que dos
+eventos del mismo pedido no se pisan. Como los eventos se procesan fuera de
+orden, solo mueve pedidos cuyo pago sigue abierto (OPEN_STATUSES): un
+PENDING que llega tarde no deshace un pago aprobado. La excepción es un
+APPROVED sobre un pedido CANCELLED (la reserva venció mientras el cliente
+pagaba): se vuelve a reservar el stock y pasa a PAID; si ya no alcanza, el
+evento queda con needs_manual_refund.
+
+Si la tarea no se pudo encolar o agotó sus reintentos, pending_event_ids()
+la recoge en el barrido periódico. Un evento que falló MAX_ATTEMPTS veces ya
+no se reencola: queda en exhausted_events() para revisión manual (filtro
+"Intentos agotados" en el admin).
+"""
+from __future__ import annotations
+
+import logging
+from datetime import timedelta
+
+from django.db import IntegrityError, models, transaction
+from django.utils import timezone
+
+from apps.orders.models import Order
+
+from .models import PaymentEvent
+
+logger = logging.getLogger(__name__)
+
+S = Order.Status
+
+STATUS_MAP = {
+    "APPROVED": S.PAID,
+    "DECLINED": S.CANCELLED,
+    "VOIDED":   S.CANCELLED,
+    "ERROR":    S.CANCELLED,
+    "PENDING":  S.PAYMENT_PROCESSING,
+}
+
+# Estados del pedido en que el resultado del pago todavía puede cambiarlo
+OPEN_STATUSES = [S.PENDING_PAYMENT, S.PAYMENT_PROCESSING]
+
+# El barrido solo reencola eventos sin procesar más viejos que esto
+PENDING_GRACE = timedelta(minutes=2)
+PENDING_BATCH_SIZE = 500
+# Fallos tras los que el barrido deja de reencolar el evento (~3 rondas de reintentos)
+MAX_ATTEMPTS = 18
+
+
+def record_event(event: str, transaction_data: dict, timestamp: int, payload: dict) -> PaymentEvent | None:
+    """Guarda el evento y encola su procesamiento. None si es una entrega repetida."""
+    from .tasks import process_payment_event
+
+    try:
+        with transaction.atomic():
+            payment_event = PaymentEvent.objects.create(
+                event=event,
+                transaction_id=transaction_data.get("id") or "",
+                transaction_status=transaction_data.get("status") or "",
+                reference=transaction_data.get("reference") or "",
+                timestamp=timestamp,
+                payload=payload,
+            )
+    except IntegrityError:
+        return None
+    event_id = payment_event.pk
+    transaction.on_commit(lambda: process_payment_event.delay(event_id), robust=True)
+    return payment_event
+
+
+def process_event(event_id: int) -> None:
+    """Aplica el evento al pedido; no hace nada si ya se procesó."""
+    with transaction.atomic():
+        event = PaymentEvent.objects.select_for_update().get(pk=event_id)
+        if event.processed_at:
+            return
+        event.error = ""
+        if event.event == "transaction.updated":
+            _apply_transaction_updated(event)
+        event.processed_at = timezone.now()
+        event.save(update_fields=["processed_at", "error", "needs_manual_refund"])
+
+
+def record_failure(event_id: int, error: Exception) -> None:
+    PaymentEvent.objects.filter(pk=event_id).update(
+        attempts=models.F("attempts") + 1, error=str(error),
+    )
+
+
+def pending_event_ids(now=None) -> list[int]:
+    """Eventos sin procesar que ya deberían haberse procesado y aún tienen intentos."""
+    cutoff = (now or timezone.now()) - PENDING_GRACE
+    return list(
+        PaymentEvent.objects.filter(
+            processed_at__isnull=True, received_at__lt=cutoff, attempts__lt=MAX_ATTEMPTS,
+        )
+        .order_by("received_at")
+        .values_list("pk", flat=True)[:PENDING_BATCH_SIZE]
+    )
+
+
+def exhausted_events():
+    """Eventos sin procesar que agotaron MAX_ATTEMPTS; requieren revisión manual."""
+    return PaymentEvent.objects.filter(processed_at__isnull=True, attempts__gte=MAX_ATTEMPTS)
+
+
+def _apply_transaction_updated(event: PaymentEvent) -> None:
+    from apps.inventory.allocation import confirm_allocations, release_allocations
+    from apps.inventory.reservations import (
+        consume_reservations, release_reservations, settle_order_items,
+    )
+    from apps.orders.tasks import send_order_paid_email
+    from apps.promotions.models import Coupon
+
+    if not event.reference:
+        return
+    order = Order.objects.select_for_update().filter(wompi_reference=event.reference).first()
+    if order is None:
+        logger.error("Webhook: Order con referencia '%s' no encontrada.", event.reference)
+        return
+
+    if event.transaction_id and not order.wompi_transaction_id:
+        order.wompi_transaction_id = event.transaction_id
+
+    new_status = STATUS_MAP.get(event.transaction_status)
+    if new_status == S.PAID and order.status == S.CANCELLED:
+        # Pago aprobado de un pedido que venció mientras el cliente pagaba
+        if not _reserve_again(event, order):
+            order.save(update_fields=["wompi_transaction_id", "updated_at"])
+            return
+    elif not new_status or order.status == new_status or order.status not in OPEN_STATUSES:
+        if new_status and order.status != new_status:
+            logger.info(
+                "Webhook: evento %s ignorado, Order %s ya está en %s.",
+                event.transaction_status, order.wompi_reference, order.status,
+            )
+        order.save(update_fields=["wompi_transaction_id", "updated_at"])
+        return
+
+    if new_status == S.PAID:
+        settle_order_items([order.pk], confirm=True)
+        confirm_allocations([order.pk])
+        consume_reservations([order.pk])
+        if order.coupon_id:
+            Coupon.objects.filter(pk=order.coupon_id).update(used_count=models.F("used_count") + 1)
+        order_id = str(order.pk)
+        transaction.on_commit(lambda: send_order_paid_email.delay(order_id))
+    elif new_status == S.CANCELLED:
+        # Sin reservas vivas (pedidos previos a StockReservation): por ítem
+        if not release_reservations([order.pk]):
+            settle_order_items([order.pk], confirm=False)
+        release_allocations([order.pk])
+
+    order.status = new_status
+    order.save(update_fields=["status", "wompi_transaction_id", "updated_at"])
+    logger.info("Order %s → %s (Wompi: %s)", order.wompi_reference, new_status, event.transaction_status)
+
+
+def _reserve_again(event: PaymentEvent, order: Order) -> bool:
+    """
+    Vuelve a reservar stock (y bodega) de un pedido CANCELLED cuyo pago se
+    aprobó, para pasarlo a PAID. Si ya no hay stock, marca el evento para
+    reembolso manual y retorna False.
+    """
+    from django.core.exceptions import ValidationError
+
+    from apps.inventory import hot_stock
+    from apps.inventory.allocation import allocate
+    from apps.inventory.reservations import reserve_units
+
+    lines = {}
+    for variant_id, qty in order.items.values_list("variant_id", "quantity"):
+        lines[variant_id] = lines.get(variant_id, 0) + qty
+    try:
+        with hot_stock.reservation_guard(), transaction.atomic():
+            reserve_units(lines, reference=order.wompi_reference)
+            allocate(order, lines, order.shipping_department)
+    except ValidationError as e:
+        event.needs_manual_refund = True
+        event.error = f"Pago aprobado de un pedido cancelado sin stock para reactivarlo: {e.messages[0]}"
+        logger.error(
+            "Webhook: Order %s cancelada con pago aprobado (txn %s); requiere reembolso manual. %s",
+            order.wompi_reference, event.transaction_id, e.messages[0],
+        )
+        return False
+    logger.warning("Webhook: Order %s cancelada reactivada por pago aprobado.", order.wompi_reference)
+    return True
@@ -0,0 +1,57 @@
+# Generated by Django 6.0.2 on 2026-10-19 01:12
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = []
+
+    operations = [
+        migrations.CreateModel(
+            name="PaymentEvent",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("event", models.CharField(max_length=50)),
+                ("transaction_id", models.CharField(max_length=100)),
+                ("transaction_status", models.CharField(max_length=20)),
+                (
+                    "reference",
+                    models.CharField(blank=True, db_index=True, max_length=100),
+                ),
+                ("timestamp", models.BigIntegerField()),
+                ("payload", models.JSONField()),
+                ("received_at", models.DateTimeField(auto_now_add=True)),
+                ("processed_at", models.DateTimeField(blank=True, null=True)),
+                ("attempts", models.PositiveSmallIntegerField(default=0)),
+                ("error", models.TextField(blank=True)),
+            ],
+            options={
+                "db_table": "payments_events",
+                "ordering": ["-received_at"],
+                "indexes": [
+                    models.Index(
+                        condition=models.Q(("processed_at__isnull", True)),
+                        fields=["received_at"],
+                        name="payment_event_pending_idx",
+                    )
+                ],
+                "constraints": [
+                    models.UniqueConstraint(
+                        fields=("transaction_id", "transaction_status", "timestamp"),
+                        name="payment_event_unique_delivery",
+                    )
+                ],
+            },
+        ),
+    ]
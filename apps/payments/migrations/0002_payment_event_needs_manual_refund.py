@@ -0,0 +1,18 @@
+# Generated by Django 6.0.2 on 2026-10-19 01:46
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("payments", "0001_initial"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="paymentevent",
+            name="needs_manual_refund",
+            field=models.BooleanField(default=False),
+        ),
+    ]
@@ -1,3 +1,42 @@
 from django.db import models
 
-# Create your models here.
+
+class PaymentEvent(models.Model):
+    """
+    Evento de Wompi tal como llegó al webhook, ya con la firma validada.
+    La clave única (transaction_id, transaction_status, timestamp) descarta
+    las entregas repetidas; events.process_event() lo aplica al pedido.
+    """
+    event = models.CharField(max_length=50)
+    transaction_id = models.CharField(max_length=100)
+    transaction_status = models.CharField(max_length=20)
+    reference = models.CharField(max_length=100, blank=True, db_index=True)
+    timestamp = models.BigIntegerField()
+    payload = models.JSONField()
+    received_at = models.DateTimeField(auto_now_add=True)
+    processed_at = models.DateTimeField(null=True, blank=True)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    error = models.TextField(blank=True)
+    # Pago aprobado que no se pudo aplicar al pedido (ver events._reserve_again)
+    needs_manual_refund = models.BooleanField(default=False)
+
+    class Meta:
+        db_table = "payments_events"
+        ordering = ["-received_at"]
+        constraints = [
+            models.UniqueConstraint(
+                fields=["transaction_id", "transaction_status", "timestamp"],
+                name="payment_event_unique_delivery",
+            ),
+        ]
+        indexes = [
+            # Barrido de eventos sin procesar (process_pending_events)
+            models.Index(
+                fields=["received_at"],
+                condition=models.Q(processed_at__isnull=True),
+                name="payment_event_pending_idx",
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.transaction_id} {self.transaction_status} ({self.timestamp})"
@@ -0,0 +1,43 @@
+from __future__ import annotations
+
+import logging
+
+from celery import shared_task
+
+logger = logging.getLogger(__name__)
+
+
+@shared_task(bind=True, name="payments.process_event", max_retries=5, default_retry_delay=30)
+def process_payment_event(self, event_id: int) -> str:
+    """Aplica un PaymentEvent al pedido (events.process_event)."""
+    from apps.payments.events import process_event, record_failure
+    try:
+        process_event(event_id)
+    except Exception as exc:
+        record_failure(event_id, exc)
+        logger.exception("process_payment_event %s falló.", event_id)
+        raise self.retry(exc=exc)
+    return f"{event_id}: procesado"
+
+
+@shared_task(name="payments.process_pending_events")
+def process_pending_events():
+    """Reencola los eventos de Wompi que quedaron sin procesar y reporta los agotados."""
+    from apps.payments.events import exhausted_events, pending_event_ids
+    ids = pending_event_ids()
+    for event_id in ids:
+        process_payment_event.delay(event_id)
+    if ids:
+        logger.warning("process_pending_events: %d eventos reencolados.", len(ids))
+    exhausted = exhausted_events().count()
+    if exhausted:
+        logger.error("process_pending_events: %d eventos agotaron sus intentos; requieren revisión manual.", exhausted)
+    return f"{len(ids)} eventos reencolados, {exhausted} agotados"
+
+
+@shared_task(name="payments.refresh_acceptance_token")
+def refresh_acceptance_token():
+    """Renueva el acceptance_token de Wompi en caché (acceptance.py)."""
+    from apps.payments.acceptance import refresh
+    token = refresh()
+    return "renovado" if token else "sin token"
@@ -1,11 +1,12 @@
 from __future__ import annotations
 
 import logging
+from collections import Counter
 from decimal import Decimal
 
 from django.conf import settings
+from django.core.exceptions import ValidationError
 from django.db import transaction
-from django.db import models
 
 from rest_framework.views import APIView
 from rest_framework.response import Response
@@ -13,6 +14,9 @@ from rest_framework.permissions import AllowAny, IsAuthenticated
 from rest_framework import status
 
 from apps.catalog.models import Variant
+from apps.inventory import hot_stock
+from apps.inventory.allocation import allocate
+from apps.inventory.reservations import create_reservations, reserve_units
 from apps.orders.models import Order, OrderItem
 from apps.promotions.models import Coupon
 from apps.shipping.services import calculate_shipping
@@ -22,9 +26,11 @@ from .serializers import (
     CheckoutResponseSerializer,
     TransactionStatusSerializer,
 )
+from . import acceptance
+from .events import record_event
 from .wompi import WompiService
 
-from apps.orders.tasks import send_order_paid_email
+from apps.orders.tasks import reservation_expiry, schedule_reservation_expiry
 
 
 logger = logging.getLogger(__name__)
@@ -53,21 +59,28 @@ class CheckoutView(APIView):
         data = serializer.validated_data
 
         # ── 1. Validar items y calcular subtotal ───────────────────────────
-        items_data = []
-        subtotal = Decimal("0")
-
+        # Todas las variantes con su stock en una consulta
+        variants = Variant.objects.select_related("product", "stock").in_bulk(
+            {item["variant_id"] for item in data["items"]}
+        )
+        requested = Counter()
         for item in data["items"]:
-            try:
-                variant = Variant.objects.select_related(
-                    "product", "stock"
-                ).get(id=item["variant_id"], is_active=True)
-            except Variant.DoesNotExist:
+            variant = variants.get(item["variant_id"])
+            if variant is None or not variant.is_active:
                 return Response(
                     {"detail": f"Variante {item['variant_id']} no encontrada."},
                     status=status.HTTP_400_BAD_REQUEST,
                 )
+            requested[variant.id] += item["quantity"]
+
+        items_data = []
+        subtotal = Decimal("0")
 
-            if variant.stock.available < item["quantity"]:
+        for item in data["items"]:
+            variant = variants[item["variant_id"]]
+
+            # Las variantes hot se validan contra Redis al reservar
+            if not variant.stock.is_hot and variant.stock.available < requested[variant.id]:
                 return Response(
                     {
                         "detail": f"Stock insuficiente para '{variant.product.name} - {variant.name}'. "
@@ -151,19 +164,39 @@ class CheckoutView(APIView):
         )
 
         # ── 7. Crear OrderItems y reservar stock ───────────────────────────
-        for item in items_data:
-            variant = item["variant"]
-            OrderItem.objects.create(
-                order=order,
-                variant=variant,
-                product_name=variant.product.name,
-                variant_name=variant.name,
-                sku=variant.sku,
-                unit_price=item["unit_price"],
-                quantity=item["quantity"],
-                subtotal=item["subtotal"],
+        # Reservas hot: el guard las devuelve si el bloque falla; si la
+        # transacción se revierte más adelante, las libera release_abandoned.
+        try:
+            with hot_stock.reservation_guard():
+                OrderItem.objects.bulk_create([
+                    OrderItem(
+                        order=order,
+                        variant=item["variant"],
+                        product_name=item["variant"].product.name,
+                        variant_name=item["variant"].name,
+                        sku=item["variant"].sku,
+                        unit_price=item["unit_price"],
+                        quantity=item["quantity"],
+                        subtotal=item["subtotal"],
+                    )
+                    for item in items_data
+                ])
+                # Filas de Stock bloqueadas en orden de pk, un solo UPDATE
+                lines = dict(requested)
+                reserve_units(lines, reference=order.wompi_reference)
+                create_reservations(order, lines, reservation_expiry())
+
+                # Reparte el pedido entre bodegas según el departamento de envío
+                allocate(order, lines, data["shipping_department"])
+        except ValidationError as e:
+            transaction.set_rollback(True)
+            return Response(
+                {"detail": e.messages[0]},
+                status=status.HTTP_400_BAD_REQUEST,
             )
-            variant.stock.reserve(item["quantity"])
+
+        # Libera la reserva apenas venza si no llega el pago
+        schedule_reservation_expiry(order)
 
     
 
@@ -173,7 +206,7 @@ class CheckoutView(APIView):
             reference=order.wompi_reference,
             amount_in_cents=amount_in_cents,
         )
-        acceptance_token = wompi.get_acceptance_token()
+        acceptance_token = acceptance.get_token()  # Desde caché, sin ir a Wompi
 
         response_data = {
             "order_id":        order.id,
@@ -199,6 +232,9 @@ class CheckoutView(APIView):
 class WompiWebhookView(APIView):
     """
     POST /api/payments/webhook/
+
+    Valida la firma, guarda el evento en PaymentEvent y responde de
+    inmediato; el pedido se actualiza en segundo plano (events.py).
     """
     permission_classes = [AllowAny]
 
@@ -228,90 +264,17 @@ class WompiWebhookView(APIView):
             logger.warning("Firma de webhook inválida. Payload: %s", payload)
             return Response({"detail": "Firma inválida."}, status=status.HTTP_401_UNAUTHORIZED)
 
-        if event == "transaction.updated":
-            self._handle_transaction_updated(transaction_data)
+        try:
+            timestamp = int(timestamp)
+        except ValueError:
+            return Response({"detail": "Payload inválido."}, status=status.HTTP_400_BAD_REQUEST)
+
+        # Se guarda y se procesa en payments.process_event; una entrega repetida se descarta
+        if record_event(event, transaction_data, timestamp, payload) is None:
+            logger.info("Webhook: evento repetido %s %s.", transaction_data.get("id"), transaction_data.get("status"))
 
         return Response({"status": "ok"}, status=status.HTTP_200_OK)
 
-    def _handle_transaction_updated(self, transaction_data: dict) -> None:
-        reference      = transaction_data.get("reference")
-        wompi_status   = transaction_data.get("status")
-        transaction_id = transaction_data.get("id")
-    
-        if not reference:
-            return
-    
-        try:
-            order = Order.objects.get(wompi_reference=reference)
-        except Order.DoesNotExist:
-            logger.error("Webhook: Order con referencia '%s' no encontrada.", reference)
-            return
-    
-        if transaction_id and not order.wompi_transaction_id:
-            order.wompi_transaction_id = transaction_id
-    
-        STATUS_MAP = {
-            "APPROVED": Order.Status.PAID,
-            "DECLINED": Order.Status.CANCELLED,
-            "VOIDED":   Order.Status.CANCELLED,
-            "ERROR":    Order.Status.CANCELLED,
-            "PENDING":  Order.Status.PAYMENT_PROCESSING,
-        }
-    
-        new_status = STATUS_MAP.get(wompi_status)
-        if new_status and order.status != new_status:
-            if new_status == Order.Status.PAID:
-                for item in order.items.select_related("variant__stock").all():
-                    item.variant.stock.confirm_sale(item.quantity)
-                if order.coupon_id:
-                    Coupon.objects.filter(pk=order.coupon_id).update(
-                        used_count=models.F('used_count') + 1
-                    )
-                send_order_paid_email.delay(str(order.id))
-            elif new_status == Order.Status.CANCELLED:
-                for item in order.items.select_related("variant__stock").all():
-                    item.variant.stock.release_reservation(item.quantity)
-    
-            order.status = new_status
-            order.save(update_fields=["status", "wompi_transaction_id", "updated_at"])
-            logger.info("Order %s → %s (Wompi: %s)", order.wompi_reference, new_status, wompi_status)
-            reference      = transaction_data.get("reference")
-            wompi_status   = transaction_data.get("status")
-            transaction_id = transaction_data.get("id")
-        
-            if not reference:
-                return
-        
-            try:
-                order = Order.objects.get(wompi_reference=reference)
-            except Order.DoesNotExist:
-                logger.error("Webhook: Order con referencia '%s' no encontrada.", reference)
-                return
-        
-            if transaction_id and not order.wompi_transaction_id:
-                order.wompi_transaction_id = transaction_id
-        
-            STATUS_MAP = {
-                "APPROVED": Order.Status.PAID,
-                "DECLINED": Order.Status.CANCELLED,
-                "VOIDED":   Order.Status.CANCELLED,
-                "ERROR":    Order.Status.CANCELLED,
-                "PENDING":  Order.Status.PAYMENT_PROCESSING,
-            }
-        
-            new_status = STATUS_MAP.get(wompi_status)
-            if new_status and order.status != new_status:
-                if new_status == Order.Status.PAID:
-                    for item in order.items.select_related("variant__stock").all():
-                        item.variant.stock.confirm_sale(item.quantity)
-                    send_order_paid_email.delay(str(order.id))  # ← solo aquí
-                elif new_status == Order.Status.CANCELLED:
-                    for item in order.items.select_related("variant__stock").all():
-                        item.variant.stock.release_reservation(item.quantity)
-        
-                order.status = new_status
-                order.save(update_fields=["status", "wompi_transaction_id", "updated_at"])
-                logger.info("Order %s → %s (Wompi: %s)", order.wompi_reference, new_status, wompi_status)
 
 class TransactionStatusView(APIView):
     """
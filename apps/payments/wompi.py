@@ -117,12 +117,18 @@ class WompiService:
 
     # ─── Devolucion wompi ─────────────────────────────────────────────
 
-    def refund_transaction(self, transaction_id: str, amount_in_cents: int) -> dict | None:
+    def refund_transaction(
+        self, transaction_id: str, amount_in_cents: int, idempotency_key: str | None = None
+    ) -> dict | None:
         endpoint = "void" if settings.WOMPI_SANDBOX else "refund"
+        headers = {"Authorization": f"Bearer {self.private_key}"}
+        if idempotency_key:
+            # Mismo key en los reintentos de un reembolso: Wompi no lo repite
+            headers["Idempotency-Key"] = idempotency_key
         try:
             response = requests.post(
                 f"{self.base_url}/transactions/{transaction_id}/{endpoint}",
-                headers={"Authorization": f"Bearer {self.private_key}"},
+                headers=headers,
                 json={"amount_in_cents": amount_in_cents},
                 timeout=10,
             )
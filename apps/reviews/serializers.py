@@ -1,7 +1,6 @@
 from rest_framework import serializers
 from .models import Review, ReviewImage
-from apps.orders.models import Order
-from django.db import models
+from apps.orders.customers import has_purchased
 
 class ReviewImageSerializer(serializers.ModelSerializer):
     class Meta:
@@ -38,12 +37,7 @@ class ReviewSerializer(serializers.ModelSerializer):
             )
 
         # Verificar compra — busca en órdenes de usuario registrado o invitado
-        verified = Order.objects.filter(
-            status__in=["SHIPPED", "DELIVERED", "PARTIALLY_REFUNDED"],
-            items__variant__product=product,
-        ).filter(
-            models.Q(user__email=email) | models.Q(guest_email=email)
-        ).exists()
+        verified = has_purchased(email, product.pk, ["SHIPPED", "DELIVERED", "PARTIALLY_REFUNDED"])
 
         if not verified:
             raise serializers.ValidationError(
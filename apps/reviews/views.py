@@ -3,10 +3,9 @@ from rest_framework.decorators import action
 from rest_framework.exceptions import PermissionDenied
 from rest_framework.response import Response
 from django_filters.rest_framework import DjangoFilterBackend
-from django.db import models as db_models
 from .models import Review
 from .serializers import ReviewSerializer
-from apps.orders.models import Order
+from apps.orders.customers import has_purchased
 
 
 class ReviewViewSet(
@@ -42,12 +41,7 @@ class ReviewViewSet(
                 status=status.HTTP_400_BAD_REQUEST,
             )
 
-        has_purchase = Order.objects.filter(
-            status__in=["SHIPPED", "DELIVERED", "PARTIALLY_REFUNDED"],
-            items__variant__product_id=product_id,
-        ).filter(
-            db_models.Q(user__email=email) | db_models.Q(guest_email=email)
-        ).exists()
+        has_purchase = has_purchased(email, product_id, ["SHIPPED", "DELIVERED", "PARTIALLY_REFUNDED"])
 
         if not has_purchase:
             return Response(
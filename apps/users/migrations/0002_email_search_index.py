@@ -0,0 +1,30 @@
+# Generated by Django 6.0.2 on 2026-10-19 00:52
+
+from django.db import migrations
+
+
+def create_email_index(apps, schema_editor):
+    """Prefijo de lower(email) indexado para la búsqueda de pedidos (solo PostgreSQL)."""
+    if schema_editor.connection.vendor != "postgresql":
+        return
+    schema_editor.execute(
+        "CREATE INDEX IF NOT EXISTS users_email_prefix_idx "
+        "ON users_users (lower(email) text_pattern_ops)"
+    )
+
+
+def drop_email_index(apps, schema_editor):
+    if schema_editor.connection.vendor != "postgresql":
+        return
+    schema_editor.execute("DROP INDEX IF EXISTS users_email_prefix_idx")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("users", "0001_initial"),
+    ]
+
+    operations = [
+        migrations.RunPython(create_email_index, drop_email_index),
+    ]
@@ -3,6 +3,10 @@ ASGI config for backTiendaMaquillaje project.
 
 It exposes the ASGI callable as a module-level variable named ``application``.
 
+Sirve también el stream SSE de disponibilidad (/api/inventory/stream/):
+en producción correr con un servidor ASGI, ej:
+    uvicorn backTiendaMaquillaje.asgi:application --workers 4
+
 For more information on this file, see
 https://docs.djangoproject.com/en/5.1/howto/deployment/asgi/
 """
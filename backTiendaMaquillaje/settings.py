@@ -40,6 +40,7 @@ DJANGO_APPS = [
     "django.contrib.sessions",
     "django.contrib.messages",
     "django.contrib.staticfiles",
+    "django.contrib.postgres",   # Lookups de trigramas para la búsqueda de pedidos
 ]
 
 THIRD_PARTY_APPS = [
@@ -249,6 +250,10 @@ WOMPI_BASE_URL = (
     else "https://production.wompi.co/v1"
 )
 
+# acceptance_token en caché: fresco por TTL, servible (stale) hasta MAX_AGE
+WOMPI_ACCEPTANCE_TOKEN_TTL     = env.int("WOMPI_ACCEPTANCE_TOKEN_TTL", default=60 * 30)
+WOMPI_ACCEPTANCE_TOKEN_MAX_AGE = env.int("WOMPI_ACCEPTANCE_TOKEN_MAX_AGE", default=60 * 60 * 24)
+
 
 # ─────────────────────────────────────────────
 # Cache (Redis)
@@ -260,6 +265,33 @@ CACHES = {
     }
 }
 
+# Respuestas de analytics en caché; se invalidan por día al cambiar pedidos
+ANALYTICS_CACHE_TIMEOUT = env.int("ANALYTICS_CACHE_TIMEOUT", default=60 * 60 * 24)
+
+# Caché columnar (.npy) para pivots ad-hoc de ventas
+ANALYTICS_COLUMNAR_DIR = env("ANALYTICS_COLUMNAR_DIR", default=str(BASE_DIR / "var" / "pivot"))
+
+# Pedidos cerrados sin cambios en este plazo pasan a las tablas de archivo
+ORDER_ARCHIVE_AFTER_DAYS = env.int("ORDER_ARCHIVE_AFTER_DAYS", default=365)
+ORDER_ARCHIVE_BATCH_SIZE = env.int("ORDER_ARCHIVE_BATCH_SIZE", default=500)
+
+# Aprobación de reembolsos en bloque: llamadas simultáneas a Wompi y reembolsos por transacción
+REFUND_BATCH_CONCURRENCY = env.int("REFUND_BATCH_CONCURRENCY", default=4)
+REFUND_BATCH_CHUNK_SIZE  = env.int("REFUND_BATCH_CHUNK_SIZE", default=20)
+# Un reembolso en PROCESSING más tiempo que esto se reencola (worker caído)
+REFUND_PROCESSING_GRACE_MINUTES = env.int("REFUND_PROCESSING_GRACE_MINUTES", default=15)
+
+
+# ─────────────────────────────────────────────
+# Inventario en Redis (variantes hot / flash sales)
+# ─────────────────────────────────────────────
+INVENTORY_REDIS_URL = env("INVENTORY_REDIS_URL", default="redis://127.0.0.1:6379/2")
+
+# Pronóstico de demanda y sugerencia de reabastecimiento
+INVENTORY_LEAD_TIME_DAYS   = env.int("INVENTORY_LEAD_TIME_DAYS", default=7)    # Días que tarda el proveedor
+INVENTORY_REVIEW_DAYS      = env.int("INVENTORY_REVIEW_DAYS", default=30)      # Cobertura a comprar por pedido
+INVENTORY_SERVICE_LEVEL_Z  = env.float("INVENTORY_SERVICE_LEVEL_Z", default=1.65)  # ~95% de nivel de servicio
+
 
 # ─────────────────────────────────────────────
 # Celery (tareas asíncronas: emails, Wompi webhooks, etc.)
@@ -342,7 +374,47 @@ from celery.schedules import crontab
 CELERY_BEAT_SCHEDULE = {
     "release-expired-reservations": {
         "task": "orders.release_expired_reservations",
-        "schedule": crontab(minute="*/15"),  # Cada 15 minutos
+        "schedule": crontab(minute="*"),  # Respaldo: cada pedido se programa con countdown
+    },
+    "reconcile-hot-stock": {
+        "task": "inventory.reconcile_hot_stock",
+        "schedule": crontab(minute="*"),  # Cada minuto
+    },
+    "snapshot-stock": {
+        "task": "inventory.snapshot_stock",
+        "schedule": crontab(hour=0, minute=5),  # Diario, inicio del día
+    },
+    "forecast-demand": {
+        "task": "inventory.forecast_demand",
+        "schedule": crontab(hour=1, minute=0),  # Diario, con las ventas del día cerrado
+    },
+    "repair-reserved": {
+        "task": "inventory.repair_reserved",
+        "schedule": crontab(hour=3, minute=30),  # Diario, madrugada
+    },
+    "refresh-pivot": {
+        "task": "orders.refresh_pivot",
+        "schedule": crontab(minute="*/10"),  # Solo reconstruye los meses modificados
+    },
+    "score-customers": {
+        "task": "orders.score_customers",
+        "schedule": crontab(hour=2, minute=0),  # Diario, madrugada
+    },
+    "archive-orders": {
+        "task": "orders.archive_orders",
+        "schedule": crontab(hour=4, minute=0),  # Diario, madrugada
+    },
+    "requeue-stuck-refunds": {
+        "task": "orders.requeue_stuck_refunds",
+        "schedule": crontab(minute="*/10"),
+    },
+    "process-pending-payment-events": {
+        "task": "payments.process_pending_events",
+        "schedule": crontab(minute="*/5"),  # Respaldo: cada evento se encola al recibirlo
+    },
+    "refresh-acceptance-token": {
+        "task": "payments.refresh_acceptance_token",
+        "schedule": crontab(minute="*/15"),  # Antes de que venza WOMPI_ACCEPTANCE_TOKEN_TTL
     },
 }
 
@@ -0,0 +1,73 @@
+"""
+Respuestas parciales para serializers DRF.
+
+  ?fields=id,name,variants.sku   → solo esos campos (punto para anidados;
+                                   pedir "variants" trae el anidado completo)
+  ?expand=items.variant          → reemplaza un campo por su forma expandida
+                                   (Meta.expandable_fields)
+
+Solo aplica a lecturas (GET/HEAD/OPTIONS). Las vistas pueden usar
+common.views.SparseQuerysetMixin para no hacer select/prefetch de campos
+que no se pidieron.
+"""
+from __future__ import annotations
+
+from django.utils.module_loading import import_string
+from rest_framework.permissions import SAFE_METHODS
+
+
+def _split(value: str | None) -> set[str]:
+    return {part.strip() for part in (value or "").split(",") if part.strip()}
+
+
+def sparse_params(request) -> tuple[set[str] | None, set[str]]:
+    """(campos pedidos o None = todos, campos a expandir) del request."""
+    if request is None or request.method not in SAFE_METHODS:
+        return None, set()
+    fields = request.query_params.get("fields")
+    return (_split(fields) if fields else None), _split(request.query_params.get("expand"))
+
+
+def is_requested(path: str, fields: set[str] | None) -> bool:
+    """Si el campo `path` (ej: "variants.sku") entra en la respuesta."""
+    if fields is None:
+        return True
+    return any(
+        f == path or f.startswith(path + ".") or path.startswith(f + ".")
+        for f in fields
+    )
+
+
+class SparseFieldsMixin:
+    """
+    Mixin para ModelSerializer que respeta ?fields= y ?expand=.
+
+    Meta.expandable_fields = {"variant": ("apps.catalog.serializers.VariantReadSerializer", {})}
+    Los serializers anidados también deben usar el mixin para podarse.
+    """
+
+    def _sparse_prefix(self) -> str:
+        parts, node = [], self
+        while node.parent is not None:
+            if node.field_name:  # El hijo de un ListSerializer no tiene nombre
+                parts.append(node.field_name)
+            node = node.parent
+        return "".join(f"{part}." for part in reversed(parts))
+
+    def get_fields(self):
+        fields = super().get_fields()
+        requested, expand = sparse_params(self.context.get("request"))
+        if requested is None and not expand:
+            return fields
+
+        prefix = self._sparse_prefix()
+        for name, (serializer_path, kwargs) in getattr(self.Meta, "expandable_fields", {}).items():
+            if prefix + name in expand:
+                serializer_class = import_string(serializer_path)
+                fields[name] = serializer_class(read_only=True, **kwargs)
+
+        if requested is not None:
+            for name in list(fields):
+                if not is_requested(prefix + name, requested):
+                    del fields[name]
+        return fields
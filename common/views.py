@@ -0,0 +1,45 @@
+"""
+Mixins de vistas compartidos entre apps.
+"""
+from __future__ import annotations
+
+from .serializers import is_requested, sparse_params
+
+
+class SparseQuerysetMixin:
+    """
+    Agrega select_related/prefetch_related solo para los campos que la
+    respuesta va a incluir (ver common.serializers.SparseFieldsMixin).
+
+    field_select_related / field_prefetch: {ruta del campo: [lookups]}
+    expand_prefetch: {ruta expandible: [lookups]}, solo con ?expand=
+    """
+    field_select_related: dict[str, list[str]] = {}
+    field_prefetch: dict[str, list[str]] = {}
+    expand_prefetch: dict[str, list[str]] = {}
+
+    def get_queryset(self):
+        return self.apply_sparse(super().get_queryset())
+
+    def apply_sparse(self, queryset):
+        requested, expand = sparse_params(self.request)
+        select = [
+            lookup
+            for path, lookups in self.field_select_related.items() if is_requested(path, requested)
+            for lookup in lookups
+        ]
+        prefetch = [
+            lookup
+            for path, lookups in self.field_prefetch.items() if is_requested(path, requested)
+            for lookup in lookups
+        ] + [
+            lookup
+            for path, lookups in self.expand_prefetch.items()
+            if path in expand and is_requested(path, requested)
+            for lookup in lookups
+        ]
+        if select:
+            queryset = queryset.select_related(*select)
+        if prefetch:
+            queryset = queryset.prefetch_related(*prefetch)
+        return queryset